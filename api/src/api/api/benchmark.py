@@ -0,0 +1,97 @@
+import sys
+import tempfile
+import time
+
+from typing import Callable
+
+from psycopg import Connection
+from psycopg.pq import Trace
+
+from api.data.leg import select_legs
+from api.utils.database import (
+    DbConnection,
+    DbConnectionData,
+    load_composite_types,
+)
+from api.utils.interactive import information, message
+
+default_repeats = 20
+
+
+def count_round_trips(conn: Connection, fn: Callable[[], object]) -> int:
+    """
+    Count the round trips to the server while running a function, from the
+    messages libpq traces; every round trip ends with the server saying it is
+    ready for the next query
+    """
+    with tempfile.TemporaryFile("w+") as trace:
+        conn.pgconn.trace(trace.fileno())
+        conn.pgconn.set_trace_flags(Trace.SUPPRESS_TIMESTAMPS)
+        try:
+            fn()
+        finally:
+            conn.pgconn.untrace()
+        trace.seek(0)
+        return sum(1 for line in trace if "ReadyForQuery" in line)
+
+
+def connect_and_load_composite_types(conninfo: str) -> Connection:
+    # The pool loads the composite types when it opens a connection, before
+    # any request uses it
+    conn = Connection.connect(conninfo)
+    load_composite_types(conn)
+    return conn
+
+
+def time_select_legs(
+    get_connection: Callable[[], Connection], user_id: int, repeats: int
+) -> tuple[int, float]:
+    """
+    Select a user's legs the way /users/{id}/train/legs does, each time on a
+    fresh connection so no composite types are left over from the last time
+    """
+    round_trips = 0
+    elapsed = 0.0
+    for _ in range(repeats):
+        conn = get_connection()
+        try:
+            start = time.perf_counter()
+            round_trips = round_trips + count_round_trips(
+                conn, lambda: select_legs(conn, user_id)
+            )
+            elapsed = elapsed + time.perf_counter() - start
+        finally:
+            conn.close()
+    return (round_trips // repeats, elapsed / repeats)
+
+
+def compare_composite_type_loading(user_id: int, repeats: int):
+    """
+    Compare selecting legs on a connection that fetches each composite type
+    as it is registered with one that loaded them all when it was opened
+    """
+    conninfo = DbConnection(
+        DbConnectionData(None, None, None, None)
+    ).get_conninfo()
+    information(f"Selecting legs for user {user_id} {repeats} times")
+    (fetched_round_trips, fetched_time) = time_select_legs(
+        lambda: Connection.connect(conninfo), user_id, repeats
+    )
+    (loaded_round_trips, loaded_time) = time_select_legs(
+        lambda: connect_and_load_composite_types(conninfo), user_id, repeats
+    )
+    message(
+        f"fetched on use: {fetched_round_trips} round trips, "
+        f"{fetched_time * 1000:.1f} ms"
+    )
+    message(
+        f"loaded on connect: {loaded_round_trips} round trips, "
+        f"{loaded_time * 1000:.1f} ms"
+    )
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        raise RuntimeError("No user id specified")
+    repeats = int(sys.argv[2]) if len(sys.argv) > 2 else default_repeats
+    compare_composite_type_loading(int(sys.argv[1]), repeats)
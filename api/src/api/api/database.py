@@ -0,0 +1,31 @@
+from typing import Annotated, AsyncIterator, Iterator
+
+from fastapi import Depends, Request
+from psycopg import AsyncConnection, Connection
+from psycopg_pool import AsyncConnectionPool, ConnectionPool
+
+
+def get_pool(request: Request) -> ConnectionPool:
+    return request.app.state.pool
+
+
+def get_async_pool(request: Request) -> AsyncConnectionPool:
+    return request.app.state.async_pool
+
+
+def get_db_connection(request: Request) -> Iterator[Connection]:
+    with get_pool(request).connection() as conn:
+        yield conn
+
+
+async def get_async_db_connection(
+    request: Request,
+) -> AsyncIterator[AsyncConnection]:
+    async with get_async_pool(request).connection() as conn:
+        yield conn
+
+
+DbConnectionDep = Annotated[Connection, Depends(get_db_connection)]
+AsyncDbConnectionDep = Annotated[
+    AsyncConnection, Depends(get_async_db_connection)
+]
@@ -1,12 +1,40 @@
 from api.api.routers.utils import utils
 import uvicorn
 
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request
 
+from api.api.database import get_async_pool, get_pool
+from api.api.mapcache import map_cache
 from api.api.routers.users import user
+from api.api.workers import network_workers
+from api.utils.database import (
+    create_async_connection_pool_with_env,
+    create_connection_pool_with_env,
+    get_connection_pool_stats,
+)
 from api.utils.environment import get_env_variable
 
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    pool = create_connection_pool_with_env()
+    async_pool = create_async_connection_pool_with_env()
+    pool.open()
+    await async_pool.open()
+    app.state.pool = pool
+    app.state.async_pool = async_pool
+    try:
+        yield
+    finally:
+        await async_pool.close()
+        pool.close()
+        network_workers.shutdown()
+        map_cache.close()
+
+
 app = FastAPI(
+    lifespan=lifespan,
     title="Train tracker API",
     summary="API for interacting with the train tracker",
     version="1.0.0",
@@ -27,6 +55,30 @@ async def get_healthcheck():
     return "Hello!"
 
 
+@app.get("/hc/db", summary="Database pool statistics", tags=["debug"])
+async def get_database_healthcheck(
+    request: Request,
+) -> dict[str, dict[str, int | float]]:
+    return {
+        "sync": get_connection_pool_stats(get_pool(request)),
+        "async": get_connection_pool_stats(get_async_pool(request)),
+    }
+
+
+@app.get("/hc/map", summary="Map cache statistics", tags=["debug"])
+def get_map_cache_healthcheck() -> dict[str, int | float]:
+    stats = map_cache.get_stats()
+    return {
+        "memory_hits": stats.memory_hits,
+        "disk_hits": stats.disk_hits,
+        "misses": stats.misses,
+        "not_modified": stats.not_modified,
+        "hit_rate": stats.hit_rate(),
+        "memory_entries": stats.memory_entries,
+        "memory_size": stats.memory_size,
+    }
+
+
 app.include_router(user.router)
 app.include_router(utils.router)
 
@@ -0,0 +1,251 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import zlib
+
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import Optional
+
+from api.network.map import MarkerTextType
+from api.utils.environment import get_env_number_variable, get_env_variable
+
+# Rendered maps are kept in memory up to this many megabytes
+map_cache_memory_bytes = int(
+    get_env_number_variable("MAP_CACHE_MAX_MB", 64) * 1024 * 1024
+)
+
+# Rendered maps are also kept in this sqlite database if it is set, up to this
+# many megabytes
+map_cache_path = get_env_variable("MAP_CACHE_PATH")
+map_cache_disk_bytes = int(
+    get_env_number_variable("MAP_CACHE_DISK_MAX_MB", 512) * 1024 * 1024
+)
+
+# Bump this when maps are drawn differently, so maps drawn the old way are
+# never served from the database
+map_format_version = 1
+
+
+def get_map_cache_key(
+    network_stamp: str,
+    user_id: int,
+    leg_version: int,
+    text_type: MarkerTextType,
+    search_start: Optional[datetime],
+    search_end: Optional[datetime],
+    search_leg_id: Optional[int],
+) -> str:
+    """
+    Every map of a user's legs is keyed by the version of their legs, so adding
+    a leg means none of their maps drawn before it are used again
+    """
+    return "|".join(
+        [
+            str(map_format_version),
+            network_stamp,
+            str(user_id),
+            str(leg_version),
+            repr(text_type),
+            repr(search_start),
+            repr(search_end),
+            repr(search_leg_id),
+        ]
+    )
+
+
+def get_map_etag(key: str) -> str:
+    # The same map is not drawn byte for byte the same each time, so the tag
+    # is weak
+    return f'W/"{hashlib.sha256(key.encode()).hexdigest()[:32]}"'
+
+
+def is_etag_matched(etag: str, if_none_match: Optional[str]) -> bool:
+    if if_none_match is None:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in tags or any(
+        tag.removeprefix("W/") == etag.removeprefix("W/") for tag in tags
+    )
+
+
+@dataclass
+class MapCacheStats:
+    memory_hits: int
+    disk_hits: int
+    misses: int
+    not_modified: int
+    memory_entries: int
+    memory_size: int
+
+    def hit_rate(self) -> float:
+        requests = (
+            self.memory_hits + self.disk_hits + self.misses + self.not_modified
+        )
+        if requests == 0:
+            return 0.0
+        return (requests - self.misses) / requests
+
+
+class MapCache:
+    """
+    Rendered map pages, kept in memory with the least recently used evicted
+    first, and optionally in a sqlite database so they survive restarts
+    """
+
+    def __init__(
+        self,
+        memory_bytes: int,
+        disk_path: Optional[Path | str] = None,
+        disk_bytes: int = map_cache_disk_bytes,
+    ):
+        self.memory_bytes = memory_bytes
+        self.memory: OrderedDict[str, str] = OrderedDict()
+        self.memory_size = 0
+        self.disk_path = disk_path
+        self.disk_bytes = disk_bytes
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.not_modified = 0
+        self.lock = threading.Lock()
+        self.conn: Optional[sqlite3.Connection] = None
+        self.pid: Optional[int] = None
+        if self.disk_path is not None:
+            with self.lock, self.get_connection() as conn:
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute(
+                    """
+                    CREATE TABLE IF NOT EXISTS MapPage (
+                        map_key TEXT PRIMARY KEY,
+                        user_id INTEGER NOT NULL,
+                        leg_version INTEGER NOT NULL,
+                        body BLOB NOT NULL,
+                        size INTEGER NOT NULL,
+                        accessed_at REAL NOT NULL
+                    )
+                    """
+                )
+                conn.execute(
+                    """
+                    CREATE INDEX IF NOT EXISTS MapPageUser
+                    ON MapPage (user_id, leg_version)
+                    """
+                )
+
+    def get_connection(self) -> sqlite3.Connection:
+        # A sqlite connection cannot be used by a process forked from the one
+        # that opened it, so each worker process opens its own
+        if self.conn is None or self.pid != os.getpid():
+            self.conn = sqlite3.connect(
+                self.disk_path or ":memory:", check_same_thread=False
+            )
+            self.pid = os.getpid()
+        return self.conn
+
+    def put_in_memory(self, key: str, html: str):
+        if key in self.memory:
+            self.memory_size = self.memory_size - len(self.memory.pop(key))
+        self.memory[key] = html
+        self.memory_size = self.memory_size + len(html)
+        while self.memory_size > self.memory_bytes and len(self.memory) > 0:
+            (_, evicted) = self.memory.popitem(last=False)
+            self.memory_size = self.memory_size - len(evicted)
+
+    def get_page(self, key: str) -> Optional[str]:
+        with self.lock:
+            html = self.memory.get(key)
+            if html is not None:
+                self.memory.move_to_end(key)
+                self.memory_hits = self.memory_hits + 1
+                return html
+            if self.disk_path is not None:
+                with self.get_connection() as conn:
+                    row = conn.execute(
+                        "SELECT body FROM MapPage WHERE map_key = ?", (key,)
+                    ).fetchone()
+                    if row is not None:
+                        conn.execute(
+                            """
+                            UPDATE MapPage SET accessed_at = ?
+                            WHERE map_key = ?
+                            """,
+                            (time.time(), key),
+                        )
+                if row is not None:
+                    html = zlib.decompress(row[0]).decode()
+                    self.put_in_memory(key, html)
+                    self.disk_hits = self.disk_hits + 1
+                    return html
+            self.misses = self.misses + 1
+            return None
+
+    def put_page(self, key: str, user_id: int, leg_version: int, html: str):
+        with self.lock:
+            self.put_in_memory(key, html)
+            if self.disk_path is None:
+                return
+            body = zlib.compress(html.encode())
+            with self.get_connection() as conn:
+                # Maps of older versions of the user's legs are never used again
+                conn.execute(
+                    """
+                    DELETE FROM MapPage
+                    WHERE user_id = ? AND leg_version < ?
+                    """,
+                    (user_id, leg_version),
+                )
+                conn.execute(
+                    """
+                    INSERT OR REPLACE INTO MapPage
+                    (map_key, user_id, leg_version, body, size, accessed_at)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                    """,
+                    (key, user_id, leg_version, body, len(body), time.time()),
+                )
+                self.evict_from_disk(conn)
+
+    def evict_from_disk(self, conn: sqlite3.Connection):
+        (size,) = conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM MapPage"
+        ).fetchone()
+        if size <= self.disk_bytes:
+            return
+        rows = conn.execute(
+            "SELECT map_key, size FROM MapPage ORDER BY accessed_at"
+        )
+        evicted = []
+        for (key, entry_size) in rows:
+            if size <= self.disk_bytes:
+                break
+            evicted.append((key,))
+            size = size - entry_size
+        conn.executemany("DELETE FROM MapPage WHERE map_key = ?", evicted)
+
+    def record_not_modified(self):
+        with self.lock:
+            self.not_modified = self.not_modified + 1
+
+    def get_stats(self) -> MapCacheStats:
+        with self.lock:
+            return MapCacheStats(
+                self.memory_hits,
+                self.disk_hits,
+                self.misses,
+                self.not_modified,
+                len(self.memory),
+                self.memory_size,
+            )
+
+    def close(self):
+        with self.lock:
+            if self.conn is not None and self.pid == os.getpid():
+                self.conn.close()
+            self.conn = None
+
+
+map_cache = MapCache(map_cache_memory_bytes, map_cache_path)
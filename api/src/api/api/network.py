@@ -1,7 +1,27 @@
-import osmnx as ox
-
+from api.network.cache import (
+    RouteCache,
+    get_network_file_hash,
+    get_network_file_stamp,
+    set_route_cache,
+)
+from api.network.pathfinding import Network
+from api.network.routing import load_network
 from api.utils.environment import get_env_variable
 
 network_path = get_env_variable("NETWORK_PATH")
+if network_path is None:
+    raise RuntimeError("NETWORK_PATH must be set")
+routing_engine = get_env_variable("ROUTING_ENGINE") or "arrays"
 print(f"Loading network from {network_path}")
-network = ox.load_graphml(network_path)
+network: Network = load_network(network_path, routing_engine)
+
+# Maps drawn on a network are only reused while the same network is loaded
+network_stamp = get_network_file_stamp(network_path)
+
+route_cache_path = get_env_variable("ROUTE_CACHE_PATH")
+if route_cache_path is not None:
+    print(f"Using route cache at {route_cache_path}")
+    set_route_cache(
+        network,
+        RouteCache(route_cache_path, get_network_file_hash(network_path)),
+    )
@@ -4,7 +4,7 @@ from api.data.bus.user.stop import (
     get_user_details_for_bus_stop_by_atco,
     get_user_details_for_bus_stops,
 )
-from api.utils.database import connect_with_env
+from api.api.database import DbConnectionDep
 from fastapi import APIRouter, HTTPException
 
 
@@ -12,27 +12,30 @@ router = APIRouter(prefix="/stops", tags=["users/bus/stops"])
 
 
 @router.get("/", summary="Get details of all bus stop for a user")
-async def get_bus_stops(user_id: int) -> list[BusStopUserDetails]:
-    with connect_with_env() as conn:
-        stop = get_user_details_for_bus_stops(conn, user_id)
-        if stop is None:
-            raise HTTPException(404, "Could not find user")
-        return stop
+def get_bus_stops(
+    conn: DbConnectionDep, user_id: int
+) -> list[BusStopUserDetails]:
+    stop = get_user_details_for_bus_stops(conn, user_id)
+    if stop is None:
+        raise HTTPException(404, "Could not find user")
+    return stop
 
 
 @router.get("/{stop_id}", summary="Get details of a bus stop for a user")
-async def get_bus_stop(user_id: int, stop_id: int) -> BusStopUserDetails:
-    with connect_with_env() as conn:
-        stop = get_user_details_for_bus_stop(conn, user_id, stop_id)
-        if stop is None:
-            raise HTTPException(404, "Could not find user or stop")
-        return stop
+def get_bus_stop(
+    conn: DbConnectionDep, user_id: int, stop_id: int
+) -> BusStopUserDetails:
+    stop = get_user_details_for_bus_stop(conn, user_id, stop_id)
+    if stop is None:
+        raise HTTPException(404, "Could not find user or stop")
+    return stop
 
 
 @router.get("/atco/{atco}", summary="Get details of a bus stop for a user")
-async def get_bus_stop_by_atco(user_id: int, atco: str) -> BusStopUserDetails:
-    with connect_with_env() as conn:
-        stop = get_user_details_for_bus_stop_by_atco(conn, user_id, atco)
-        if stop is None:
-            raise HTTPException(404, "Could not find user or stop")
-        return stop
+def get_bus_stop_by_atco(
+    conn: DbConnectionDep, user_id: int, atco: str
+) -> BusStopUserDetails:
+    stop = get_user_details_for_bus_stop_by_atco(conn, user_id, atco)
+    if stop is None:
+        raise HTTPException(404, "Could not find user or stop")
+    return stop
@@ -1,66 +1,81 @@
 from datetime import datetime
 from typing import Optional
 from fastapi import APIRouter, HTTPException
+from psycopg import AsyncConnection
 
-from api.data.leg import select_legs
-from api.utils.database import connect_with_env
+from api.data.leg import ShortLeg, select_legs_async
+from api.data.points import get_station_points_from_crses_async
+from api.api.database import AsyncDbConnectionDep
+from api.api.workers import run_in_network_worker
 
 from api.api.network import network
 from api.network.map import (
     ShortLegWithGeometry,
-    get_short_legs_with_geometries,
+    get_short_legs_with_geometries_from_station_points,
+    get_stations_for_legs,
     short_legs_to_short_legs_with_geometries,
 )
 
 router = APIRouter(prefix="/legs", tags=["users/train/legs"])
 
 
+async def get_legs_with_geometries(
+    conn: AsyncConnection, legs: list[ShortLeg], fetch_geometries: bool
+) -> list[ShortLegWithGeometry]:
+    if not fetch_geometries:
+        return short_legs_to_short_legs_with_geometries(legs)
+    station_points = await get_station_points_from_crses_async(
+        conn, get_stations_for_legs(legs)
+    )
+    return await run_in_network_worker(
+        get_short_legs_with_geometries_from_station_points,
+        network,
+        legs,
+        station_points,
+    )
+
+
 @router.get("", summary="Get train legs across a time period")
 async def get_legs(
+    conn: AsyncDbConnectionDep,
     user_id: int,
     start_date: Optional[datetime] = None,
     end_date: Optional[datetime] = None,
     fetch_geometries: bool = False,
 ) -> list[ShortLegWithGeometry]:
-    with connect_with_env() as conn:
-        legs = select_legs(
-            conn, user_id, search_start=start_date, search_end=end_date
-        )
-        if fetch_geometries:
-            legs = get_short_legs_with_geometries(conn, network, legs)
-        else:
-            legs = short_legs_to_short_legs_with_geometries(legs)
-        return legs
+    legs = await select_legs_async(
+        conn, user_id, search_start=start_date, search_end=end_date
+    )
+    return await get_legs_with_geometries(conn, legs, fetch_geometries)
 
 
 @router.get("/years/{year}", summary="Get train legs across a year")
 async def get_legs_from_year(
-    user_id: int, year: int, fetch_geometries: bool = False
+    conn: AsyncDbConnectionDep,
+    user_id: int,
+    year: int,
+    fetch_geometries: bool = False,
 ) -> list[ShortLegWithGeometry]:
-    with connect_with_env() as conn:
-        legs = select_legs(
-            conn,
-            user_id,
-            search_start=datetime(year, 1, 1),
-            search_end=datetime(year, 12, 31),
-        )
-        if fetch_geometries:
-            legs = get_short_legs_with_geometries(conn, network, legs)
-        else:
-            legs = short_legs_to_short_legs_with_geometries(legs)
-        return legs
+    legs = await select_legs_async(
+        conn,
+        user_id,
+        search_start=datetime(year, 1, 1),
+        search_end=datetime(year, 12, 31),
+    )
+    return await get_legs_with_geometries(conn, legs, fetch_geometries)
 
 
 @router.get("/{leg_id}", summary="Get particular train leg")
 async def get_leg(
-    user_id: int, leg_id: int, fetch_geometries: bool = False
+    conn: AsyncDbConnectionDep,
+    user_id: int,
+    leg_id: int,
+    fetch_geometries: bool = False,
 ) -> ShortLegWithGeometry:
-    with connect_with_env() as conn:
-        legs = select_legs(conn, user_id, search_leg_id=leg_id)
-        if fetch_geometries:
-            legs = get_short_legs_with_geometries(conn, network, legs)
-        else:
-            legs = short_legs_to_short_legs_with_geometries(legs)
-        if len(legs) != 1:
-            raise HTTPException(status_code=404, detail="Leg not found")
-        return legs[0]
+    legs = await select_legs_async(conn, user_id, search_leg_id=leg_id)
+    legs_with_geometries = await get_legs_with_geometries(
+        conn, legs, fetch_geometries
+    )
+    if len(legs_with_geometries) != 1:
+        raise HTTPException(status_code=404, detail="Leg not found")
+    return legs_with_geometries[0]
@@ -1,36 +1,112 @@
+import asyncio
+
 from datetime import datetime
 from typing import Optional
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Request, Response
 from fastapi.responses import HTMLResponse
+from psycopg import AsyncConnection
 
-from api.utils.database import connect_with_env
+from api.api.database import AsyncDbConnectionDep
+from api.api.mapcache import (
+    get_map_cache_key,
+    get_map_etag,
+    is_etag_matched,
+    map_cache,
+)
+from api.api.workers import run_in_network_worker
+from api.data.leg import select_leg_version_async, select_legs_async
+from api.data.points import get_station_points_from_crses_async
 from api.network.map import (
     CallInfo,
+    MarkerTextType,
     StationInfo,
-    get_leg_map_page,
+    get_leg_map_page_from_legs,
+    get_stations_for_legs,
 )
-from api.api.network import network
+from api.api.network import network, network_stamp
 
 router = APIRouter(prefix="/map", tags=["users/train/map"])
 
 
+async def get_leg_map_page_async(
+    conn: AsyncConnection,
+    user_id: int,
+    text_type: MarkerTextType,
+    search_start: Optional[datetime] = None,
+    search_end: Optional[datetime] = None,
+    search_leg_id: Optional[int] = None,
+) -> str:
+    legs = await select_legs_async(
+        conn, user_id, search_start, search_end, search_leg_id
+    )
+    station_points = await get_station_points_from_crses_async(
+        conn, get_stations_for_legs(legs)
+    )
+    return await run_in_network_worker(
+        get_leg_map_page_from_legs, network, legs, station_points, text_type
+    )
+
+
+async def get_cached_leg_map_response(
+    request: Request,
+    conn: AsyncConnection,
+    user_id: int,
+    text_type: MarkerTextType,
+    search_start: Optional[datetime] = None,
+    search_end: Optional[datetime] = None,
+    search_leg_id: Optional[int] = None,
+) -> Response:
+    """
+    A map is only drawn again once the user has added a leg since it was last
+    drawn, and is not sent again to a client that already has it
+
+    The cache reads and writes sqlite and compresses pages, so it is used from
+    a thread rather than on the event loop
+    """
+    leg_version = await select_leg_version_async(conn, user_id)
+    key = get_map_cache_key(
+        network_stamp,
+        user_id,
+        leg_version,
+        text_type,
+        search_start,
+        search_end,
+        search_leg_id,
+    )
+    etag = get_map_etag(key)
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if is_etag_matched(etag, request.headers.get("If-None-Match")):
+        await asyncio.to_thread(map_cache.record_not_modified)
+        return Response(status_code=304, headers=headers)
+    html = await asyncio.to_thread(map_cache.get_page, key)
+    if html is None:
+        html = await get_leg_map_page_async(
+            conn, user_id, text_type, search_start, search_end, search_leg_id
+        )
+        await asyncio.to_thread(
+            map_cache.put_page, key, user_id, leg_version, html
+        )
+    return HTMLResponse(html, headers=headers)
+
+
 @router.get(
     "",
     summary="Get map of train legs across a time period",
     response_class=HTMLResponse,
 )
 async def get_train_map_from_time_period(
+    request: Request,
+    conn: AsyncDbConnectionDep,
     user_id: int,
     start_date: Optional[datetime] = None,
     end_date: Optional[datetime] = None,
-) -> str:
-    with connect_with_env() as conn:
-        try:
-            return get_leg_map_page(
-                network, conn, user_id, StationInfo(True), start_date, end_date
-            )
-        except RuntimeError:
-            raise HTTPException(500, "Could not get stats")
+) -> Response:
+    try:
+        return await get_cached_leg_map_response(
+            request, conn, user_id, StationInfo(True), start_date, end_date
+        )
+    except RuntimeError:
+        raise HTTPException(500, "Could not get stats")
 
 
 @router.get(
@@ -38,19 +114,20 @@ async def get_train_map_from_time_period(
     summary="Get map of train legs across a year",
     response_class=HTMLResponse,
 )
-async def get_train_map_from_year(user_id: int, year: int) -> str:
-    with connect_with_env() as conn:
-        try:
-            return get_leg_map_page(
-                network,
-                conn,
-                user_id,
-                StationInfo(True),
-                datetime(year, 1, 1),
-                datetime(year, 12, 31),
-            )
-        except RuntimeError:
-            raise HTTPException(500, "Could not get stats")
+async def get_train_map_from_year(
+    request: Request, conn: AsyncDbConnectionDep, user_id: int, year: int
+) -> Response:
+    try:
+        return await get_cached_leg_map_response(
+            request,
+            conn,
+            user_id,
+            StationInfo(True),
+            datetime(year, 1, 1),
+            datetime(year, 12, 31),
+        )
+    except RuntimeError:
+        raise HTTPException(500, "Could not get stats")
 
 
 @router.get(
@@ -58,8 +135,9 @@ async def get_train_map_from_year(user_id: int, year: int) -> str:
     summary="Get a map for a particular train leg",
     response_class=HTMLResponse,
 )
-async def get_leg_map_for_leg_id(user_id: int, leg_id: int) -> str:
-    with connect_with_env() as conn:
-        return get_leg_map_page(
-            network, conn, user_id, CallInfo(), search_leg_id=leg_id
-        )
+async def get_leg_map_for_leg_id(
+    request: Request, conn: AsyncDbConnectionDep, user_id: int, leg_id: int
+) -> Response:
+    return await get_cached_leg_map_response(
+        request, conn, user_id, CallInfo(), search_leg_id=leg_id
+    )
@@ -1,5 +1,9 @@
-from api.data.stations import StationData, select_station, select_stations
-from api.utils.database import connect_with_env
+from api.data.stations import (
+    StationData,
+    select_station_async,
+    select_stations_async,
+)
+from api.api.database import AsyncDbConnectionDep
 from fastapi import APIRouter, HTTPException
 
 
@@ -7,16 +11,18 @@ router = APIRouter(prefix="/stations", tags=["users/train/stations"])
 
 
 @router.get("", summary="Get train stations")
-async def get_train_stations(user_id: int) -> list[StationData]:
-    with connect_with_env() as conn:
-        stations = select_stations(conn)
-        return stations
+async def get_train_stations(
+    conn: AsyncDbConnectionDep, user_id: int
+) -> list[StationData]:
+    stations = await select_stations_async(conn)
+    return stations
 
 
 @router.get("/{station_crs}", summary="Get train station")
-async def get_train_station(user_id: int, station_crs: str) -> StationData:
-    with connect_with_env() as conn:
-        station = select_station(conn, station_crs)
-        if station is None:
-            raise HTTPException(status_code=404, detail="Station not found")
-        return station
+async def get_train_station(
+    conn: AsyncDbConnectionDep, user_id: int, station_crs: str
+) -> StationData:
+    station = await select_station_async(conn, station_crs)
+    if station is None:
+        raise HTTPException(status_code=404, detail="Station not found")
+    return station
@@ -2,8 +2,8 @@ from datetime import datetime
 from typing import Optional
 from fastapi import APIRouter, HTTPException
 
-from api.data.stats import Stats, get_train_stats
-from api.utils.database import connect_with_env
+from api.data.stats import Stats, get_train_stats_async
+from api.api.database import AsyncDbConnectionDep
 
 
 router = APIRouter(prefix="/stats", tags=["users/train/stats"])
@@ -11,26 +11,26 @@ router = APIRouter(prefix="/stats", tags=["users/train/stats"])
 
 @router.get("", summary="Get train stats across a time period")
 async def get_train_stats_in_range(
+    conn: AsyncDbConnectionDep,
     user_id: int,
     start_date: Optional[datetime] = None,
     end_date: Optional[datetime] = None,
 ) -> Stats:
-    with connect_with_env() as conn:
-        try:
-            return get_train_stats(conn, user_id, start_date, end_date)
-        except RuntimeError:
-            raise HTTPException(500, "Could not get stats")
+    try:
+        return await get_train_stats_async(conn, user_id, start_date, end_date)
+    except RuntimeError:
+        raise HTTPException(500, "Could not get stats")
 
 
 @router.get("/years/{year}", summary="Get train stats across a year")
 async def get_train_stats_from_year(
+    conn: AsyncDbConnectionDep,
     user_id: int,
     year: int,
 ) -> Stats:
-    with connect_with_env() as conn:
-        try:
-            return get_train_stats(
-                conn, user_id, datetime(year, 1, 1), datetime(year, 12, 31)
-            )
-        except RuntimeError:
-            raise HTTPException(500, "Could not get stats")
+    try:
+        return await get_train_stats_async(
+            conn, user_id, datetime(year, 1, 1), datetime(year, 12, 31)
+        )
+    except RuntimeError:
+        raise HTTPException(500, "Could not get stats")
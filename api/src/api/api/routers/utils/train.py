@@ -2,9 +2,10 @@ from typing import Optional
 from fastapi import APIRouter, HTTPException
 from fastapi.responses import HTMLResponse
 
-from api.utils.database import connect_with_env
-from api.data.points import get_station_points_from_crses
-from api.data.stations import select_station_from_crs
+from api.api.database import AsyncDbConnectionDep, DbConnectionDep
+from api.api.workers import run_in_network_worker
+from api.data.points import get_station_points_from_crses_async
+from api.data.stations import select_station_from_crs_async
 from api.network.map import (
     LegData,
     LegLine,
@@ -24,56 +25,57 @@ router = APIRouter(prefix="/train", tags=["utils/train"])
     response_class=HTMLResponse,
 )
 async def get_route_between_stations(
+    conn: AsyncDbConnectionDep,
     from_crs: str,
     to_crs: str,
     from_platform: Optional[str] = None,
     to_platform: Optional[str] = None,
 ) -> str:
-    with connect_with_env() as conn:
-        from_station = select_station_from_crs(conn, from_crs)
-        if from_station is None:
-            raise HTTPException(
-                status_code=404,
-                detail=f"Could not find station for code {from_crs}",
-            )
-        to_station = select_station_from_crs(conn, to_crs)
-        if to_station is None:
-            raise HTTPException(
-                status_code=404,
-                detail=f"Could not find station for code {to_crs}",
-            )
-        station_points = get_station_points_from_crses(
-            conn, [(from_crs, from_platform), (to_crs, to_platform)]
+    from_station = await select_station_from_crs_async(conn, from_crs)
+    if from_station is None:
+        raise HTTPException(
+            status_code=404,
+            detail=f"Could not find station for code {from_crs}",
         )
-        path = find_shortest_path_between_stations(
-            network,
-            from_crs,
-            from_platform,
-            to_crs,
-            to_platform,
-            station_points,
+    to_station = await select_station_from_crs_async(conn, to_crs)
+    if to_station is None:
+        raise HTTPException(
+            status_code=404,
+            detail=f"Could not find station for code {to_crs}",
         )
-        if path is None:
-            raise HTTPException(
-                status_code=404,
-                detail="Could not find a route between these stations",
-            )
-        (source_point, target_point, linestring) = path
-        return get_leg_map(
-            [],
-            [
-                LegLine(
-                    from_station.name,
-                    to_station.name,
-                    [source_point, target_point],
-                    linestring,
-                    "#000000",
-                    0,
-                    0,
-                )
-            ],
-            StationInfo(False),
+    station_points = await get_station_points_from_crses_async(
+        conn, [(from_crs, from_platform), (to_crs, to_platform)]
+    )
+    path = await run_in_network_worker(
+        find_shortest_path_between_stations,
+        network,
+        from_crs,
+        from_platform,
+        to_crs,
+        to_platform,
+        station_points,
+    )
+    if path is None:
+        raise HTTPException(
+            status_code=404,
+            detail="Could not find a route between these stations",
         )
+    (source_point, target_point, linestring) = path
+    return get_leg_map(
+        [],
+        [
+            LegLine(
+                from_station.name,
+                to_station.name,
+                [source_point, target_point],
+                linestring,
+                "#000000",
+                0,
+                0,
+            )
+        ],
+        StationInfo(False),
+    )
 
 
 @router.post(
@@ -81,5 +83,9 @@ async def get_route_between_stations(
     summary="Get map of train legs from a data set",
     response_class=HTMLResponse,
 )
-async def get_train_map_from_data(legs: list[LegData]) -> str:
-    return get_leg_map_page_from_leg_data(network, legs)
+async def get_train_map_from_data(
+    conn: DbConnectionDep, legs: list[LegData]
+) -> str:
+    return await run_in_network_worker(
+        get_leg_map_page_from_leg_data, network, conn, legs
+    )
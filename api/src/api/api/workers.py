@@ -0,0 +1,23 @@
+import asyncio
+import functools
+import os
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+
+from api.utils.environment import get_env_number_variable
+
+# Routing never modifies the shared network, so searches can run side by side
+network_workers = ThreadPoolExecutor(
+    max_workers=int(
+        get_env_number_variable("NETWORK_WORKERS", min(4, os.cpu_count() or 1))
+    ),
+    thread_name_prefix="network",
+)
+
+
+async def run_in_network_worker[T](fn: Callable[..., T], *args) -> T:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        network_workers, functools.partial(fn, *args)
+    )
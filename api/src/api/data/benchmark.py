@@ -0,0 +1,93 @@
+import sys
+import time
+
+from datetime import datetime
+from decimal import Decimal
+from typing import Optional
+
+from api.data.services import (
+    get_location_div_from_service_page,
+    get_mileages_from_service_page,
+    get_miles_and_chains_from_call_div,
+    get_service_page_url,
+    service_page_parser,
+)
+from api.utils.interactive import information, message
+from api.utils.request import make_get_request, soupify
+
+default_repeats = 20
+
+
+def get_mileages_per_call(
+    html: str, crses: list[str]
+) -> dict[str, Optional[Decimal]]:
+    """
+    Find the mileage of every call the old way, scanning the whole page for
+    each call
+    """
+    soup = soupify(html)
+    if soup is None:
+        raise RuntimeError("Could not parse page")
+    mileages: dict[str, Optional[Decimal]] = {}
+    for crs in crses:
+        call_div = get_location_div_from_service_page(soup, crs)
+        if call_div is None:
+            mileages[crs] = None
+        else:
+            mileages[crs] = get_miles_and_chains_from_call_div(call_div)
+    return mileages
+
+
+def compare_mileage_extraction(html: str, repeats: int):
+    mileages = get_mileages_from_service_page(html)
+    crses = list(mileages.keys())
+    information(f"{len(crses)} calls, parsing with {service_page_parser}")
+
+    start = time.perf_counter()
+    for _ in range(repeats):
+        per_call = get_mileages_per_call(html, crses)
+    per_call_time = (time.perf_counter() - start) / repeats
+
+    start = time.perf_counter()
+    for _ in range(repeats):
+        indexed = get_mileages_from_service_page(html)
+        for crs in crses:
+            indexed.get(crs)
+    indexed_time = (time.perf_counter() - start) / repeats
+
+    if per_call != indexed:
+        differences = [crs for crs in crses if per_call[crs] != indexed[crs]]
+        information(f"Mileages differ for {', '.join(differences)}")
+    message(f"per call: {per_call_time * 1000:.1f} ms a page")
+    message(f"indexed: {indexed_time * 1000:.1f} ms a page")
+
+
+def save_service_page(service_id: str, run_date: datetime, page_path: str):
+    """
+    Save the detailed page of a service from Realtime Trains, so the mileages
+    can be timed on a real page
+    """
+    response = make_get_request(get_service_page_url(service_id, run_date))
+    with open(page_path, "w") as f:
+        f.write(response.text)
+    mileages = get_mileages_from_service_page(response.text)
+    message(f"Saved {len(mileages)} calls to {page_path}")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3:
+        raise RuntimeError("No command and page specified")
+    match sys.argv[1]:
+        case "save":
+            if len(sys.argv) < 5:
+                raise RuntimeError("No service id, run date and page given")
+            save_service_page(
+                sys.argv[2], datetime.fromisoformat(sys.argv[3]), sys.argv[4]
+            )
+        case "time":
+            with open(sys.argv[2]) as f:
+                html = f.read()
+            repeats = int(sys.argv[3]) if len(sys.argv) > 3 else default_repeats
+            compare_mileage_extraction(html, repeats)
+        case _:
+            raise RuntimeError(f"Unknown command {sys.argv[1]}")
@@ -17,7 +17,7 @@ from api.data.bus.vehicle import (
 )
 from api.user import User
 from api.utils.database import register_type
-from psycopg import Connection
+from psycopg import AsyncConnection, Connection
 
 
 @dataclass
@@ -83,7 +83,7 @@ def register_bus_leg_user_details(
     return BusLegUserDetails(leg_id, bus_service, bus_vehicle, calls, duration)
 
 
-def register_leg_types(conn: Connection):
+def register_leg_types(conn: Connection | AsyncConnection):
     register_bus_leg_service_details_types(conn)
     register_bus_vehicle_details_types(conn)
     register_bus_call_details_types(conn)
@@ -112,7 +112,7 @@ def select_bus_legs_by_start_datetime(
 ) -> list[BusLegUserDetails]:
     register_leg_types(conn)
     rows = conn.execute(
-        "SELECT GetUserDetailsForBusLegByStartDatetime(%s, %s)",
+        "SELECT GetUserDetailsForBusLegsByStartDatetime(%s, %s)",
         [user_id, search_start],
     ).fetchall()
     return [row[0] for row in rows]
@@ -123,7 +123,7 @@ def select_bus_legs_by_end_datetime(
 ) -> list[BusLegUserDetails]:
     register_leg_types(conn)
     rows = conn.execute(
-        "SELECT GetUserDetailsForBusLegByEngDatetime(%s, %s)",
+        "SELECT GetUserDetailsForBusLegsByEndDatetime(%s, %s)",
         [user_id, search_end],
     ).fetchall()
     return [row[0] for row in rows]
@@ -146,6 +146,78 @@ def select_bus_legs_by_id(
 ) -> list[BusLegUserDetails]:
     register_leg_types(conn)
     rows = conn.execute(
-        "SELECT GetUserDetailsForBusLegByIds(%s, %s)", [user_id, leg_ids]
+        "SELECT GetUserDetailsForBusLegsByIds(%s, %s)", [user_id, leg_ids]
     ).fetchall()
     return [row[0] for row in rows]
+
+
+async def select_bus_legs_async(
+    conn: AsyncConnection, user_id: int
+) -> list[BusLegUserDetails]:
+    register_leg_types(conn)
+    cur = await conn.execute("SELECT GetUserDetailsForBusLeg(%s)", [user_id])
+    rows = await cur.fetchall()
+    return [row[0] for row in rows]
+
+
+async def select_bus_legs_by_datetime_async(
+    conn: AsyncConnection,
+    user_id: int,
+    search_start: datetime,
+    search_end: datetime,
+) -> list[BusLegUserDetails]:
+    register_leg_types(conn)
+    cur = await conn.execute(
+        "SELECT GetUserDetailsForBusLegsByDatetime(%s, %s, %s)",
+        [user_id, search_start, search_end],
+    )
+    rows = await cur.fetchall()
+    return [row[0] for row in rows]
+
+
+async def select_bus_legs_by_start_datetime_async(
+    conn: AsyncConnection, user_id: int, search_start: datetime
+) -> list[BusLegUserDetails]:
+    register_leg_types(conn)
+    cur = await conn.execute(
+        "SELECT GetUserDetailsForBusLegsByStartDatetime(%s, %s)",
+        [user_id, search_start],
+    )
+    rows = await cur.fetchall()
+    return [row[0] for row in rows]
+
+
+async def select_bus_legs_by_end_datetime_async(
+    conn: AsyncConnection, user_id: int, search_end: datetime
+) -> list[BusLegUserDetails]:
+    register_leg_types(conn)
+    cur = await conn.execute(
+        "SELECT GetUserDetailsForBusLegsByEndDatetime(%s, %s)",
+        [user_id, search_end],
+    )
+    rows = await cur.fetchall()
+    return [row[0] for row in rows]
+
+
+async def select_bus_leg_by_id_async(
+    conn: AsyncConnection, user_id: int, leg_id: int
+) -> Optional[BusLegUserDetails]:
+    register_leg_types(conn)
+    cur = await conn.execute(
+        "SELECT GetUserDetailsForBusLegsByIds(%s, %s)", [user_id, [leg_id]]
+    )
+    rows = await cur.fetchall()
+    if len(rows) == 0:
+        return None
+    return [row[0] for row in rows][0]
+
+
+async def select_bus_legs_by_id_async(
+    conn: AsyncConnection, user_id: int, leg_ids: list[int]
+) -> list[BusLegUserDetails]:
+    register_leg_types(conn)
+    cur = await conn.execute(
+        "SELECT GetUserDetailsForBusLegsByIds(%s, %s)", [user_id, leg_ids]
+    )
+    rows = await cur.fetchall()
+    return [row[0] for row in rows]
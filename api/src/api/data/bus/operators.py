@@ -2,7 +2,7 @@ from dataclasses import dataclass
 from typing import Optional
 
 from api.utils.database import register_type
-from psycopg import Connection
+from psycopg import AsyncConnection, Connection
 
 
 @dataclass
@@ -26,11 +26,12 @@ def register_bus_operator_details(
     )
 
 
-def register_bus_operator_details_types(conn: Connection):
+def register_bus_operator_details_types(conn: Connection | AsyncConnection):
     register_type(conn, "BusOperatorDetails", register_bus_operator_details)
 
 
 def get_bus_operators(conn: Connection) -> list[BusOperatorDetails]:
+    register_bus_operator_details_types(conn)
     rows = conn.execute("SELECT GetBusOperators()").fetchall()
     return [row[0] for row in rows]
 
@@ -5,7 +5,7 @@ from api.data.bus.stop import (
     register_bus_call_stop_details,
     register_bus_call_stop_details_types,
 )
-from psycopg import Connection
+from psycopg import AsyncConnection, Connection
 from typing import Optional
 
 from api.data.bus.operators import (
@@ -41,7 +41,7 @@ def register_bus_call_details(
     )
 
 
-def register_bus_call_details_types(conn: Connection):
+def register_bus_call_details_types(conn: Connection | AsyncConnection):
     register_bus_call_stop_details_types(conn)
     register_type(conn, "BusCallDetails", register_bus_call_details)
 
@@ -77,7 +77,7 @@ def register_bus_leg_service_details(
     )
 
 
-def register_bus_leg_service_details_types(conn: Connection):
+def register_bus_leg_service_details_types(conn: Connection | AsyncConnection):
     register_bus_operator_details_types(conn)
     register_type(
         conn, "BusLegServiceDetails", register_bus_leg_service_details
@@ -105,7 +105,7 @@ def register_bus_leg_user_details(
     )
 
 
-def register_bus_leg_user_details_types(conn: Connection):
+def register_bus_leg_user_details_types(conn: Connection | AsyncConnection):
     register_bus_leg_service_details_types(conn)
     register_bus_call_details_types(conn)
     register_type(conn, "BusLegUserDetails", register_bus_leg_user_details)
@@ -132,7 +132,7 @@ def register_bus_vehicle_leg_details(
     )
 
 
-def register_bus_vehicle_leg_details_types(conn: Connection):
+def register_bus_vehicle_leg_details_types(conn: Connection | AsyncConnection):
     register_bus_leg_service_details_types(conn)
     register_bus_call_details_types(conn)
     register_type(
@@ -171,7 +171,7 @@ def register_bus_vehicle_user_details(
     )
 
 
-def register_bus_vehicle_user_details_types(conn: Connection):
+def register_bus_vehicle_user_details_types(conn: Connection | AsyncConnection):
     register_bus_operator_details_types(conn)
     register_bus_vehicle_leg_details_types(conn)
     register_type(
@@ -1,9 +1,26 @@
 import selenium.webdriver.support.ui as ui
+from urllib.parse import urlparse
+from bs4 import BeautifulSoup
 from selenium.webdriver.common.by import By
 from selenium.webdriver.firefox.webdriver import WebDriver
 
+from api.data.selenium.driver import (
+    Driver,
+    FallbackDriver,
+    HttpDriver,
+    SeleniumDriver,
+)
+from api.utils.environment import get_env_variable
+
+
+# The browser sessions which have already accepted the cookies, as the banner
+# is only shown once in each session
+accepted_sessions: set[str] = set()
+
 
 def accept_bustimes_cookies(driver: WebDriver):
+    if driver.session_id in accepted_sessions:
+        return
     wait = ui.WebDriverWait(driver, 10)
 
     while True:
@@ -15,3 +32,52 @@ def accept_bustimes_cookies(driver: WebDriver):
             break
         except:
             pass
+    if driver.session_id is not None:
+        accepted_sessions.add(driver.session_id)
+
+
+# The elements each kind of bustimes page is read from, which are in the html
+# sent by the server, so a page is only loaded in a browser if one is missing
+bustimes_page_selectors = {
+    "stops": ["#departures"],
+    "journeys": [".breadcrumb", "tr td a[href^='/stops/']"],
+    "trips": ["script#trip-data"],
+}
+
+# Kinds of bustimes page to always load in a browser, such as stops,journeys
+# No pages saved from the site have yet been compared, so every kind is loaded
+# in the browser unless this is set
+bustimes_browser_pages_variable = get_env_variable("BUSTIMES_BROWSER_PAGES")
+if bustimes_browser_pages_variable is None:
+    bustimes_browser_pages_variable = ",".join(bustimes_page_selectors)
+bustimes_browser_pages = {
+    page_type
+    for page_type in bustimes_browser_pages_variable.split(",")
+    if page_type != ""
+}
+
+
+def get_bustimes_page_type(url: str) -> str:
+    return urlparse(url).path.split("/")[1]
+
+
+def can_load_bustimes_page_over_http(url: str) -> bool:
+    return get_bustimes_page_type(url) not in bustimes_browser_pages
+
+
+def is_usable_bustimes_page(url: str, soup: BeautifulSoup) -> bool:
+    selectors = bustimes_page_selectors.get(get_bustimes_page_type(url), [])
+    return all(soup.select_one(selector) is not None for selector in selectors)
+
+
+def get_bustimes_driver() -> Driver:
+    """
+    Load bustimes pages over http, only starting a browser for pages that
+    cannot be read without one
+    """
+    return FallbackDriver(
+        HttpDriver(),
+        SeleniumDriver(),
+        can_load_bustimes_page_over_http,
+        is_usable_bustimes_page,
+    )
@@ -0,0 +1,222 @@
+import json
+import sys
+
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Callable, Optional
+
+from bs4 import BeautifulSoup
+from selenium.webdriver.firefox.webdriver import WebDriver
+
+from api.data.bus.pages.bustimes import get_bustimes_page_type
+from api.data.bus.pages.journey.reader import get_bustimes_journey
+from api.data.bus.pages.stop.reader import (
+    get_bus_stop_page_url_from_atco,
+    get_departures_from_bus_stop_soup,
+    setup_bustimes_stop_page,
+)
+from api.data.bus.pages.trip.reader import get_bus_trip_page
+from api.data.selenium.driver import Driver, HttpDriver, SeleniumDriver
+from api.utils.interactive import information, message
+
+# A stop page, and a journey and trip page from its departures, each saved as
+# sent over http and as loaded in a browser
+bustimes_fixtures_path = Path(__file__).parent / "fixtures"
+
+# The stop and time the fixtures were saved from
+bustimes_fixture_stop_path = bustimes_fixtures_path / "stop.json"
+
+
+def get_bustimes_fixture_path(page_type: str, copy: str) -> Path:
+    return bustimes_fixtures_path / f"{page_type}_{copy}.html"
+
+
+class FixtureDriver(Driver):
+    """
+    Serves the saved copy of each kind of bustimes page, whatever page of that
+    kind is asked for
+    """
+
+    def __init__(self, copy: str):
+        self.copy = copy
+
+    def get_page_html(
+        self, url: str, action: Callable[[WebDriver], None]
+    ) -> BeautifulSoup:
+        path = get_bustimes_fixture_path(get_bustimes_page_type(url), self.copy)
+        with open(path) as f:
+            return BeautifulSoup(f.read(), "html.parser")
+
+
+class SavingDriver(Driver):
+    """
+    Loads pages with another driver, saving each one as the fixture for its
+    kind of page
+    """
+
+    def __init__(self, driver: Driver, copy: str):
+        self.driver = driver
+        self.copy = copy
+
+    def get_page_html(
+        self, url: str, action: Callable[[WebDriver], None]
+    ) -> BeautifulSoup:
+        soup = self.driver.get_page_html(url, action)
+        path = get_bustimes_fixture_path(get_bustimes_page_type(url), self.copy)
+        with open(path, "w") as f:
+            f.write(str(soup))
+        return soup
+
+    def close(self):
+        self.driver.close()
+
+
+def get_trip_data(driver: Driver, bustimes_trip_id: int) -> Optional[dict]:
+    soup = get_bus_trip_page(driver, bustimes_trip_id)
+    if soup is None:
+        return None
+    trip_script = soup.select_one("script#trip-data")
+    if trip_script is None:
+        return None
+    return json.loads(trip_script.text)
+
+
+def report_comparison(
+    page: str, http_result: object, browser_result: object
+) -> bool:
+    if http_result == browser_result:
+        message(f"{page}: identical")
+        return True
+    message(f"{page}: different")
+    information(f"http: {http_result}")
+    information(f"browser: {browser_result}")
+    return False
+
+
+def compare_bustimes_drivers(
+    atco: str,
+    search_datetime: datetime,
+    http_driver: Driver,
+    browser_driver: Driver,
+) -> list[str]:
+    """
+    Read the departures from a stop, and the first live journey and first
+    timetabled trip among them, with pages loaded over http and in a browser
+
+    Returns the kinds of page which are read differently, along with any which
+    are missing or could not be read
+    """
+    differences = []
+    (http_departures, browser_departures) = [
+        get_departures_from_bus_stop_soup(
+            driver.get_page_html(
+                get_bus_stop_page_url_from_atco(atco, search_datetime),
+                setup_bustimes_stop_page,
+            ),
+            timedelta(0),
+        )
+        for driver in [http_driver, browser_driver]
+    ]
+    if len(browser_departures) == 0:
+        information("No departures to compare")
+        differences.append("stop")
+    elif not report_comparison("stop", http_departures, browser_departures):
+        differences.append("stop")
+
+    live_departure = next(
+        (departure for departure in browser_departures if departure.live),
+        None,
+    )
+    if live_departure is None:
+        information("No live departures to compare journeys with")
+        differences.append("journey")
+    else:
+        (http_journey, browser_journey) = [
+            get_bustimes_journey(
+                driver,
+                live_departure.dep_time.date(),
+                atco,
+                live_departure.bustimes_id,
+            )
+            for driver in [http_driver, browser_driver]
+        ]
+        if browser_journey is None or len(browser_journey.calls) == 0:
+            information("No calls in the journey to compare")
+            differences.append("journey")
+        elif not report_comparison("journey", http_journey, browser_journey):
+            differences.append("journey")
+
+    timetabled_departure = next(
+        (departure for departure in browser_departures if not departure.live),
+        None,
+    )
+    if timetabled_departure is None:
+        information("No timetabled departures to compare trips with")
+        differences.append("trip")
+    else:
+        (http_trip, browser_trip) = [
+            get_trip_data(driver, timetabled_departure.bustimes_id)
+            for driver in [http_driver, browser_driver]
+        ]
+        if browser_trip is None:
+            information("No trip data to compare")
+            differences.append("trip")
+        elif not report_comparison("trip", http_trip, browser_trip):
+            differences.append("trip")
+    return differences
+
+
+def check_bustimes_fixtures():
+    """
+    Read the saved pages, checking each reader gets the same from the copy
+    sent over http as from the copy loaded in a browser
+    """
+    if not bustimes_fixture_stop_path.exists():
+        raise RuntimeError("No saved pages, save them with compare save first")
+    with open(bustimes_fixture_stop_path) as f:
+        stop = json.load(f)
+    differences = compare_bustimes_drivers(
+        stop["atco"],
+        datetime.fromisoformat(stop["datetime"]),
+        FixtureDriver("http"),
+        FixtureDriver("browser"),
+    )
+    if len(differences) > 0:
+        raise RuntimeError(f"Saved pages read differently: {differences}")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        raise RuntimeError("No comparison specified")
+    if sys.argv[1] == "fixtures":
+        check_bustimes_fixtures()
+        sys.exit(0)
+    if len(sys.argv) < 3:
+        raise RuntimeError("No stop atco specified")
+    if len(sys.argv) > 3:
+        search_datetime = datetime.fromisoformat(sys.argv[3])
+    else:
+        search_datetime = datetime.now()
+    match sys.argv[1]:
+        case "live":
+            http_driver: Driver = HttpDriver()
+            browser_driver: Driver = SeleniumDriver()
+        case "save":
+            bustimes_fixtures_path.mkdir(exist_ok=True)
+            http_driver = SavingDriver(HttpDriver(), "http")
+            browser_driver = SavingDriver(SeleniumDriver(), "browser")
+            with open(bustimes_fixture_stop_path, "w") as f:
+                json.dump(
+                    {
+                        "atco": sys.argv[2],
+                        "datetime": search_datetime.isoformat(),
+                    },
+                    f,
+                    indent=2,
+                )
+        case _:
+            raise RuntimeError(f"Unknown comparison {sys.argv[1]}")
+    with http_driver, browser_driver:
+        compare_bustimes_drivers(
+            sys.argv[2], search_datetime, http_driver, browser_driver
+        )
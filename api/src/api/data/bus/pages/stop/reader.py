@@ -9,16 +9,20 @@ from bs4 import BeautifulSoup
 from selenium.webdriver.firefox.webdriver import WebDriver
 
 
-def get_bus_stop_page_url(
-    bus_stop: BusStopDetails, search_datetime: datetime = datetime.now()
-) -> str:
+def get_bus_stop_page_url_from_atco(atco: str, search_datetime: datetime) -> str:
     return (
-        f"https://bustimes.org/stops/{bus_stop.atco}"
+        f"https://bustimes.org/stops/{atco}"
         + f"?date={search_datetime.strftime('%Y-%m-%d')}"
         + f"&time={search_datetime.strftime('%H:%M')}"
     )
 
 
+def get_bus_stop_page_url(
+    bus_stop: BusStopDetails, search_datetime: datetime = datetime.now()
+) -> str:
+    return get_bus_stop_page_url_from_atco(bus_stop.atco, search_datetime)
+
+
 def setup_bustimes_stop_page(driver: WebDriver):
     accept_bustimes_cookies(driver)
 
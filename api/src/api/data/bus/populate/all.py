@@ -1,18 +1,40 @@
 import sys
 
 from api.data.bus.populate.operators import populate_bus_operators
+from api.data.bus.populate.refresh import BusDataFingerprints
 from api.data.bus.populate.service import populate_bus_services
 from api.data.bus.populate.stop import populate_bus_stops
 from api.data.bus.populate.vehicle import populate_bus_vehicles
 from api.utils.database import connect, get_db_connection_data_from_args
+from api.utils.environment import get_env_variable
 
-connection_data = get_db_connection_data_from_args()
+# Services are parsed in a process pool, which must not rerun this script
+if __name__ == "__main__":
+    connection_data = get_db_connection_data_from_args()
 
-with connect(connection_data) as conn:
-    populate_bus_stops(conn, sys.argv[5])
-    operators = populate_bus_operators(conn, sys.argv[6])
-    operator_nocs = set()
-    for operator in operators:
-        operator_nocs.add(operator.national_code)
-    populate_bus_services(conn, operator_nocs, sys.argv[7])
-    populate_bus_vehicles(conn)
+    # Only send what has changed since the last import if this is set
+    refresh_state_path = get_env_variable("BUS_REFRESH_STATE_PATH")
+    if refresh_state_path is None:
+        fingerprints = None
+    else:
+        fingerprints = BusDataFingerprints(refresh_state_path)
+
+    with connect(connection_data) as conn:
+        populate_bus_stops(conn, sys.argv[5], fingerprints)
+        operators = populate_bus_operators(conn, sys.argv[6], fingerprints)
+        operator_nocs = set()
+        for operator in operators:
+            operator_nocs.add(operator.national_code)
+        populate_bus_services(
+            conn,
+            operator_nocs,
+            sys.argv[7],
+            noc_index_path=get_env_variable("BODS_NOC_INDEX_PATH"),
+            fingerprints=fingerprints,
+        )
+        populate_bus_vehicles(
+            conn, get_env_variable("BUS_VEHICLES_CHECKPOINT_PATH")
+        )
+
+    if fingerprints is not None:
+        fingerprints.close()
@@ -0,0 +1,94 @@
+import csv
+import os
+import random
+import sys
+import tempfile
+import time
+
+from shapely import Point
+
+from api.data.bus.populate.stop import (
+    eastings_column,
+    get_bus_stops_from_stops_csv,
+    northings_column,
+    standard_bus_stop_type,
+    stop_type_column,
+)
+from api.network.network import osgb36_to_wgs84_point
+from api.utils.interactive import information, message
+
+# Roughly the number of rows in the national NaPTAN stops csv
+default_row_count = 400000
+
+# Projecting each stop on its own is too slow to time over the whole file, so
+# it is timed over this many stops and scaled up
+per_stop_sample_size = 2000
+
+column_count = 43
+
+
+def write_synthetic_stops_csv(path: str, row_count: int, seed: int):
+    """
+    Write a csv laid out like the NaPTAN stops csv, with random eastings and
+    northings across Great Britain
+    """
+    generator = random.Random(seed)
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow([f"Column{i}" for i in range(column_count)])
+        for i in range(row_count):
+            row = [f"value {i} {column}" for column in range(column_count)]
+            row[0] = f"{i:012d}"
+            row[eastings_column] = str(generator.randint(100000, 650000))
+            row[northings_column] = str(generator.randint(10000, 1200000))
+            row[stop_type_column] = standard_bus_stop_type
+            writer.writerow(row)
+
+
+def time_per_stop_projection(path: str, sample_size: int) -> float:
+    with open(path) as f:
+        reader = csv.reader(f)
+        next(reader)
+        points = [
+            Point(int(row[eastings_column]), int(row[northings_column]))
+            for (_, row) in zip(range(sample_size), reader)
+        ]
+    start = time.perf_counter()
+    for point in points:
+        osgb36_to_wgs84_point(point)
+    return (time.perf_counter() - start) / len(points)
+
+
+def compare_stop_projections(row_count: int, seed: int):
+    """
+    Compare reading a synthetic stops csv, projecting all the stops in chunks,
+    against the time it would take to project each stop on its own
+    """
+    (handle, path) = tempfile.mkstemp(suffix=".csv")
+    os.close(handle)
+    try:
+        information(f"Writing {row_count} synthetic stops to {path}")
+        write_synthetic_stops_csv(path, row_count, seed)
+
+        information("Reading stops")
+        start = time.perf_counter()
+        stop_count = sum(1 for _ in get_bus_stops_from_stops_csv(path))
+        chunked_time = time.perf_counter() - start
+
+        information(f"Projecting {per_stop_sample_size} stops one by one")
+        per_stop_time = time_per_stop_projection(path, per_stop_sample_size)
+    finally:
+        os.remove(path)
+
+    message(f"{stop_count} stops")
+    message(f"chunked: {chunked_time:.1f} s to read and project every stop")
+    message(
+        f"per stop: {per_stop_time * 1000:.2f} ms per projection, "
+        f"about {per_stop_time * stop_count:.0f} s for every stop"
+    )
+
+
+if __name__ == "__main__":
+    row_count = int(sys.argv[1]) if len(sys.argv) > 1 else default_row_count
+    seed = int(sys.argv[2]) if len(sys.argv) > 2 else 0
+    compare_stop_projections(row_count, seed)
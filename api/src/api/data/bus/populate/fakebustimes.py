@@ -0,0 +1,190 @@
+import os
+import re
+import tempfile
+import threading
+
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+
+from api.data.bus.operators import BusOperatorDetails
+from api.data.bus.populate.vehicle import (
+    read_vehicle_checkpoint,
+    scrape_bus_vehicles,
+)
+from api.data.bus.vehicle import BusVehicleIn
+from api.utils.interactive import information, message
+from api.utils.request import RequestLimiter
+
+fake_operator_re = re.compile(r"^/operators/(\w+)$")
+fake_fleet_re = re.compile(r"^/operators/(\w+)/vehicles$")
+
+# How each fake operator's pages are served: a fleet of this many vehicles, no
+# vehicles tab, not found, an empty page, or always unavailable
+fake_operator_pages = {
+    "FLTA": 30,
+    "FLTB": 5,
+    "NONE": 0,
+    "GONE": "missing",
+    "BLNK": "empty",
+    "DOWN": "unavailable",
+}
+
+
+def get_fake_operator_page(noc: str, fleet_size: int) -> str:
+    tabs = f"<li><a href='/operators/{noc}'>Timetables</a></li>"
+    if fleet_size > 0:
+        vehicles_url = f"/operators/{noc}/vehicles"
+        tabs = f"{tabs}<li><a href='{vehicles_url}'>Vehicles</a></li>"
+    return f"<html><body><ul class='tabs'>{tabs}</ul></body></html>"
+
+
+def get_fake_fleet_page(noc: str, fleet_size: int) -> str:
+    rows = "".join(
+        f"<tr id='{noc}-{i}'>"
+        f"<td><a href='/vehicles/{noc.lower()}-{i}'>{i}</a></td>"
+        f"<td>AB{i:02d} {noc}</td><td>Model {i % 3}</td></tr>"
+        for i in range(fleet_size)
+    )
+    return (
+        "<html><body><table class='fleet'><thead><tr>"
+        "<th>ID</th><th>Reg</th><th>Type</th>"
+        f"</tr></thead><tbody>{rows}</tbody></table></body></html>"
+    )
+
+
+class FakeBustimesServer:
+    """
+    A local stand in for the operator and fleet pages of bustimes.org,
+    counting how many times each path is requested
+    """
+
+    def __init__(self, operator_pages: dict[str, int | str]):
+        self.operator_pages = operator_pages
+        self.requests: Counter[str] = Counter()
+        self.lock = threading.Lock()
+        fake = self
+
+        class FakeBustimesHandler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                fake.respond(self)
+
+        self.server = ThreadingHTTPServer(
+            ("127.0.0.1", 0), FakeBustimesHandler
+        )
+        self.url = f"http://127.0.0.1:{self.server.server_port}"
+        self.thread = threading.Thread(
+            target=self.server.serve_forever, daemon=True
+        )
+
+    def respond(self, request: BaseHTTPRequestHandler):
+        with self.lock:
+            self.requests[request.path] = self.requests[request.path] + 1
+        operator_match = fake_operator_re.match(request.path)
+        fleet_match = fake_fleet_re.match(request.path)
+        match = operator_match or fleet_match
+        page = None if match is None else self.operator_pages.get(match[1])
+        status = 200
+        body: Optional[str] = None
+        if page is None or page == "missing":
+            status = 404
+        elif page == "unavailable":
+            status = 503
+        elif page == "empty":
+            body = ""
+        elif isinstance(page, int) and operator_match is not None:
+            body = get_fake_operator_page(operator_match[1], page)
+        elif isinstance(page, int) and fleet_match is not None and page > 0:
+            body = get_fake_fleet_page(fleet_match[1], page)
+        else:
+            status = 404
+        encoded = (body or "").encode()
+        request.send_response(status)
+        if status == 503:
+            request.send_header("Retry-After", "0")
+        request.send_header("Content-Length", str(len(encoded)))
+        request.end_headers()
+        request.wfile.write(encoded)
+
+    def __enter__(self) -> "FakeBustimesServer":
+        self.thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def scrape_fake_operators(
+    server: FakeBustimesServer,
+    operators: list[BusOperatorDetails],
+    checkpoint_path: str,
+) -> tuple[list[BusVehicleIn], list[str]]:
+    finished = read_vehicle_checkpoint(checkpoint_path)
+    inserted: list[BusVehicleIn] = []
+    scrape = scrape_bus_vehicles(
+        [
+            operator
+            for operator in operators
+            if operator.national_code not in finished
+        ],
+        inserted.extend,
+        checkpoint_path,
+        server.url,
+        4,
+        RequestLimiter(100, 10, 4),
+    )
+    return (inserted, scrape.failed_operators)
+
+
+def check_vehicle_checkpoints():
+    """
+    Scrape fleets from a fake server where some operators fail, checking only
+    the operators whose fleets were got are checkpointed, and that the rest
+    are tried again on the next run
+    """
+    information("Scraping fleets from a fake bustimes server")
+    operators = [
+        BusOperatorDetails(i, f"Operator {noc}", noc, None, None)
+        for (i, noc) in enumerate(fake_operator_pages.keys())
+    ]
+    failing = {"GONE", "BLNK", "DOWN"}
+    with (
+        tempfile.TemporaryDirectory() as directory,
+        FakeBustimesServer(dict(fake_operator_pages)) as server,
+    ):
+        checkpoint_path = os.path.join(directory, "checkpoint.txt")
+        (inserted, failed) = scrape_fake_operators(
+            server, operators, checkpoint_path
+        )
+        if set(failed) != failing:
+            raise RuntimeError(f"Expected {failing} to fail, not {failed}")
+        if len(inserted) != 35:
+            raise RuntimeError(f"Expected 35 vehicles, not {len(inserted)}")
+        checkpoint = read_vehicle_checkpoint(checkpoint_path)
+        if checkpoint != {"FLTA", "FLTB", "NONE"}:
+            raise RuntimeError(f"Checkpointed {sorted(checkpoint)}")
+        message(f"first run: {len(inserted)} vehicles, {sorted(failed)} failed")
+
+        for noc in failing:
+            server.operator_pages[noc] = 2
+        server.requests.clear()
+        (inserted, failed) = scrape_fake_operators(
+            server, operators, checkpoint_path
+        )
+        requested = {path.split("/")[2] for path in server.requests}
+        if requested != failing:
+            raise RuntimeError(f"Second run requested {sorted(requested)}")
+        if len(failed) > 0 or len(inserted) != 6:
+            raise RuntimeError(f"Second run got {len(inserted)} vehicles")
+        checkpoint = read_vehicle_checkpoint(checkpoint_path)
+        if checkpoint != set(fake_operator_pages.keys()):
+            raise RuntimeError(f"Checkpointed {sorted(checkpoint)}")
+        message(f"second run: {len(inserted)} vehicles from the failed ones")
+
+
+if __name__ == "__main__":
+    check_vehicle_checkpoints()
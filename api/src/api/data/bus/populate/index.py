@@ -0,0 +1,62 @@
+import json
+import sqlite3
+
+from dataclasses import dataclass
+from pathlib import Path
+
+
+@dataclass
+class BodsIndexEntry:
+    file_name: str
+    crc: int
+    nocs: list[str]
+
+
+class BodsNocIndex:
+    """
+    The operator codes found in each file of the BODS archive, stored in a
+    sqlite database so later imports can skip files for operators we do not
+    load without reading them
+
+    Files are keyed by their path in the archive, through any child archives,
+    and their crc, so a file that has changed is always read again
+    """
+
+    def __init__(self, path: Path | str):
+        self.conn = sqlite3.connect(path)
+        with self.conn:
+            self.conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS BodsFile (
+                    file_name TEXT NOT NULL,
+                    crc INTEGER NOT NULL,
+                    nocs TEXT NOT NULL,
+                    PRIMARY KEY (file_name, crc)
+                )
+                """
+            )
+
+    def get_entries(self) -> dict[tuple[str, int], list[str]]:
+        rows = self.conn.execute(
+            "SELECT file_name, crc, nocs FROM BodsFile"
+        ).fetchall()
+        return {
+            (file_name, crc): json.loads(nocs)
+            for (file_name, crc, nocs) in rows
+        }
+
+    def put_entries(self, entries: list[BodsIndexEntry]):
+        with self.conn:
+            self.conn.executemany(
+                """
+                INSERT OR REPLACE INTO BodsFile (file_name, crc, nocs)
+                VALUES (?, ?, ?)
+                """,
+                [
+                    (entry.file_name, entry.crc, json.dumps(entry.nocs))
+                    for entry in entries
+                ],
+            )
+
+    def close(self):
+        self.conn.close()
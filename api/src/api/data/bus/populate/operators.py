@@ -3,7 +3,13 @@ import sys
 import xml.etree.ElementTree as ET
 
 from dataclasses import dataclass
+from typing import Optional
 
+from api.data.bus.populate.refresh import (
+    BusDataFingerprints,
+    get_file_checksum,
+    string_of_row_changes,
+)
 from api.utils.database import connect, get_db_connection_data_from_args
 from api.utils.interactive import information
 from numpy import insert
@@ -55,23 +61,49 @@ def extract_operator_data_from_traveline_xml(
     return traveline_operators
 
 
-def insert_operators(conn: Connection, operators: list[TravelineOperator]):
+def insert_operators(
+    conn: Connection, operators: list[TravelineOperator], replace: bool = False
+):
     operator_values = []
     for operator in operators:
         operator_values.append((operator.name, operator.national_code))
     conn.execute(
-        "SELECT InsertBusOperators(%s::BusOperatorInData[])", [operator_values]
+        "SELECT InsertBusOperators(%s::BusOperatorInData[], %s)",
+        [operator_values, replace],
     )
     conn.commit()
 
 
+def get_operator_key(operator: TravelineOperator) -> str:
+    return operator.national_code
+
+
 def populate_bus_operators(
-    conn: Connection, traveline_xml_path: str
+    conn: Connection,
+    traveline_xml_path: str,
+    fingerprints: Optional[BusDataFingerprints] = None,
 ) -> list[TravelineOperator]:
+    """
+    With fingerprints, only operators that have changed since the last import
+    are inserted, but every operator is always returned
+    """
     information("Retrieving bus operators")
     data = extract_operator_data_from_traveline_xml(traveline_xml_path)
     information("Inserting bus operators")
-    insert_operators(conn, data)
+    if fingerprints is None:
+        insert_operators(conn, data)
+        return data
+    checksum = get_file_checksum(traveline_xml_path)
+    if fingerprints.get_checksums("traveline").get("") == checksum:
+        information("Bus operators file has not changed")
+        return data
+    refresh = fingerprints.refresh("traveline")
+    insert_operators(
+        conn, list(refresh.filter_rows(data, get_operator_key)), replace=True
+    )
+    changes = refresh.finish()
+    fingerprints.put_checksums("traveline", {"": checksum})
+    information(f"Bus operators: {string_of_row_changes(changes)}")
     return data
 
 
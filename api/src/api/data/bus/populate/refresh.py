@@ -0,0 +1,196 @@
+import hashlib
+import sqlite3
+
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Iterable, Iterator
+
+
+def get_file_checksum(path: Path | str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def get_row_fingerprint(row: object) -> str:
+    return hashlib.blake2b(repr(row).encode(), digest_size=16).hexdigest()
+
+
+@dataclass
+class RowChanges:
+    inserted: int
+    changed: int
+    unchanged: int
+    removed: int
+
+
+def string_of_row_changes(changes: RowChanges) -> str:
+    return (
+        f"{changes.inserted} inserted, {changes.changed} changed, "
+        f"{changes.unchanged} unchanged, "
+        f"{changes.removed} no longer in the source"
+    )
+
+
+class SourceRefresh:
+    """
+    The rows seen so far in an import from one source, compared against the
+    rows seen in the last import from it
+
+    Every row is kept under a part of the source, such as a file in an
+    archive, so that all the rows of a part which has not changed can be kept
+    without reading them again
+
+    Rows which are no longer in the source are only counted, and are never
+    removed from the database, since legs already recorded may refer to them
+    """
+
+    def __init__(self, conn: sqlite3.Connection, source: str):
+        self.conn = conn
+        self.source = source
+        self.inserted = 0
+        self.changed = 0
+        self.unchanged = 0
+        self.conn.execute("DROP TABLE IF EXISTS temp.CurrentRow")
+        self.conn.execute(
+            """
+            CREATE TEMPORARY TABLE CurrentRow (
+                row_key TEXT PRIMARY KEY,
+                part TEXT NOT NULL,
+                fingerprint TEXT NOT NULL
+            )
+            """
+        )
+
+    def filter_rows[T](
+        self, rows: Iterable[T], get_key: Callable[[T], str], part: str = ""
+    ) -> Iterator[T]:
+        """
+        Yield only the rows that are new or have changed since the last import
+        """
+        for row in rows:
+            key = get_key(row)
+            fingerprint = get_row_fingerprint(row)
+            previous = self.conn.execute(
+                """
+                SELECT fingerprint FROM RowFingerprint
+                WHERE source = ? AND row_key = ?
+                """,
+                (self.source, key),
+            ).fetchone()
+            self.conn.execute(
+                "INSERT OR REPLACE INTO CurrentRow VALUES (?, ?, ?)",
+                (key, part, fingerprint),
+            )
+            if previous is None:
+                self.inserted = self.inserted + 1
+                yield row
+            elif previous[0] != fingerprint:
+                self.changed = self.changed + 1
+                yield row
+            else:
+                self.unchanged = self.unchanged + 1
+
+    def keep_part(self, part: str):
+        cursor = self.conn.execute(
+            """
+            INSERT OR REPLACE INTO CurrentRow
+            SELECT row_key, part, fingerprint FROM RowFingerprint
+            WHERE source = ? AND part = ?
+            """,
+            (self.source, part),
+        )
+        self.unchanged = self.unchanged + cursor.rowcount
+
+    def finish(self) -> RowChanges:
+        """
+        Replace the fingerprints of the last import with those of this one
+        """
+        (removed,) = self.conn.execute(
+            """
+            SELECT COUNT(*) FROM RowFingerprint
+            WHERE source = ?
+            AND row_key NOT IN (SELECT row_key FROM CurrentRow)
+            """,
+            (self.source,),
+        ).fetchone()
+        with self.conn:
+            self.conn.execute(
+                "DELETE FROM RowFingerprint WHERE source = ?", (self.source,)
+            )
+            self.conn.execute(
+                """
+                INSERT INTO RowFingerprint
+                SELECT ?, row_key, part, fingerprint FROM CurrentRow
+                """,
+                (self.source,),
+            )
+        self.conn.execute("DROP TABLE temp.CurrentRow")
+        return RowChanges(self.inserted, self.changed, self.unchanged, removed)
+
+
+class BusDataFingerprints:
+    """
+    The checksums of the files each source of bus data was last imported from
+    and fingerprints of the rows imported from them, stored in a sqlite
+    database so that a refresh only sends the rows that have changed
+    """
+
+    def __init__(self, path: Path | str):
+        self.conn = sqlite3.connect(path)
+        with self.conn:
+            self.conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS SourceChecksum (
+                    source TEXT NOT NULL,
+                    part TEXT NOT NULL,
+                    checksum TEXT NOT NULL,
+                    PRIMARY KEY (source, part)
+                )
+                """
+            )
+            self.conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS RowFingerprint (
+                    source TEXT NOT NULL,
+                    row_key TEXT NOT NULL,
+                    part TEXT NOT NULL,
+                    fingerprint TEXT NOT NULL,
+                    PRIMARY KEY (source, row_key)
+                )
+                """
+            )
+            self.conn.execute(
+                """
+                CREATE INDEX IF NOT EXISTS RowFingerprintPart
+                ON RowFingerprint (source, part)
+                """
+            )
+
+    def get_checksums(self, source: str) -> dict[str, str]:
+        rows = self.conn.execute(
+            "SELECT part, checksum FROM SourceChecksum WHERE source = ?",
+            (source,),
+        ).fetchall()
+        return {part: checksum for (part, checksum) in rows}
+
+    def put_checksums(self, source: str, checksums: dict[str, str]):
+        with self.conn:
+            self.conn.execute(
+                "DELETE FROM SourceChecksum WHERE source = ?", (source,)
+            )
+            self.conn.executemany(
+                "INSERT INTO SourceChecksum VALUES (?, ?, ?)",
+                [
+                    (source, part, checksum)
+                    for (part, checksum) in checksums.items()
+                ],
+            )
+
+    def refresh(self, source: str) -> SourceRefresh:
+        return SourceRefresh(self.conn, source)
+
+    def close(self):
+        self.conn.close()
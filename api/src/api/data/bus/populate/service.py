@@ -1,13 +1,24 @@
+import os
 import re
+import shutil
 import string
+import tempfile
 import zipfile
-import io
 import xml.etree.ElementTree as ET
 
-from pathlib import Path
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path, PurePosixPath
 from dataclasses import dataclass
-from typing import Optional
+from typing import IO, Iterable, Iterator, Optional
+from api.data.bus.populate.index import BodsIndexEntry, BodsNocIndex
 from api.data.bus.populate.operators import TravelineOperator
+from api.data.bus.populate.refresh import (
+    BusDataFingerprints,
+    get_row_fingerprint,
+    string_of_row_changes,
+)
 from api.utils.interactive import information
 from psycopg import Connection
 
@@ -17,6 +28,30 @@ bods_timetables_url = (
     "https://data.bus-data.dft.gov.uk/timetable/download/bulk_archive"
 )
 
+# Files are read and parsed in chunks of this many bytes
+xml_chunk_size = 64 * 1024
+
+# Files are handed to the parsing processes this many at a time
+bods_worker_chunk_size = 16
+
+# Each parsing process has at most this many chunks of files parsed or being
+# parsed ahead of the file being inserted, so parsed files do not pile up in
+# memory when inserting falls behind
+bods_worker_chunks_ahead = 2
+
+# Operator codes are looked for in overlapping chunks, so one split between
+# two chunks is still found
+national_operator_code_re = re.compile(
+    rb"<(?:[\w.-]+:)?NationalOperatorCode(?:\s[^>]*)?>\s*([^<\s]*)\s*</"
+)
+national_operator_code_overlap = 256
+
+# Index entries are saved in batches of this many as the archive is parsed
+index_batch_size = 1000
+
+# Services are inserted in batches of this many as the archive is parsed
+services_batch_size = 10000
+
 
 @dataclass
 class TransXChangeLineDescription:
@@ -106,7 +141,7 @@ def get_services_from_transxchange_node(
     services = []
     for service_node in service_nodes:
         lines = get_lines_from_service_node(noc, service_node, namespaces)
-        services = services + lines
+        services.extend(lines)
     return services
 
 
@@ -141,6 +176,10 @@ def get_lines_from_transxchange_node(
     return lines
 
 
+def get_line_key(line: TransXChangeLine) -> str:
+    return line.id
+
+
 def get_transxchange_namespaces(root: ET.Element) -> dict[str, str]:
     namespace_match = re.match(xmlns_re, root.tag)
     if namespace_match is None:
@@ -150,10 +189,21 @@ def get_transxchange_namespaces(root: ET.Element) -> dict[str, str]:
     return {"": namespace}
 
 
+def get_transxchange_tag(name: str, namespaces: dict[str, str]) -> str:
+    namespace = namespaces[""]
+    if namespace == "":
+        return name
+    return f"{{{namespace}}}{name}"
+
+
 def insert_services(
     conn: Connection,
     services: list[TransXChangeLine],
+    replace: bool = False,
 ):
+    """
+    Services that are already there are only replaced if replace is set
+    """
     service_values = []
     via_values = []
     for service in services:
@@ -204,56 +254,387 @@ def insert_services(
     conn.execute(
         """SELECT InsertTransXChangeBusData(
             %s::BusServiceInData[],
-            %s::BusServiceViaInData[]
+            %s::BusServiceViaInData[],
+            %s
         )""",
-        [service_values, via_values],
+        [service_values, via_values, replace],
     )
     conn.commit()
 
 
 def extract_data_from_bods_xml(
-    xml: str, operator_nocs: set[str]
+    xml_file: IO[bytes], operator_nocs: set[str]
 ) -> Optional[list[TransXChangeLine]]:
-    root = ET.fromstring(xml)
-    namespaces = get_transxchange_namespaces(root)
+    """
+    Parse the file a chunk at a time, keeping only the Operators and Services
+    elements and stopping as soon as they have both been read, or as soon as
+    the operator turns out not to be one we want
+
+    Every other element is dropped from the tree as soon as it has been read,
+    so that large elements like VehicleJourneys are never held whole
+    """
+    parser: ET.XMLPullParser[ET.Element] = ET.XMLPullParser(
+        events=("start", "end")
+    )
+    root: Optional[ET.Element] = None
+    # The elements that have been started but not ended, from the root down
+    open_elements: list[ET.Element] = []
+    namespaces = {"": ""}
+    operators_tag = "Operators"
+    services_tag = "Services"
+    operators_read = False
+    services_read = False
+    while chunk := xml_file.read(xml_chunk_size):
+        parser.feed(chunk)
+        for parsed_event in parser.read_events():
+            event = parsed_event[0]
+            node = parsed_event[-1]
+            if not isinstance(node, ET.Element):
+                continue
+            if event == "start":
+                if root is None:
+                    root = node
+                    namespaces = get_transxchange_namespaces(root)
+                    operators_tag = get_transxchange_tag(
+                        "Operators", namespaces
+                    )
+                    services_tag = get_transxchange_tag("Services", namespaces)
+                open_elements.append(node)
+                continue
+            open_elements.pop()
+            if root is None or len(open_elements) == 0:
+                continue
+            # Below a top level element that is not kept, each element is
+            # dropped as soon as it ends
+            if len(open_elements) > 1:
+                if open_elements[1].tag not in [operators_tag, services_tag]:
+                    open_elements[-1].remove(node)
+                continue
+            if node.tag == operators_tag:
+                operators_read = True
+                noc = get_noc_from_transxchange_node(root, namespaces)
+                if noc is None or noc not in operator_nocs:
+                    return None
+            elif node.tag == services_tag:
+                services_read = True
+            else:
+                root.remove(node)
+            if operators_read and services_read:
+                return get_lines_from_transxchange_node(
+                    root, namespaces, operator_nocs
+                )
+    parser.close()
+    if root is None:
+        return None
     return get_lines_from_transxchange_node(root, namespaces, operator_nocs)
 
 
-def extract_data_from_bods_zipfile(
-    zip: zipfile.ZipFile, operator_nocs: set[str]
-) -> list[TransXChangeLine]:
-    data = []
-    for file_name in zip.namelist():
-        file_path = zipfile.Path(zip, file_name)
-        file_extension = file_path.suffix
-        if file_extension == ".zip":
-            with zip.open(file_name) as child_zip:
-                child_filedata = io.BytesIO(child_zip.read())
-                with zipfile.ZipFile(child_filedata) as child_zipfile:
-                    child_data = extract_data_from_bods_zipfile(
-                        child_zipfile, operator_nocs
-                    )
-                    data = data + child_data
-        elif file_extension == ".xml":
-            information(f"Reading service file {file_name}")
-            xml = file_path.read_text()
-            file_data = extract_data_from_bods_xml(xml, operator_nocs)
-            if file_data is not None:
-                data = data + file_data
+@contextmanager
+def open_child_zipfile(
+    parent_zipfile: zipfile.ZipFile, file_name: str
+) -> Iterator[zipfile.ZipFile]:
+    """
+    A stored child archive can be read where it is, but a compressed one is
+    copied to a temporary file first, as every backwards seek through it would
+    mean decompressing it again from the start
+    """
+    if parent_zipfile.getinfo(file_name).compress_type == zipfile.ZIP_STORED:
+        with parent_zipfile.open(file_name) as child_file:
+            with zipfile.ZipFile(child_file) as child_zipfile:
+                yield child_zipfile
+    else:
+        with tempfile.TemporaryFile() as child_file:
+            with parent_zipfile.open(file_name) as compressed_file:
+                shutil.copyfileobj(compressed_file, child_file)
+            with zipfile.ZipFile(child_file) as child_zipfile:
+                yield child_zipfile
+
+
+@dataclass
+class BodsFileData:
+    lines: list[TransXChangeLine]
+    # The operator codes in the file, or in every file of a child archive, or
+    # None if any of them could not be found
+    nocs: Optional[set[str]]
+    index_entries: list[BodsIndexEntry]
+
+
+def get_noc_from_bods_xml(xml_file: IO[bytes]) -> Optional[str]:
+    """
+    Find the first operator code in the raw bytes of the file, reading only as
+    far as it and without parsing anything
+    """
+    previous = b""
+    while chunk := xml_file.read(xml_chunk_size):
+        data = previous + chunk
+        noc_match = national_operator_code_re.search(data)
+        if noc_match is not None:
+            return noc_match.group(1).decode()
+        previous = data[-national_operator_code_overlap:]
+    return None
+
+
+def extract_data_from_bods_xml_member(
+    bods_zipfile: zipfile.ZipFile,
+    file_name: str,
+    operator_nocs: set[str],
+    indexed_nocs: Optional[list[str]],
+) -> BodsFileData:
+    if indexed_nocs is None:
+        with bods_zipfile.open(file_name) as xml_file:
+            noc = get_noc_from_bods_xml(xml_file)
+        if noc is not None and noc not in operator_nocs:
+            return BodsFileData([], {noc}, [])
+        nocs = None if noc is None else {noc}
+    else:
+        nocs = set(indexed_nocs)
+    with bods_zipfile.open(file_name) as xml_file:
+        lines = extract_data_from_bods_xml(xml_file, operator_nocs) or []
+    return BodsFileData(lines, nocs, [])
+
+
+def extract_data_from_bods_zipfile_member(
+    bods_zipfile: zipfile.ZipFile,
+    file_name: str,
+    operator_nocs: set[str],
+    noc_index: dict[tuple[str, int], list[str]],
+    parent_path: str = "",
+) -> BodsFileData:
+    file_info = bods_zipfile.getinfo(file_name)
+    file_path = f"{parent_path}{file_name}"
+    indexed_nocs = noc_index.get((file_path, file_info.CRC))
+    if indexed_nocs is not None and operator_nocs.isdisjoint(indexed_nocs):
+        return BodsFileData([], set(indexed_nocs), [])
+    match PurePosixPath(file_name).suffix:
+        case ".zip":
+            with open_child_zipfile(bods_zipfile, file_name) as child_zipfile:
+                data = extract_data_from_bods_zipfile(
+                    child_zipfile, operator_nocs, noc_index, f"{file_path}/"
+                )
+        case ".xml":
+            data = extract_data_from_bods_xml_member(
+                bods_zipfile, file_name, operator_nocs, indexed_nocs
+            )
+        case _:
+            return BodsFileData([], set(), [])
+    if indexed_nocs is None and data.nocs is not None:
+        data.index_entries.append(
+            BodsIndexEntry(file_path, file_info.CRC, sorted(data.nocs))
+        )
     return data
 
 
+def extract_data_from_bods_zipfile(
+    bods_zipfile: zipfile.ZipFile,
+    operator_nocs: set[str],
+    noc_index: dict[tuple[str, int], list[str]],
+    parent_path: str = "",
+) -> BodsFileData:
+    lines = []
+    nocs: Optional[set[str]] = set()
+    index_entries = []
+    for file_name in bods_zipfile.namelist():
+        data = extract_data_from_bods_zipfile_member(
+            bods_zipfile, file_name, operator_nocs, noc_index, parent_path
+        )
+        lines.extend(data.lines)
+        index_entries.extend(data.index_entries)
+        if nocs is None or data.nocs is None:
+            nocs = None
+        else:
+            nocs.update(data.nocs)
+    return BodsFileData(lines, nocs, index_entries)
+
+
+# The archive, nocs and index used by each process in the pool, set when the
+# process starts so that the archive is only opened once per process
+worker_bods_zipfile: Optional[zipfile.ZipFile] = None
+worker_operator_nocs: set[str] = set()
+worker_noc_index: dict[tuple[str, int], list[str]] = {}
+
+
+def start_bods_worker(
+    zip_path: str | Path,
+    operator_nocs: set[str],
+    noc_index: dict[tuple[str, int], list[str]],
+):
+    global worker_bods_zipfile, worker_operator_nocs, worker_noc_index
+    worker_bods_zipfile = zipfile.ZipFile(zip_path)
+    worker_operator_nocs = operator_nocs
+    worker_noc_index = noc_index
+
+
+def extract_data_from_bods_worker_members(
+    file_names: list[str],
+) -> list[BodsFileData]:
+    if worker_bods_zipfile is None:
+        raise RuntimeError("BODS worker has not been started")
+    return [
+        extract_data_from_bods_zipfile_member(
+            worker_bods_zipfile,
+            file_name,
+            worker_operator_nocs,
+            worker_noc_index,
+        )
+        for file_name in file_names
+    ]
+
+
+def get_bods_zip_file_crcs(zip_path: str | Path) -> dict[str, int]:
+    with zipfile.ZipFile(zip_path) as bods_zipfile:
+        return {
+            file_info.filename: file_info.CRC
+            for file_info in bods_zipfile.infolist()
+            if PurePosixPath(file_info.filename).suffix in [".zip", ".xml"]
+        }
+
+
 def extract_data_from_bods_zip(
-    zip_path: str | Path, operator_nocs: set[str]
-) -> list[TransXChangeLine]:
-    with zipfile.ZipFile(zip_path) as zip:
-        return extract_data_from_bods_zipfile(zip, operator_nocs)
+    zip_path: str | Path,
+    operator_nocs: set[str],
+    workers: Optional[int] = None,
+    noc_index: Optional[BodsNocIndex] = None,
+    unchanged_files: Optional[set[str]] = None,
+) -> Iterator[tuple[str, list[TransXChangeLine]]]:
+    """
+    Parse the files in the archive across a pool of processes, yielding the
+    lines from each file in the order of the archive
+
+    Files that the index says only belong to operators we do not want are
+    skipped without being read, and the operators of every other file are
+    added to the index
+    """
+    if unchanged_files is None:
+        unchanged_files = set()
+    if noc_index is None:
+        indexed_nocs = {}
+    else:
+        indexed_nocs = noc_index.get_entries()
+    file_names = []
+    skipped = 0
+    with zipfile.ZipFile(zip_path) as bods_zipfile:
+        for file_info in bods_zipfile.infolist():
+            if PurePosixPath(file_info.filename).suffix not in [".zip", ".xml"]:
+                continue
+            if file_info.filename in unchanged_files:
+                continue
+            file_nocs = indexed_nocs.get((file_info.filename, file_info.CRC))
+            if file_nocs is not None and operator_nocs.isdisjoint(file_nocs):
+                skipped = skipped + 1
+            else:
+                file_names.append(file_info.filename)
+    information(f"Skipping {skipped} indexed service files")
+    index_entries = []
+    worker_count = workers or os.process_cpu_count() or 1
+    file_name_chunks = iter(
+        [
+            file_names[i : i + bods_worker_chunk_size]
+            for i in range(0, len(file_names), bods_worker_chunk_size)
+        ]
+    )
+    with ProcessPoolExecutor(
+        worker_count,
+        initializer=start_bods_worker,
+        initargs=(zip_path, operator_nocs, indexed_nocs),
+    ) as executor:
+        pending: deque[tuple[list[str], Future[list[BodsFileData]]]] = deque()
+
+        def submit_next_chunk():
+            chunk = next(file_name_chunks, None)
+            if chunk is not None:
+                pending.append(
+                    (
+                        chunk,
+                        executor.submit(
+                            extract_data_from_bods_worker_members, chunk
+                        ),
+                    )
+                )
+
+        for _ in range(worker_count * bods_worker_chunks_ahead):
+            submit_next_chunk()
+        while len(pending) > 0:
+            (chunk, future) = pending.popleft()
+            chunk_data = future.result()
+            submit_next_chunk()
+            for file_name, data in zip(chunk, chunk_data):
+                information(f"Read service file {file_name}")
+                if noc_index is not None:
+                    index_entries.extend(data.index_entries)
+                    if len(index_entries) >= index_batch_size:
+                        noc_index.put_entries(index_entries)
+                        index_entries = []
+                yield (file_name, data.lines)
+    if noc_index is not None and len(index_entries) > 0:
+        noc_index.put_entries(index_entries)
 
 
 def populate_bus_services(
-    conn: Connection, operator_nocs: set[str], bods_path: str
+    conn: Connection,
+    operator_nocs: set[str],
+    bods_path: str,
+    workers: Optional[int] = None,
+    noc_index_path: Optional[str] = None,
+    fingerprints: Optional[BusDataFingerprints] = None,
 ):
+    """
+    With fingerprints, files in the archive that have not changed since the
+    last import are not read, and only services that have changed are inserted
+    """
     information("Retrieving bus services")
-    data = extract_data_from_bods_zip(bods_path, operator_nocs)
-    information("Inserting bus services")
-    insert_services(conn, data)
+    noc_index = None if noc_index_path is None else BodsNocIndex(noc_index_path)
+    if fingerprints is None:
+        refresh = None
+        file_checksums = {}
+        unchanged_files = set()
+    else:
+        # Which services are kept depends on the operators, so every file is
+        # read again whenever the operators change
+        nocs_fingerprint = get_row_fingerprint(sorted(operator_nocs))
+        file_checksums = {
+            file_name: f"{crc}:{nocs_fingerprint}"
+            for (file_name, crc) in get_bods_zip_file_crcs(bods_path).items()
+        }
+        previous_checksums = fingerprints.get_checksums("bods")
+        unchanged_files = {
+            file_name
+            for (file_name, checksum) in file_checksums.items()
+            if previous_checksums.get(file_name) == checksum
+        }
+        information(f"{len(unchanged_files)} service files have not changed")
+        refresh = fingerprints.refresh("bods")
+        for file_name in unchanged_files:
+            refresh.keep_part(file_name)
+    # A refresh replaces services from earlier imports, but within one import
+    # the first file with a line wins, as it does in a full import
+    replace = refresh is not None
+    line_ids: set[str] = set()
+    count = 0
+    services = []
+    try:
+        for file_name, lines in extract_data_from_bods_zip(
+            bods_path, operator_nocs, workers, noc_index, unchanged_files
+        ):
+            if refresh is None:
+                file_lines: Iterable[TransXChangeLine] = lines
+            else:
+                file_lines = refresh.filter_rows(lines, get_line_key, file_name)
+            for line in file_lines:
+                if line.id not in line_ids:
+                    line_ids.add(line.id)
+                    services.append(line)
+            if len(services) >= services_batch_size:
+                insert_services(conn, services, replace)
+                count = count + len(services)
+                services = []
+    finally:
+        if noc_index is not None:
+            noc_index.close()
+    if len(services) > 0:
+        insert_services(conn, services, replace)
+        count = count + len(services)
+    information(f"Inserted {count} bus services")
+    if refresh is not None and fingerprints is not None:
+        changes = refresh.finish()
+        fingerprints.put_checksums("bods", file_checksums)
+        information(f"Bus services: {string_of_row_changes(changes)}")
@@ -1,23 +1,23 @@
 import csv
 import string
-import sys
+import numpy as np
 
 from decimal import Decimal
-from typing import Optional
+from typing import Iterator, Optional
 from psycopg import Connection
-from shapely import Point
 
 from api.utils.interactive import information
 
+from api.data.bus.populate.refresh import (
+    BusDataFingerprints,
+    get_file_checksum,
+    string_of_row_changes,
+)
 from api.data.bus.stop import BusStopData, insert_bus_stops
-from api.network.network import osgb36_to_wgs84_point
+from api.network.network import osgb36_to_wgs84_coords
 
 naptan_stops_csv_url = "https://beta-naptan.dft.gov.uk/Download/National/csv"
 
-# NaPTAN stops csv path
-# https://beta-naptan.dft.gov.uk/download/national
-stops_csv = sys.argv[1]
-
 atco_code_column = 0
 naptan_code_column = 1
 common_name_column = 4
@@ -35,7 +35,8 @@ eastings_column = 27
 northings_column = 28
 stop_type_column = 31
 
-stops = []
+# Stops are read and projected in chunks of this many at a time
+stops_chunk_size = 100000
 
 standard_bus_stop_type = "BCT"
 station_bus_stop_type = "BCS"
@@ -48,7 +49,55 @@ def string_to_optional_string(string: str) -> Optional[str]:
     return string
 
 
-def get_bus_stops_from_stops_csv(stops_csv_path: str) -> list[BusStopData]:
+def get_bus_stop_key(stop: BusStopData) -> str:
+    return stop.atco
+
+
+def get_bus_stops_from_rows(rows: list[list[str]]) -> list[BusStopData]:
+    """
+    Projecting every point in one call is far quicker than projecting each
+    stop on its own
+    """
+    eastings = np.array(
+        [int(row[eastings_column]) for row in rows], dtype=np.float64
+    )
+    northings = np.array(
+        [int(row[northings_column]) for row in rows], dtype=np.float64
+    )
+    (longitudes, latitudes) = osgb36_to_wgs84_coords(eastings, northings)
+    return [
+        BusStopData(
+            row[atco_code_column],
+            row[naptan_code_column],
+            string.capwords(row[common_name_column]),
+            string_to_optional_string(string.capwords(row[landmark_column])),
+            string.capwords(row[street_column]),
+            string_to_optional_string(string.capwords(row[crossing_column])),
+            string_to_optional_string(row[indicator_column]),
+            string.capwords(row[bearing_column]),
+            string.capwords(row[locality_column]),
+            string_to_optional_string(
+                string.capwords(row[parent_locality_column])
+            ),
+            string_to_optional_string(
+                string.capwords(row[grandparent_locality_column])
+            ),
+            string_to_optional_string(string.capwords(row[town_column])),
+            string_to_optional_string(string.capwords(row[suburb_column])),
+            Decimal(latitude),
+            Decimal(longitude),
+        )
+        for (row, latitude, longitude) in zip(
+            rows, latitudes.tolist(), longitudes.tolist()
+        )
+    ]
+
+
+def get_bus_stops_from_stops_csv(stops_csv_path: str) -> Iterator[BusStopData]:
+    """
+    Read the stops a chunk at a time, so only one chunk is in memory at once
+    """
+    rows = []
     with open(stops_csv_path) as f:
         reader = csv.reader(f, delimiter=",")
         header = True
@@ -62,46 +111,35 @@ def get_bus_stops_from_stops_csv(stops_csv_path: str) -> list[BusStopData]:
                     station_bus_stop_type,
                     variable_bus_stop_type,
                 ]:
-                    osgb36_point = Point(
-                        int(row[eastings_column]), int(row[northings_column])
-                    )
-                    wgs84_point = osgb36_to_wgs84_point(osgb36_point)
-                    stop = BusStopData(
-                        row[atco_code_column],
-                        row[naptan_code_column],
-                        string.capwords(row[common_name_column]),
-                        string_to_optional_string(
-                            string.capwords(row[landmark_column])
-                        ),
-                        string.capwords(row[street_column]),
-                        string_to_optional_string(
-                            string.capwords(row[crossing_column])
-                        ),
-                        string_to_optional_string(row[indicator_column]),
-                        string.capwords(row[bearing_column]),
-                        string.capwords(row[locality_column]),
-                        string_to_optional_string(
-                            string.capwords(row[parent_locality_column])
-                        ),
-                        string_to_optional_string(
-                            string.capwords(row[grandparent_locality_column])
-                        ),
-                        string_to_optional_string(
-                            string.capwords(row[town_column])
-                        ),
-                        string_to_optional_string(
-                            string.capwords(row[suburb_column])
-                        ),
-                        Decimal(wgs84_point.y),
-                        Decimal(wgs84_point.x),
-                    )
-                    stops.append(stop)
-    information(f"Retrieved {len(stops)} bus stops")
-    return stops
-
-
-def populate_bus_stops(conn: Connection, stops_csv: str):
-    information("Retrieving bus stops")
-    stops = get_bus_stops_from_stops_csv(stops_csv)
+                    rows.append(row)
+                    if len(rows) == stops_chunk_size:
+                        yield from get_bus_stops_from_rows(rows)
+                        rows = []
+    if len(rows) > 0:
+        yield from get_bus_stops_from_rows(rows)
+
+
+def populate_bus_stops(
+    conn: Connection,
+    stops_csv: str,
+    fingerprints: Optional[BusDataFingerprints] = None,
+):
+    """
+    With fingerprints, only stops that have changed since the last import are
+    inserted, and nothing is done if the file itself has not changed
+    """
     information("Inserting bus stops")
-    insert_bus_stops(conn, stops)
+    stops = get_bus_stops_from_stops_csv(stops_csv)
+    if fingerprints is None:
+        count = insert_bus_stops(conn, stops)
+        information(f"Inserted {count} bus stops")
+        return
+    checksum = get_file_checksum(stops_csv)
+    if fingerprints.get_checksums("naptan").get("") == checksum:
+        information("Bus stops file has not changed")
+        return
+    refresh = fingerprints.refresh("naptan")
+    insert_bus_stops(conn, refresh.filter_rows(stops, get_bus_stop_key))
+    changes = refresh.finish()
+    fingerprints.put_checksums("naptan", {"": checksum})
+    information(f"Bus stops: {string_of_row_changes(changes)}")
@@ -1,30 +1,177 @@
-from time import sleep
+import functools
+import os
+
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Optional
 from psycopg import Connection
+from requests import RequestException
 
-from api.data.bus.operators import get_bus_operators
-from api.data.bus.vehicle import get_bus_operator_vehicles, insert_bus_vehicles
+from api.data.bus.operators import BusOperatorDetails, get_bus_operators
+from api.data.bus.vehicle import (
+    BusVehicleIn,
+    bustimes_url,
+    get_bus_operator_vehicles,
+    insert_bus_vehicles,
+)
 from api.utils.database import connect, get_db_connection_data_from_args
+from api.utils.environment import get_env_variable
 from api.utils.interactive import information
+from api.utils.request import RequestLimiter, get_soup_with_retries
+
+# Each operator takes two requests, and bustimes.org is asked for no more
+# than this many a second, with no more than this many at once
+vehicle_requests_per_second = 2
+vehicle_request_burst = 4
+vehicle_host_concurrency = 4
+
+vehicle_workers = 8
+
+# Vehicles are inserted in batches of this many as they are scraped
+vehicle_batch_size = 1000
+
+
+def read_vehicle_checkpoint(checkpoint_path: Optional[Path | str]) -> set[str]:
+    if checkpoint_path is None or not os.path.exists(checkpoint_path):
+        return set()
+    with open(checkpoint_path) as f:
+        return {line.strip() for line in f if line.strip() != ""}
+
+
+def write_vehicle_checkpoint(
+    checkpoint_path: Optional[Path | str], operator_nocs: list[str]
+):
+    if checkpoint_path is None or len(operator_nocs) == 0:
+        return
+    with open(checkpoint_path, "a") as f:
+        for operator_noc in operator_nocs:
+            f.write(f"{operator_noc}\n")
+
+
+def insert_vehicle_batch(
+    insert_vehicles: Callable[[list[BusVehicleIn]], None],
+    vehicles: list[BusVehicleIn],
+    operator_nocs: list[str],
+    checkpoint_path: Optional[Path | str],
+):
+    """
+    Operators are only added to the checkpoint once their vehicles have been
+    committed, so an interrupted run never skips an operator it did not finish
+    """
+    if len(vehicles) > 0:
+        insert_vehicles(vehicles)
+    write_vehicle_checkpoint(checkpoint_path, operator_nocs)
+
+
+@dataclass
+class VehicleScrape:
+    inserted: int
+    failed_operators: list[str]
+
+
+def scrape_bus_vehicles(
+    operators: list[BusOperatorDetails],
+    insert_vehicles: Callable[[list[BusVehicleIn]], None],
+    checkpoint_path: Optional[Path | str],
+    base_url: str,
+    workers: int,
+    limiter: RequestLimiter,
+) -> VehicleScrape:
+    """
+    Scrape the fleets of many operators at once, inserting them in batches
+
+    An operator whose pages could not be got is left out of the checkpoint, so
+    it is tried again next time
+    """
+    get_page = functools.partial(get_soup_with_retries, limiter=limiter)
+    count = 0
+    failed: list[str] = []
+    vehicles: list[BusVehicleIn] = []
+    operator_nocs: list[str] = []
+    with ThreadPoolExecutor(workers) as executor:
+        futures = {
+            executor.submit(
+                get_bus_operator_vehicles, operator, get_page, base_url
+            ): operator
+            for operator in operators
+        }
+        for future in as_completed(futures):
+            operator = futures[future]
+            try:
+                operator_vehicles = future.result()
+            except (RuntimeError, RequestException) as e:
+                information(f"Could not get vehicles for {operator.name}: {e}")
+                failed.append(operator.national_code)
+                continue
+            information(
+                f"Retrieved {len(operator_vehicles)} vehicles "
+                f"for {operator.name}"
+            )
+            vehicles.extend(operator_vehicles)
+            operator_nocs.append(operator.national_code)
+            if len(vehicles) >= vehicle_batch_size:
+                insert_vehicle_batch(
+                    insert_vehicles, vehicles, operator_nocs, checkpoint_path
+                )
+                count = count + len(vehicles)
+                vehicles = []
+                operator_nocs = []
+    insert_vehicle_batch(
+        insert_vehicles, vehicles, operator_nocs, checkpoint_path
+    )
+    count = count + len(vehicles)
+    return VehicleScrape(count, failed)
 
 
-def populate_bus_vehicles(conn: Connection):
+def populate_bus_vehicles(
+    conn: Connection,
+    checkpoint_path: Optional[Path | str] = None,
+    base_url: str = bustimes_url,
+    workers: int = vehicle_workers,
+    limiter: Optional[RequestLimiter] = None,
+):
+    """
+    Scrape the fleets of many operators at once, within the limits of the
+    limiter, skipping any operators already in the checkpoint file
+    """
     information("Retrieving bus vehicles")
 
-    operators = get_bus_operators(conn)
-    all_operator_vehicles = []
+    finished_operators = read_vehicle_checkpoint(checkpoint_path)
+    operators = [
+        operator
+        for operator in get_bus_operators(conn)
+        if operator.national_code not in finished_operators
+    ]
+    information(
+        f"{len(finished_operators)} operators already done, "
+        f"{len(operators)} to go"
+    )
+    if limiter is None:
+        limiter = RequestLimiter(
+            vehicle_requests_per_second,
+            vehicle_request_burst,
+            vehicle_host_concurrency,
+        )
 
-    for operator in operators:
-        information(f"Populating bus vehicles for {operator.name}")
-        operator_vehicles = get_bus_operator_vehicles(operator)
-        all_operator_vehicles = all_operator_vehicles + operator_vehicles
-        sleep(1)
+    def insert_vehicles(vehicles: list[BusVehicleIn]):
+        insert_bus_vehicles(conn, vehicles)
+        conn.commit()
 
-    information("Inserting bus vehicles")
-    insert_bus_vehicles(conn, all_operator_vehicles)
-    conn.commit()
+    scrape = scrape_bus_vehicles(
+        operators, insert_vehicles, checkpoint_path, base_url, workers, limiter
+    )
+    information(f"Inserted {scrape.inserted} bus vehicles")
+    if len(scrape.failed_operators) > 0:
+        information(
+            f"Could not get vehicles for {len(scrape.failed_operators)} "
+            "operators"
+        )
 
 
 if __name__ == "__main__":
     connection_data = get_db_connection_data_from_args()
     with connect(connection_data) as conn:
-        populate_bus_vehicles(conn)
+        populate_bus_vehicles(
+            conn, get_env_variable("BUS_VEHICLES_CHECKPOINT_PATH")
+        )
@@ -1,9 +1,9 @@
 from dataclasses import dataclass
 from decimal import Decimal
-from typing import Optional
+from typing import Iterable, Optional
 
 from api.utils.database import register_type
-from psycopg import Connection
+from psycopg import AsyncConnection, Connection
 
 
 @dataclass
@@ -25,29 +25,63 @@ class BusStopData:
     longitude: Decimal
 
 
-def insert_bus_stops(conn: Connection, bus_stops: list[BusStopData]):
-    bus_stop_tuples = [
-        (
-            bus_stop.atco,
-            bus_stop.naptan,
-            bus_stop.common_name,
-            bus_stop.landmark,
-            bus_stop.street,
-            bus_stop.crossing,
-            bus_stop.indicator,
-            bus_stop.bearing,
-            bus_stop.locality,
-            bus_stop.parent_locality,
-            bus_stop.grandparent_locality,
-            bus_stop.town,
-            bus_stop.suburb,
-            bus_stop.latitude,
-            bus_stop.longitude,
-        )
-        for bus_stop in bus_stops
-    ]
-    conn.execute("SELECT * FROM InsertBusStops(%s::BusStopInData[])", [bus_stop_tuples])
+bus_stop_copy_types = [
+    "text",
+    "text",
+    "text",
+    "text",
+    "text",
+    "text",
+    "text",
+    "text",
+    "text",
+    "text",
+    "text",
+    "text",
+    "text",
+    "numeric",
+    "numeric",
+]
+
+
+def insert_bus_stops(conn: Connection, bus_stops: Iterable[BusStopData]) -> int:
+    """
+    Stream the stops into a temporary staging table with a binary copy and
+    then insert or update them all in one statement, so the stops never need
+    to be held in memory together
+    """
+    count = 0
+    conn.execute(
+        "CREATE TEMPORARY TABLE BusStopStaging OF BusStopInData ON COMMIT DROP"
+    )
+    with conn.cursor().copy(
+        "COPY BusStopStaging FROM STDIN (FORMAT BINARY)"
+    ) as copy:
+        copy.set_types(bus_stop_copy_types)
+        for bus_stop in bus_stops:
+            copy.write_row(
+                (
+                    bus_stop.atco,
+                    bus_stop.naptan,
+                    bus_stop.common_name,
+                    bus_stop.landmark,
+                    bus_stop.street,
+                    bus_stop.crossing,
+                    bus_stop.indicator,
+                    bus_stop.bearing,
+                    bus_stop.locality,
+                    bus_stop.parent_locality,
+                    bus_stop.grandparent_locality,
+                    bus_stop.town,
+                    bus_stop.suburb,
+                    bus_stop.latitude,
+                    bus_stop.longitude,
+                )
+            )
+            count = count + 1
+    conn.execute("SELECT InsertStagedBusStops()")
     conn.commit()
+    return count
 
 
 @dataclass
@@ -108,7 +142,7 @@ def register_bus_stop_details(
     )
 
 
-def register_bus_stop_details_types(conn: Connection):
+def register_bus_stop_details_types(conn: Connection | AsyncConnection):
     register_type(conn, "BusStopDetails", register_bus_stop_details)
 
 
@@ -168,5 +202,5 @@ def register_bus_call_stop_details(
     )
 
 
-def register_bus_call_stop_details_types(conn: Connection):
+def register_bus_call_stop_details_types(conn: Connection | AsyncConnection):
     register_type(conn, "BusCallStopDetails", register_bus_call_stop_details)
@@ -1,5 +1,5 @@
 from dataclasses import dataclass
-from typing import Optional
+from typing import Callable, Optional
 
 from api.data.bus.operators import (
     BusOperatorDetails,
@@ -8,7 +8,7 @@ from api.data.bus.operators import (
 from api.utils.database import register_type
 from api.utils.request import get_soup
 from bs4 import BeautifulSoup
-from psycopg import Connection
+from psycopg import AsyncConnection, Connection
 
 
 @dataclass
@@ -32,14 +32,16 @@ def string_of_bus_vehicle_in(bus_vehicle: BusVehicleIn) -> str:
 
 def insert_bus_vehicles(conn: Connection, bus_vehicles: list[BusVehicleIn]):
     bus_model_tuples: list[tuple[str]] = []
+    bus_models: set[str] = set()
     bus_vehicle_tuples: list[
         tuple[int, str, str, str, Optional[str], Optional[str], Optional[str]]
     ] = []
     for bus_vehicle in bus_vehicles:
         if (
             bus_vehicle.model is not None
-            and (bus_vehicle.model,) not in bus_model_tuples
+            and bus_vehicle.model not in bus_models
         ):
+            bus_models.add(bus_vehicle.model)
             bus_model_tuples.append((bus_vehicle.model,))
         bus_vehicle_tuples.append(
             (
@@ -92,7 +94,7 @@ def register_bus_vehicle_details(
     )
 
 
-def register_bus_vehicle_details_types(conn: Connection):
+def register_bus_vehicle_details_types(conn: Connection | AsyncConnection):
     register_bus_operator_details_types(conn)
     register_type(conn, "BusVehicleDetails", register_bus_vehicle_details)
 
@@ -101,15 +103,22 @@ def string_of_bus_vehicle_out(vehicle: BusVehicleDetails) -> str:
     return f"{vehicle.numberplate} ({vehicle.operator.name})"
 
 
-def get_bus_operator_url(operator: BusOperatorDetails) -> str:
-    return f"https://bustimes.org/operators/{operator.national_code}"
+bustimes_url = "https://bustimes.org"
+
+
+def get_bus_operator_url(
+    operator: BusOperatorDetails, base_url: str = bustimes_url
+) -> str:
+    return f"{base_url}/operators/{operator.national_code}"
 
 
 def get_bus_operator_page(
     operator: BusOperatorDetails,
+    get_page: Callable[[str], Optional[BeautifulSoup]] = get_soup,
+    base_url: str = bustimes_url,
 ) -> Optional[BeautifulSoup]:
-    url = get_bus_operator_url(operator)
-    return get_soup(url)
+    url = get_bus_operator_url(operator, base_url)
+    return get_page(url)
 
 
 bustimes_livery_css = "https://bustimes.org/liveries.1740885194.css"
@@ -121,10 +130,17 @@ name_column_title = "Name"
 
 def get_bus_operator_vehicles(
     operator: BusOperatorDetails,
+    get_page: Callable[[str], Optional[BeautifulSoup]] = get_soup,
+    base_url: str = bustimes_url,
 ) -> list[BusVehicleIn]:
-    operator_soup = get_bus_operator_page(operator)
-    if operator_soup is None:
-        return []
+    """
+    An operator page without a vehicles tab means the operator has no fleet,
+    but a page that is missing or is not an operator page raises a
+    RuntimeError, so it is not taken to mean the same
+    """
+    operator_soup = get_bus_operator_page(operator, get_page, base_url)
+    if operator_soup is None or operator_soup.select_one(".tabs") is None:
+        raise RuntimeError(f"No operator page for {operator.name}")
     tabs = operator_soup.select(".tabs li a")
     vehicle_url = None
     for tab in tabs:
@@ -134,9 +150,9 @@ def get_bus_operator_vehicles(
             break
     if vehicle_url is None:
         return []
-    vehicles_soup = get_soup(f"https://bustimes.org{vehicle_url}")
-    if vehicles_soup is None:
-        return []
+    vehicles_soup = get_page(f"{base_url}{vehicle_url}")
+    if vehicles_soup is None or vehicles_soup.select_one("table.fleet") is None:
+        raise RuntimeError(f"No vehicles page for {operator.name}")
     header_cols = vehicles_soup.select("table.fleet th")
     id_col = 0
     numberplate_col = 1
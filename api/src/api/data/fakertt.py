@@ -0,0 +1,396 @@
+import json
+import os
+import re
+import tempfile
+import threading
+
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Iterator, Optional, cast
+
+from psycopg import Connection
+
+from api.data import rtt, services
+from api.data.services import (
+    fetch_service_graph,
+    filter_services_by_time_and_stop,
+    get_service_from_graph,
+    service_graph_workers,
+)
+from api.data.stations import (
+    ShortTrainStation,
+    TrainServiceAtStation,
+    TrainStation,
+)
+from api.utils.interactive import information, message
+
+# Every fake service runs on this day
+fake_run_date = datetime(2025, 1, 1)
+
+fake_service_re = re.compile(r"^/api/v1/json/service/(\w+)/\d{4}/\d{2}/\d{2}$")
+fake_service_page_re = re.compile(r"^/service/gb-nr:(\w+)/[\d-]+/detailed$")
+
+
+def get_fake_location(
+    crs: str,
+    arr: Optional[str],
+    dep: Optional[str],
+    assocs: list[tuple[str, str]] = [],
+) -> dict:
+    location: dict = {
+        "description": f"Station {crs}",
+        "crs": crs,
+        "gbttBookedArrival": arr,
+        "gbttBookedDeparture": dep,
+        "realtimeArrival": arr,
+        "realtimeDeparture": dep,
+    }
+    if len(assocs) > 0:
+        location["associations"] = [
+            {
+                "associatedUid": uid,
+                "associatedRunDate": fake_run_date.strftime("%Y-%m-%d"),
+                "type": assoc_type,
+            }
+            for (uid, assoc_type) in assocs
+        ]
+    return location
+
+
+def get_fake_service(locations: list[dict]) -> dict:
+    return {
+        "isPassenger": True,
+        "serviceType": "train",
+        "trainIdentity": "1A00",
+        "powerType": "EMU",
+        "atocName": "Fake Trains",
+        "atocCode": "XX",
+        "origin": [{"description": locations[0]["description"]}],
+        "destination": [{"description": locations[-1]["description"]}],
+        "locations": locations,
+    }
+
+
+def get_fake_service_page(service: dict) -> str:
+    calls = [
+        f"""
+        <div class="location call">
+            <span class="name">{location["description"]}</span>
+            <span class="crs">[{location["crs"]}]</span>
+            <div class="distance">
+                <span class="miles">{i}</span>
+                <span class="chains">0</span>
+            </div>
+        </div>
+        """
+        for (i, location) in enumerate(service["locations"])
+    ]
+    return f"<html><body>{''.join(calls)}</body></html>"
+
+
+# A divides into B and C, B and C both divide into D, and B joins A again, so
+# B, C and D are each reached by more than one association; W is only the next
+# working of A, which is not followed
+diamond_services = {
+    "A": get_fake_service(
+        [
+            get_fake_location("AAA", None, "1000", [("W", "next")]),
+            get_fake_location(
+                "XXX", "1010", "1015", [("B", "divide"), ("C", "divide")]
+            ),
+            get_fake_location("ZZZ", "1100", "1105", [("B", "join")]),
+            get_fake_location("EEE", "1200", None),
+        ]
+    ),
+    "B": get_fake_service(
+        [
+            get_fake_location("XXX", None, "1016", [("A", "divide")]),
+            get_fake_location("YYY", "1030", "1031", [("D", "divide")]),
+            get_fake_location("ZZZ", "1058", None, [("A", "join")]),
+        ]
+    ),
+    "C": get_fake_service(
+        [
+            get_fake_location("XXX", None, "1017", [("A", "divide")]),
+            get_fake_location("QQQ", "1040", "1041", [("D", "divide")]),
+            get_fake_location("RRR", "1050", None),
+        ]
+    ),
+    "D": get_fake_service(
+        [
+            get_fake_location(
+                "YYY", None, "1032", [("B", "divide"), ("C", "divide")]
+            ),
+            get_fake_location("SSS", "1045", None),
+        ]
+    ),
+    "W": get_fake_service([get_fake_location("AAA", None, "1300")]),
+}
+
+# E divides into F, F divides into G and G joins E, so following each service
+# away from its parent goes round the cycle forever
+cycle_services = {
+    "E": get_fake_service(
+        [
+            get_fake_location("EEE", None, "0900"),
+            get_fake_location("FFF", "0910", "0911", [("F", "divide")]),
+            get_fake_location("GGG", "0930", None, [("G", "join")]),
+        ]
+    ),
+    "F": get_fake_service(
+        [
+            get_fake_location("FFF", None, "0912", [("E", "divide")]),
+            get_fake_location("HHH", "0920", "0921", [("G", "divide")]),
+            get_fake_location("JJJ", "0925", None),
+        ]
+    ),
+    "G": get_fake_service(
+        [
+            get_fake_location("HHH", None, "0922", [("F", "divide")]),
+            get_fake_location("GGG", "0929", None, [("E", "join")]),
+        ]
+    ),
+}
+
+
+class FakeRttServer:
+    """
+    A local stand in for the RTT API and the detailed service pages, serving a
+    fixed set of services and counting how many times each path is requested
+    """
+
+    def __init__(self, fake_services: dict[str, dict]):
+        self.fake_services = fake_services
+        self.requests: Counter[str] = Counter()
+        self.in_flight = 0
+        self.most_in_flight = 0
+        self.lock = threading.Lock()
+        fake = self
+
+        class FakeRttHandler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                with fake.lock:
+                    fake.in_flight = fake.in_flight + 1
+                    fake.most_in_flight = max(
+                        fake.most_in_flight, fake.in_flight
+                    )
+                try:
+                    fake.respond(self)
+                finally:
+                    with fake.lock:
+                        fake.in_flight = fake.in_flight - 1
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), FakeRttHandler)
+        self.url = f"http://127.0.0.1:{self.server.server_port}"
+        self.thread = threading.Thread(
+            target=self.server.serve_forever, daemon=True
+        )
+
+    def respond(self, request: BaseHTTPRequestHandler):
+        with self.lock:
+            self.requests[request.path] = self.requests[request.path] + 1
+        body: Optional[str] = None
+        content_type = "application/json"
+        service_match = fake_service_re.match(request.path)
+        page_match = fake_service_page_re.match(request.path)
+        if service_match is not None:
+            service = self.fake_services.get(service_match.group(1))
+            if service is not None:
+                body = json.dumps(service)
+        elif page_match is not None:
+            service = self.fake_services.get(page_match.group(1))
+            if service is not None:
+                body = get_fake_service_page(service)
+                content_type = "text/html"
+        if body is None:
+            request.send_response(404)
+            request.end_headers()
+            return
+        encoded = body.encode()
+        request.send_response(200)
+        request.send_header("Content-Type", content_type)
+        request.send_header("Content-Length", str(len(encoded)))
+        request.end_headers()
+        request.wfile.write(encoded)
+
+    def __enter__(self) -> "FakeRttServer":
+        self.thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@contextmanager
+def use_fake_rtt(server: FakeRttServer) -> Iterator[None]:
+    """
+    Send every service request to the fake server, without the response cache
+    and with made up credentials
+    """
+    endpoints = (
+        services.service_endpoint,
+        services.service_page_endpoint,
+        rtt.rtt_cache_path,
+    )
+    environment = {
+        key: os.environ.get(key) for key in ["RTT_USER", "RTT_PASSWORD"]
+    }
+    with tempfile.NamedTemporaryFile("w") as password_file:
+        password_file.write("password\n")
+        password_file.flush()
+        services.service_endpoint = f"{server.url}/api/v1/json/service"
+        services.service_page_endpoint = f"{server.url}/service/gb-nr"
+        rtt.rtt_cache_path = None
+        os.environ["RTT_USER"] = "fake"
+        os.environ["RTT_PASSWORD"] = password_file.name
+        try:
+            yield
+        finally:
+            (
+                services.service_endpoint,
+                services.service_page_endpoint,
+                rtt.rtt_cache_path,
+            ) = endpoints
+            for (key, value) in environment.items():
+                if value is None:
+                    os.environ.pop(key, None)
+                else:
+                    os.environ[key] = value
+
+
+class FakeStationConnection:
+    """
+    Answers the station lookups made while building a service, giving every
+    station name a crs made from it and recording which threads looked them up
+    """
+
+    def __init__(self):
+        self.threads: set[int] = set()
+
+    def execute(self, query: str, params: dict) -> "FakeStationRows":
+        self.threads.add(threading.get_ident())
+        return FakeStationRows(params["name"])
+
+
+class FakeStationRows:
+    def __init__(self, name: str):
+        self.name = name
+
+    def fetchall(self) -> list[tuple]:
+        return [(self.name, self.name[-3:], None, None)]
+
+
+def check_service_graph(
+    name: str,
+    fake_services: dict[str, dict],
+    service_id: str,
+    expected_ids: set[str],
+):
+    """
+    Fetch the graph of a service from the fake server, checking every service
+    reachable through its associations is fetched exactly once, along with its
+    page, and that the service can be built from the graph
+    """
+    with FakeRttServer(fake_services) as server, use_fake_rtt(server):
+        graph = fetch_service_graph(service_id, fake_run_date, True)
+        expected_paths = set()
+        for expected_id in expected_ids:
+            expected_paths.add(
+                services.get_service_endpoint(expected_id, fake_run_date)
+            )
+            expected_paths.add(
+                services.get_service_page_url(expected_id, fake_run_date)
+            )
+        requested = Counter(
+            {
+                f"{server.url}{path}": count
+                for (path, count) in server.requests.items()
+            }
+        )
+        repeated = [path for (path, count) in requested.items() if count > 1]
+        if len(repeated) > 0:
+            raise RuntimeError(f"{name}: fetched more than once: {repeated}")
+        if set(requested) != expected_paths:
+            raise RuntimeError(
+                f"{name}: fetched {sorted(requested)}, "
+                f"expected {sorted(expected_paths)}"
+            )
+        graph_ids = {uid for (uid, _) in graph.responses}
+        if graph_ids != expected_ids:
+            raise RuntimeError(
+                f"{name}: graph has {sorted(graph_ids)}, "
+                f"expected {sorted(expected_ids)}"
+            )
+        conn = cast(Connection, FakeStationConnection())
+        service = get_service_from_graph(
+            conn, graph, service_id, fake_run_date, soup=True
+        )
+        if service is None:
+            raise RuntimeError(f"{name}: could not build {service_id}")
+        if len(graph.building) > 0:
+            raise RuntimeError(f"{name}: services left building")
+    message(f"{name}: {len(requested)} requests, each made once")
+
+
+def check_filtered_services():
+    """
+    Filter every fake service by whether it calls at two stations, checking
+    the stations are only looked up on the calling thread and no more services
+    are fetched at once than the pool has workers
+    """
+    fake_services = diamond_services | cycle_services
+    candidates = [
+        TrainServiceAtStation(
+            service_id,
+            "1A00",
+            fake_run_date,
+            [ShortTrainStation("Station AAA", "AAA")],
+            [ShortTrainStation("Station EEE", "EEE")],
+            fake_run_date,
+            None,
+            "XX",
+            "XX",
+        )
+        for service_id in fake_services
+    ]
+    with FakeRttServer(fake_services) as server, use_fake_rtt(server):
+        fake_conn = FakeStationConnection()
+        filtered = filter_services_by_time_and_stop(
+            cast(Connection, fake_conn),
+            fake_run_date,
+            fake_run_date,
+            TrainStation("Station XXX", "XXX", 0, None),
+            TrainStation("Station ZZZ", "ZZZ", 0, None),
+            candidates,
+        )
+    filtered_ids = [service.id for service in filtered]
+    if filtered_ids != ["A", "B", "C"]:
+        raise RuntimeError(f"filter: kept {filtered_ids}, expected A, B and C")
+    if fake_conn.threads != {threading.get_ident()}:
+        raise RuntimeError("filter: stations looked up on other threads")
+    if server.most_in_flight > service_graph_workers:
+        raise RuntimeError(
+            f"filter: {server.most_in_flight} requests at once, "
+            f"expected at most {service_graph_workers}"
+        )
+    message(f"filter: at most {server.most_in_flight} requests at once")
+
+
+def check_fetched_once():
+    information("Fetching service graphs from a fake RTT server")
+    check_service_graph("diamond", diamond_services, "A", {"A", "B", "C", "D"})
+    check_service_graph("cycle", cycle_services, "E", {"E", "F", "G"})
+    check_service_graph(
+        "cycle from inside", cycle_services, "F", {"E", "F", "G"}
+    )
+    check_filtered_services()
+
+
+if __name__ == "__main__":
+    check_fetched_once()
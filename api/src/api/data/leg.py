@@ -3,7 +3,7 @@ from datetime import datetime, timedelta
 from decimal import Decimal
 from typing import Callable, Optional
 from api.user import User
-from psycopg import Connection
+from psycopg import AsyncConnection, Connection
 
 from api.utils.database import register_type
 from api.utils.times import change_timezone
@@ -360,13 +360,7 @@ def register_leg_data(
     )
 
 
-def select_legs(
-    conn: Connection,
-    user_id: int,
-    search_start: Optional[datetime] = None,
-    search_end: Optional[datetime] = None,
-    search_leg_id: Optional[int] = None,
-) -> list[ShortLeg]:
+def register_leg_types(conn: Connection | AsyncConnection):
     register_type(conn, "OutStationData", register_station_data)
     register_type(conn, "OutOperatorData", register_operator_data)
     register_type(conn, "OutBrandData", register_brand_data)
@@ -379,6 +373,16 @@ def select_legs(
     register_type(conn, "OutLegStock", register_leg_stock)
     register_type(conn, "OutLegData", register_leg_data)
 
+
+def select_legs(
+    conn: Connection,
+    user_id: int,
+    search_start: Optional[datetime] = None,
+    search_end: Optional[datetime] = None,
+    search_leg_id: Optional[int] = None,
+) -> list[ShortLeg]:
+    register_leg_types(conn)
+
     rows = conn.execute(
         "SELECT SelectLegs(%s, %s, %s, %s)",
         [user_id, search_start, search_end, search_leg_id],
@@ -387,6 +391,35 @@ def select_legs(
     return [row[0] for row in rows]
 
 
+async def select_legs_async(
+    conn: AsyncConnection,
+    user_id: int,
+    search_start: Optional[datetime] = None,
+    search_end: Optional[datetime] = None,
+    search_leg_id: Optional[int] = None,
+) -> list[ShortLeg]:
+    register_leg_types(conn)
+
+    cur = await conn.execute(
+        "SELECT SelectLegs(%s, %s, %s, %s)",
+        [user_id, search_start, search_end, search_leg_id],
+    )
+    rows = await cur.fetchall()
+
+    return [row[0] for row in rows]
+
+
+async def select_leg_version_async(conn: AsyncConnection, user_id: int) -> int:
+    """
+    The version of a user's legs, which goes up every time a leg is added
+    """
+    cur = await conn.execute("SELECT SelectLegVersion(%s)", [user_id])
+    row = await cur.fetchone()
+    if row is None or row[0] is None:
+        return 0
+    return row[0]
+
+
 def get_operator_colour_from_leg(leg: ShortLeg) -> str:
     service_key = list(leg.services.keys())[0]
     service = leg.services[service_key]
@@ -1,7 +1,7 @@
 from dataclasses import dataclass
 from datetime import datetime
 from typing import Optional
-from psycopg import Connection
+from psycopg import AsyncConnection, Connection
 from shapely import Point
 
 from api.utils.database import register_type
@@ -119,11 +119,15 @@ def get_station_points(
     return get_station_point_dict([row[0] for row in rows])
 
 
+def register_station_and_points_types(conn: Connection | AsyncConnection):
+    register_type(conn, "StationLatLon", register_station_latlon)
+    register_type(conn, "StationAndPoints", register_station_and_points)
+
+
 def get_station_points_from_crses(
     conn: Connection, stations: list[tuple[str, Optional[str]]]
 ) -> dict[str, dict[Optional[str], StationPoint]]:
-    register_type(conn, "StationLatLon", register_station_latlon)
-    register_type(conn, "StationAndPoints", register_station_and_points)
+    register_station_and_points_types(conn)
     rows = conn.execute(
         "SELECT GetStationPointsFromCrses(%s::StationCrsAndPlatform[])",
         [stations],
@@ -131,6 +135,18 @@ def get_station_points_from_crses(
     return get_station_point_dict([row[0] for row in rows])
 
 
+async def get_station_points_from_crses_async(
+    conn: AsyncConnection, stations: list[tuple[str, Optional[str]]]
+) -> dict[str, dict[Optional[str], StationPoint]]:
+    register_station_and_points_types(conn)
+    cur = await conn.execute(
+        "SELECT GetStationPointsFromCrses(%s::StationCrsAndPlatform[])",
+        [stations],
+    )
+    rows = await cur.fetchall()
+    return get_station_point_dict([row[0] for row in rows])
+
+
 def get_station_points_from_names(
     conn: Connection, stations: list[tuple[str, Optional[str]]]
 ) -> tuple[
@@ -165,3 +181,26 @@ def get_relevant_station_points(
     if platform is None or crs_points.get(platform) is None:
         return [crs_points[key] for key in crs_points.keys()]
     return [crs_points[platform]]
+
+
+def get_adjacent_station_crses(conn: Connection) -> list[tuple[str, str]]:
+    """
+    Get every pair of stations that appear as consecutive calls of a service
+    """
+    rows = conn.execute(
+        """
+        SELECT DISTINCT station_crs, next_station_crs
+        FROM (
+            SELECT
+                station_crs,
+                LEAD(station_crs) OVER (
+                    PARTITION BY service_id, run_date
+                    ORDER BY COALESCE(plan_arr, plan_dep)
+                ) AS next_station_crs
+            FROM Call
+        ) calls
+        WHERE next_station_crs IS NOT NULL
+        AND next_station_crs <> station_crs
+        """
+    ).fetchall()
+    return [(row[0], row[1]) for row in rows]
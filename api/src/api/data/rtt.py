@@ -0,0 +1,226 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Optional
+
+from api.utils.credentials import get_api_credentials
+from api.utils.environment import get_env_number_variable, get_env_variable
+from api.utils.request import make_get_request
+from api.utils.times import get_local_timezone
+
+# Responses from the RTT API are cached in this sqlite database if it is set
+rtt_cache_path = get_env_variable("RTT_CACHE_PATH")
+
+# Set to true to always ask the RTT API, while still refreshing the cache
+rtt_cache_bypass = get_env_variable("RTT_CACHE_BYPASS") == "true"
+
+# Once the cache is bigger than this many megabytes, the least recently used
+# responses are evicted until it is back under the limit
+rtt_cache_max_bytes = int(
+    get_env_number_variable("RTT_CACHE_MAX_MB", 256) * 1024 * 1024
+)
+
+# A service can run past midnight and its realtime data can still change for a
+# while after, so responses for a day only stop changing this long after it
+# starts; until then they are only kept for this many seconds
+rtt_settled_after = timedelta(days=1, hours=6)
+rtt_unsettled_ttl = 120
+
+
+@dataclass
+class RttCacheStats:
+    hits: int
+    misses: int
+    evictions: int
+    entries: int
+    size: int
+
+
+def get_rtt_expiry(run_date: datetime, now: datetime) -> Optional[float]:
+    """
+    Responses for days that have settled never expire
+    """
+    day_start = datetime.combine(
+        run_date.date(), datetime.min.time(), get_local_timezone()
+    )
+    if now >= day_start + rtt_settled_after:
+        return None
+    return now.timestamp() + rtt_unsettled_ttl
+
+
+class RttResponseCache:
+    """
+    Responses from the RTT API, stored compressed in a sqlite database so that
+    services and station boards are only fetched again when they might have
+    changed
+    """
+
+    def __init__(
+        self,
+        path: Path | str,
+        max_bytes: int = rtt_cache_max_bytes,
+        bypass: bool = False,
+    ):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.bypass = bypass
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+        self.conn: Optional[sqlite3.Connection] = None
+        self.pid: Optional[int] = None
+        with self.lock, self.get_connection() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS RttResponse (
+                    endpoint TEXT PRIMARY KEY,
+                    body BLOB NOT NULL,
+                    size INTEGER NOT NULL,
+                    expires_at REAL,
+                    accessed_at REAL NOT NULL
+                )
+                """
+            )
+            conn.execute(
+                """
+                CREATE INDEX IF NOT EXISTS RttResponseAccessed
+                ON RttResponse (accessed_at)
+                """
+            )
+
+    def get_connection(self) -> sqlite3.Connection:
+        # A sqlite connection cannot be used by a process forked from the one
+        # that opened it, so each worker process opens its own
+        if self.conn is None or self.pid != os.getpid():
+            self.conn = sqlite3.connect(self.path, check_same_thread=False)
+            self.pid = os.getpid()
+        return self.conn
+
+    def get_response(self, endpoint: str) -> Optional[dict]:
+        if self.bypass:
+            return None
+        now = time.time()
+        with self.lock, self.get_connection() as conn:
+            row = conn.execute(
+                """
+                SELECT body FROM RttResponse
+                WHERE endpoint = ?
+                AND (expires_at IS NULL OR expires_at > ?)
+                """,
+                (endpoint, now),
+            ).fetchone()
+            if row is None:
+                self.misses = self.misses + 1
+                return None
+            self.hits = self.hits + 1
+            conn.execute(
+                "UPDATE RttResponse SET accessed_at = ? WHERE endpoint = ?",
+                (now, endpoint),
+            )
+        return json.loads(zlib.decompress(row[0]))
+
+    def put_response(
+        self, endpoint: str, data: dict, expires_at: Optional[float]
+    ):
+        body = zlib.compress(json.dumps(data).encode())
+        with self.lock, self.get_connection() as conn:
+            conn.execute(
+                """
+                INSERT OR REPLACE INTO RttResponse
+                (endpoint, body, size, expires_at, accessed_at)
+                VALUES (?, ?, ?, ?, ?)
+                """,
+                (endpoint, body, len(body), expires_at, time.time()),
+            )
+            self.evict(conn)
+
+    def evict(self, conn: sqlite3.Connection):
+        """
+        Remove expired responses, then the least recently used ones until the
+        cache fits in max_bytes again
+        """
+        cursor = conn.execute(
+            "DELETE FROM RttResponse WHERE expires_at <= ?", (time.time(),)
+        )
+        self.evictions = self.evictions + cursor.rowcount
+        (size,) = conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM RttResponse"
+        ).fetchone()
+        if size <= self.max_bytes:
+            return
+        rows = conn.execute(
+            "SELECT endpoint, size FROM RttResponse ORDER BY accessed_at"
+        )
+        evicted = []
+        for (endpoint, entry_size) in rows:
+            if size <= self.max_bytes:
+                break
+            evicted.append((endpoint,))
+            size = size - entry_size
+        conn.executemany("DELETE FROM RttResponse WHERE endpoint = ?", evicted)
+        self.evictions = self.evictions + len(evicted)
+
+    def get_stats(self) -> RttCacheStats:
+        with self.lock:
+            (entries, size) = (
+                self.get_connection()
+                .execute(
+                    "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM RttResponse"
+                )
+                .fetchone()
+            )
+        return RttCacheStats(
+            self.hits, self.misses, self.evictions, entries, size
+        )
+
+    def close(self):
+        with self.lock:
+            if self.conn is not None and self.pid == os.getpid():
+                self.conn.close()
+            self.conn = None
+
+
+rtt_cache: Optional[RttResponseCache] = None
+rtt_cache_lock = threading.Lock()
+
+
+def get_rtt_cache() -> Optional[RttResponseCache]:
+    global rtt_cache
+    if rtt_cache_path is None:
+        return None
+    with rtt_cache_lock:
+        if rtt_cache is None:
+            rtt_cache = RttResponseCache(
+                rtt_cache_path, bypass=rtt_cache_bypass
+            )
+        return rtt_cache
+
+
+def get_rtt_json(endpoint: str, run_date: datetime) -> Optional[dict]:
+    """
+    Get a response from the RTT API for a service or station board on a given
+    day, from the cache if it is there and has not expired
+    """
+    cache = get_rtt_cache()
+    if cache is not None:
+        data = cache.get_response(endpoint)
+        if data is not None:
+            return data
+    rtt_credentials = get_api_credentials("RTT")
+    response = make_get_request(endpoint, rtt_credentials)
+    if response.status_code != 200:
+        return None
+    data = response.json()
+    if cache is not None:
+        now = datetime.now(get_local_timezone())
+        cache.put_response(endpoint, data, get_rtt_expiry(run_date, now))
+    return data
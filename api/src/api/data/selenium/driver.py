@@ -1,30 +1,187 @@
-from abc import abstractmethod
-from typing import Callable
+import queue
+import threading
+
+from abc import ABC, abstractmethod
+from typing import Callable, Optional
 
 from bs4 import BeautifulSoup
+from requests import RequestException
 from selenium import webdriver
+from selenium.common.exceptions import WebDriverException
 from selenium.webdriver.firefox.options import Options
 from selenium.webdriver.firefox.webdriver import WebDriver
 
+from api.utils.debug import debug_msg
+from api.utils.request import RequestLimiter, make_get_request, soupify
+
+# Seconds to wait for a page to load before giving up on the browser
+page_load_timeout = 60
+
+# A page is tried in this many browsers before giving up, in case the first
+# has crashed
+page_attempts = 2
 
-class Driver:
+
+class Driver(ABC):
     @abstractmethod
     def get_page_html(
         self, url: str, action: Callable[[WebDriver], None]
     ) -> BeautifulSoup:
         pass
 
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def start_firefox() -> WebDriver:
+    options = Options()
+    options.add_argument("--headless")
+    browser = webdriver.Firefox(options=options)
+    browser.set_page_load_timeout(page_load_timeout)
+    return browser
+
 
 class SeleniumDriver(Driver):
+    """
+    A headless browser kept open between pages, so it only starts once and
+    keeps its session and cookies
+
+    The browser is started on the first page and started again if it crashes
+    """
+
+    def __init__(self, start_browser: Callable[[], WebDriver] = start_firefox):
+        self.start_browser = start_browser
+        self.browser: Optional[WebDriver] = None
+        self.lock = threading.Lock()
+
+    def get_browser(self) -> WebDriver:
+        if self.browser is None:
+            self.browser = self.start_browser()
+        return self.browser
+
+    def quit_browser(self):
+        if self.browser is not None:
+            try:
+                self.browser.quit()
+            except WebDriverException:
+                pass
+            self.browser = None
+
+    def get_page_html(
+        self, url: str, action: Callable[[WebDriver], None]
+    ) -> BeautifulSoup:
+        with self.lock:
+            for attempt in range(0, page_attempts):
+                browser = self.get_browser()
+                try:
+                    browser.get(url)
+                    action(browser)
+                    html = browser.page_source
+                except WebDriverException as e:
+                    debug_msg(f"Browser failed on {url}, restarting: {e}")
+                    self.quit_browser()
+                    if attempt == page_attempts - 1:
+                        raise
+                    continue
+                return BeautifulSoup(html, "html.parser")
+        raise RuntimeError(f"Could not get {url}")
+
+    def close(self):
+        with self.lock:
+            self.quit_browser()
+
+
+class SeleniumDriverPool(Driver):
+    """
+    A few long lived browsers shared by threads loading many pages at once,
+    each page going to whichever browser is free
+    """
+
+    def __init__(
+        self,
+        size: int,
+        start_browser: Callable[[], WebDriver] = start_firefox,
+    ):
+        self.drivers = [SeleniumDriver(start_browser) for _ in range(size)]
+        self.free: queue.Queue[SeleniumDriver] = queue.Queue()
+        for driver in self.drivers:
+            self.free.put(driver)
+
+    def get_page_html(
+        self, url: str, action: Callable[[WebDriver], None]
+    ) -> BeautifulSoup:
+        driver = self.free.get()
+        try:
+            return driver.get_page_html(url, action)
+        finally:
+            self.free.put(driver)
+
+    def close(self):
+        for driver in self.drivers:
+            driver.close()
+
+
+class HttpDriver(Driver):
+    """
+    Fetches pages with plain requests through the shared session, for pages
+    whose content is in the html sent by the server
+
+    There is no browser, so the action is never run
+    """
+
+    def __init__(self, limiter: Optional[RequestLimiter] = None):
+        self.limiter = limiter
+
     def get_page_html(
         self, url: str, action: Callable[[WebDriver], None]
     ) -> BeautifulSoup:
-        options = Options()
-        options.add_argument("--headless")
-        driver = webdriver.Firefox(options=options)
-        driver.get(url)
-        action(driver)
-        html = driver.page_source
-        soup = BeautifulSoup(html, "html.parser")
-        driver.quit()
+        response = make_get_request(url, limiter=self.limiter)
+        if response.status_code != 200:
+            raise RuntimeError(f"Error {response.status_code} from {url}")
+        soup = soupify(response.text)
+        if soup is None:
+            raise RuntimeError(f"Could not parse {url}")
         return soup
+
+
+class FallbackDriver(Driver):
+    """
+    Loads pages with the first driver where it can be used for them, and with
+    the fallback driver for other pages or when the first fails or gives a
+    page that is not usable
+    """
+
+    def __init__(
+        self,
+        first: Driver,
+        fallback: Driver,
+        use_first: Callable[[str], bool],
+        is_usable: Callable[[str, BeautifulSoup], bool],
+    ):
+        self.first = first
+        self.fallback = fallback
+        self.use_first = use_first
+        self.is_usable = is_usable
+
+    def get_page_html(
+        self, url: str, action: Callable[[WebDriver], None]
+    ) -> BeautifulSoup:
+        if self.use_first(url):
+            try:
+                soup = self.first.get_page_html(url, action)
+                if self.is_usable(url, soup):
+                    return soup
+                debug_msg(f"Page {url} is not usable, falling back")
+            except (RuntimeError, RequestException) as e:
+                debug_msg(f"Could not get {url}, falling back: {e}")
+        return self.fallback.get_page_html(url, action)
+
+    def close(self):
+        self.first.close()
+        self.fallback.close()
@@ -1,17 +1,24 @@
 import copy
+import re
 
 from collections import deque
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    Future,
+    ThreadPoolExecutor,
+    wait,
+)
 from dataclasses import dataclass
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
 from decimal import Decimal
 from enum import Enum
-from typing import Optional
-from bs4 import BeautifulSoup, Tag
+from typing import Iterator, Optional
+from bs4 import BeautifulSoup, SoupStrainer, Tag
 from psycopg import Connection
 
 from api.utils.request import get_soup, make_get_request
-from api.utils.credentials import get_api_credentials
 from api.data.mileage import miles_and_chains_to_miles
+from api.data.rtt import get_rtt_json
 from api.data.stations import (
     ShortTrainStation,
     TrainServiceAtStation,
@@ -127,6 +134,7 @@ class ShortTrainService:
 
 
 service_endpoint = "https://api.rtt.io/api/v1/json/service"
+service_page_endpoint = "https://www.realtimetrains.co.uk/service/gb-nr"
 
 
 @dataclass
@@ -306,10 +314,54 @@ def response_to_time(
     return make_timezone_aware(new_time)
 
 
+def is_passenger_train(data: Optional[dict]) -> bool:
+    return (
+        data is not None
+        and bool(data.get("isPassenger"))
+        and data.get("serviceType") == "train"
+    )
+
+
+def is_followed_association(assoc: dict) -> bool:
+    return assoc["type"] == "divide" or assoc["type"] == "join"
+
+
+def get_association_run_date(assoc: dict) -> datetime:
+    return datetime.strptime(assoc["associatedRunDate"], "%Y-%m-%d")
+
+
+def get_association_keys(data: dict) -> list[tuple[str, datetime]]:
+    keys = []
+    for loc in data["locations"]:
+        if loc.get("crs") is None:
+            continue
+        for assoc in loc.get("associations") or []:
+            if is_followed_association(assoc):
+                keys.append(
+                    (assoc["associatedUid"], get_association_run_date(assoc))
+                )
+    return keys
+
+
+@dataclass
+class ServiceGraph:
+    """
+    The responses and page mileages of a service and every service it divides
+    from or joins with, directly or through other services, keyed by uid and
+    run date
+    """
+
+    responses: dict[tuple[str, date], Optional[dict]]
+    mileages: dict[tuple[str, date], Optional[dict[str, Optional[Decimal]]]]
+    # Services being built, so a cycle of associations is only followed once
+    building: set[tuple[str, date]]
+
+
 def response_to_call(
     conn: Connection,
+    graph: ServiceGraph,
     service_id: str,
-    service_soup: Optional[BeautifulSoup],
+    service_mileages: Optional[dict[str, Optional[Decimal]]],
     run_date: datetime,
     data: dict,
     current_uid: str,
@@ -335,20 +387,15 @@ def response_to_call(
     if assocs is not None:
         for assoc in assocs:
             assoc_uid = assoc["associatedUid"]
-            if (
-                parent_uid is None
-                or not parent_uid == assoc_uid
-                and (assoc["type"] == "divide" or assoc["type"] == "join")
-            ):
-                assoc_date = datetime.strptime(
-                    assoc["associatedRunDate"], "%Y-%m-%d"
-                )
-                if service_soup is None:
+            if not parent_uid == assoc_uid and is_followed_association(assoc):
+                assoc_date = get_association_run_date(assoc)
+                if service_mileages is None:
                     subsoup = False
                 else:
                     subsoup = True
-                associated_service = get_service_from_id(
+                associated_service = get_service_from_graph(
                     conn,
+                    graph,
                     assoc_uid,
                     assoc_date,
                     current_uid,
@@ -377,14 +424,10 @@ def response_to_call(
                                 station, associated_service, assoc_type
                             )
                         )
-    if service_soup is None:
+    if service_mileages is None:
         mileage = None
     else:
-        call_div = get_location_div_from_service_page(service_soup, station.crs)
-        if call_div is None:
-            mileage = None
-        else:
-            mileage = get_miles_and_chains_from_call_div(call_div)
+        mileage = service_mileages.get(station.crs.upper())
     return Call(
         service_id,
         run_date,
@@ -400,6 +443,98 @@ def response_to_call(
     )
 
 
+def get_service_endpoint(service_id: str, run_date: datetime) -> str:
+    return (
+        f"{service_endpoint}/{service_id}/{get_datetime_route(run_date, False)}"
+    )
+
+
+def fetch_service_data(
+    service_id: str, run_date: datetime, soup: bool
+) -> tuple[Optional[dict], Optional[dict[str, Optional[Decimal]]]]:
+    data = get_rtt_json(get_service_endpoint(service_id, run_date), run_date)
+    if soup and is_passenger_train(data):
+        mileages = get_service_page_mileages(service_id, run_date)
+    else:
+        mileages = None
+    return (data, mileages)
+
+
+# Services in service graphs are fetched this many at a time
+service_graph_workers = 8
+
+# The graphs of this many services are fetched ahead of the one being read
+service_lookup_workers = 8
+
+
+def fetch_service_graphs(
+    services: list[tuple[str, datetime]], soup: bool
+) -> Iterator[ServiceGraph]:
+    """
+    Fetch the graph of each service, fetching every distinct service in a
+    graph once and the associations of each service as soon as its response
+    arrives
+
+    Every graph is fetched in one pool, so the graphs can be read in order on
+    the calling thread while the ones after them are still being fetched
+    """
+    graphs: dict[int, ServiceGraph] = {}
+    seen: dict[int, set[tuple[str, date]]] = {}
+    pending: dict[int, int] = {}
+    futures: dict[Future, tuple[int, tuple[str, date]]] = {}
+    next_graph = 0
+    started = 0
+    with ThreadPoolExecutor(service_graph_workers) as executor:
+
+        def submit(i: int, service_id: str, run_date: datetime):
+            key = (service_id, run_date.date())
+            if key not in seen[i]:
+                seen[i].add(key)
+                future = executor.submit(
+                    fetch_service_data, service_id, run_date, soup
+                )
+                futures[future] = (i, key)
+                pending[i] = pending[i] + 1
+
+        def start_graphs():
+            nonlocal started
+            last = min(len(services), next_graph + service_lookup_workers)
+            while started < last:
+                graphs[started] = ServiceGraph({}, {}, set())
+                seen[started] = set()
+                pending[started] = 0
+                submit(started, *services[started])
+                started = started + 1
+
+        start_graphs()
+        while next_graph < len(services):
+            if pending[next_graph] == 0:
+                graph = graphs.pop(next_graph)
+                del seen[next_graph]
+                del pending[next_graph]
+                next_graph = next_graph + 1
+                start_graphs()
+                yield graph
+                continue
+            (done, _) = wait(futures, return_when=FIRST_COMPLETED)
+            for future in done:
+                (i, key) = futures.pop(future)
+                pending[i] = pending[i] - 1
+                (data, mileages) = future.result()
+                graphs[i].responses[key] = data
+                graphs[i].mileages[key] = mileages
+                if data is not None and is_passenger_train(data):
+                    for (assoc_uid, assoc_date) in get_association_keys(data):
+                        submit(i, assoc_uid, assoc_date)
+
+
+def fetch_service_graph(
+    service_id: str, run_date: datetime, soup: bool
+) -> ServiceGraph:
+    (graph,) = fetch_service_graphs([(service_id, run_date)], soup)
+    return graph
+
+
 def get_service_from_id(
     conn: Connection,
     service_id: str,
@@ -409,13 +544,47 @@ def get_service_from_id(
     act_arr: Optional[datetime] = None,
     soup: bool = False,
 ) -> Optional[TrainServiceRaw]:
-    endpoint = (
-        f"{service_endpoint}/{service_id}/{get_datetime_route(run_date, False)}"
+    graph = fetch_service_graph(service_id, run_date, soup)
+    return get_service_from_graph(
+        conn, graph, service_id, run_date, parent, plan_arr, act_arr, soup
     )
-    rtt_credentials = get_api_credentials("RTT")
-    response = make_get_request(endpoint, rtt_credentials)
-    data = response.json()
-    if data.get("isPassenger") and data.get("serviceType") == "train":
+
+
+def get_service_from_graph(
+    conn: Connection,
+    graph: ServiceGraph,
+    service_id: str,
+    run_date: datetime,
+    parent: Optional[str] = None,
+    plan_arr: Optional[datetime] = None,
+    act_arr: Optional[datetime] = None,
+    soup: bool = False,
+) -> Optional[TrainServiceRaw]:
+    key = (service_id, run_date.date())
+    if key in graph.building:
+        return None
+    graph.building.add(key)
+    try:
+        return build_service_from_graph(
+            conn, graph, service_id, run_date, parent, plan_arr, act_arr, soup
+        )
+    finally:
+        graph.building.remove(key)
+
+
+def build_service_from_graph(
+    conn: Connection,
+    graph: ServiceGraph,
+    service_id: str,
+    run_date: datetime,
+    parent: Optional[str],
+    plan_arr: Optional[datetime],
+    act_arr: Optional[datetime],
+    soup: bool,
+) -> Optional[TrainServiceRaw]:
+    key = (service_id, run_date.date())
+    data = graph.responses.get(key)
+    if data is not None and is_passenger_train(data):
         headcode = data["trainIdentity"]
         power = data.get("powerType")
         origins = [
@@ -432,15 +601,16 @@ def get_service_from_id(
         divides: list[AssociatedService] = []
         joins: list[AssociatedService] = []
         if soup:
-            service_soup = get_service_page(service_id, run_date)
+            service_mileages = graph.mileages.get(key)
         else:
-            service_soup = None
+            service_mileages = None
         for i, loc in enumerate(data["locations"]):
             if loc.get("crs") is not None:
                 call = response_to_call(
                     conn,
+                    graph,
                     service_id,
-                    service_soup,
+                    service_mileages,
                     run_date,
                     loc,
                     service_id,
@@ -510,12 +680,15 @@ def filter_services_by_time_and_stop(
     time_filtered = filter_services_by_time(earliest, latest, services)
     stop_filtered: list[TrainServiceAtStation] = []
     max_string_length = 0
-    for i, service in enumerate(time_filtered):
+    graphs = fetch_service_graphs(
+        [(service.id, service.run_date) for service in time_filtered], False
+    )
+    for i, (service, graph) in enumerate(zip(time_filtered, graphs)):
         string = f"Checking service {i}/{len(time_filtered)}: {short_string_of_service_at_station(service)}"
         max_string_length = max(max_string_length, len(string))
         information(string.ljust(max_string_length), end="\r")
-        full_service = get_service_from_id(
-            conn, service.id, service.run_date, soup=False
+        full_service = get_service_from_graph(
+            conn, graph, service.id, service.run_date, soup=False
         )
         if full_service and stops_at_station(
             full_service, origin.crs, destination.crs
@@ -527,7 +700,7 @@ def filter_services_by_time_and_stop(
 
 def get_service_page_url(id: str, service_date: datetime) -> str:
     date_string = service_date.strftime("%Y-%m-%d")
-    return f"https://www.realtimetrains.co.uk/service/gb-nr:{id}/{date_string}/detailed"
+    return f"{service_page_endpoint}:{id}/{date_string}/detailed"
 
 
 def get_service_page_url_from_service(service: TrainServiceRaw) -> str:
@@ -572,6 +745,56 @@ def get_miles_and_chains_from_call_div(
     return miles_and_chains_to_miles(miles_int, chains_int)
 
 
+# lxml builds trees much faster than the parser built into python
+service_page_parser = "lxml"
+
+crs_re = re.compile(r"^\[?([A-Z]{3})\]?$")
+
+
+def is_call_class(classes: Optional[str]) -> bool:
+    return classes is not None and "call" in classes.split()
+
+
+def get_crs_from_call_div(call_div_soup: Tag) -> Optional[str]:
+    crs_span = call_div_soup.find(class_="crs")
+    if crs_span is None:
+        return None
+    crs_match = crs_re.match(crs_span.get_text().strip())
+    if crs_match is None:
+        return None
+    return crs_match.group(1)
+
+
+def get_mileages_from_service_page(html: str) -> dict[str, Optional[Decimal]]:
+    """
+    Read the mileage of every call on a detailed service page in one pass,
+    parsing only the call divs
+
+    Each call gives the mileage to the crs in its own crs span, and a station
+    called at more than once keeps the mileage of its first call
+    """
+    soup = BeautifulSoup(
+        html,
+        service_page_parser,
+        parse_only=SoupStrainer(class_=is_call_class),
+    )
+    mileages: dict[str, Optional[Decimal]] = {}
+    for call in soup.find_all(class_="call"):
+        if isinstance(call, Tag):
+            crs = get_crs_from_call_div(call)
+            if crs is not None and crs not in mileages:
+                mileages[crs] = get_miles_and_chains_from_call_div(call)
+    return mileages
+
+
+def get_service_page_mileages(
+    service_id: str, run_date: datetime
+) -> dict[str, Optional[Decimal]]:
+    url = get_service_page_url(service_id, run_date)
+    response = make_get_request(url)
+    return get_mileages_from_service_page(response.text)
+
+
 def insert_services(conn: Connection, services: list[TrainServiceRaw]):
     service_values = []
     endpoint_values = []
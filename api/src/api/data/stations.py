@@ -1,10 +1,8 @@
 from dataclasses import dataclass
 from datetime import datetime, timedelta
-from typing import Optional
-from psycopg import Connection
+from typing import Any, Optional
+from psycopg import AsyncConnection, Connection
 
-from api.utils.request import make_get_request
-from api.utils.credentials import get_api_credentials
 from api.utils.database import (
     str_or_null_to_datetime,
 )
@@ -13,6 +11,7 @@ from api.utils.times import (
     get_hourmin_string,
     make_timezone_aware,
 )
+from api.data.rtt import get_rtt_json
 from api.data.toc import BrandData, OperatorData
 
 
@@ -71,21 +70,37 @@ def string_of_service_at_station(service: TrainServiceAtStation):
     return f"{service.headcode} {get_multiple_short_station_string(service.origins)} to {get_multiple_short_station_string(service.destinations)} plan {get_hourmin_string(service.plan_dep)} act {get_hourmin_string(service.act_dep)} ({service.operator_code})"
 
 
-def select_station_from_crs(
-    conn: Connection, crs: str
-) -> Optional[TrainStation]:
-    query = """
-        SELECT
-            station_name, operator_id, brand_id FROM Station
-        WHERE UPPER(station_crs) = UPPER(%(crs)s)
-    """
-    rows = conn.execute(query, {"crs": crs}).fetchall()
+select_station_from_crs_statement = """
+    SELECT
+        station_name, operator_id, brand_id FROM Station
+    WHERE UPPER(station_crs) = UPPER(%(crs)s)
+"""
+
+
+def station_from_crs_rows(crs: str, rows: list[Any]) -> Optional[TrainStation]:
     if len(rows) == 0 or len(rows) > 1:
         return None
     row = rows[0]
     return TrainStation(row[0], crs.upper(), row[1], row[2])
 
 
+def select_station_from_crs(
+    conn: Connection, crs: str
+) -> Optional[TrainStation]:
+    rows = conn.execute(
+        select_station_from_crs_statement, {"crs": crs}
+    ).fetchall()
+    return station_from_crs_rows(crs, rows)
+
+
+async def select_station_from_crs_async(
+    conn: AsyncConnection, crs: str
+) -> Optional[TrainStation]:
+    cur = await conn.execute(select_station_from_crs_statement, {"crs": crs})
+    rows = await cur.fetchall()
+    return station_from_crs_rows(crs, rows)
+
+
 def select_station_from_name(
     conn: Connection, name: str
 ) -> Optional[TrainStation]:
@@ -199,12 +214,8 @@ def get_services_at_station(
     endpoint = (
         f"{station_endpoint}/{station.crs}/{get_datetime_route(dt, True)}"
     )
-    rtt_credentials = get_api_credentials("RTT")
-    response = make_get_request(endpoint, rtt_credentials)
-    if not response.status_code == 200:
-        return []
-    data = response.json()
-    if data.get("services") is None:
+    data = get_rtt_json(endpoint, dt)
+    if data is None or data.get("services") is None:
         return []
     services = []
     for service in data["services"]:
@@ -247,9 +258,9 @@ class StationData:
     passes: int
 
 
-def select_stations(
-    conn: Connection, station_crs: Optional[str] = None
-) -> list[StationData]:
+def get_select_stations_statement(
+    station_crs: Optional[str] = None,
+) -> tuple[str, dict[str, str]]:
     statement = """
         SELECT
             Station.station_name, Station.station_crs,
@@ -444,7 +455,10 @@ def select_stations(
         crs_string = ""
     order_string = "ORDER BY Station.station_name ASC"
     full_statement = f"{statement}\n{where_string}\n{order_string}"
-    rows = conn.execute(full_statement, {"crs": crs_string}).fetchall()
+    return (full_statement, {"crs": crs_string})
+
+
+def station_rows_to_station_data(rows: list[Any]) -> list[StationData]:
     stations = []
     for row in rows:
         (
@@ -529,8 +543,34 @@ def select_stations(
     return stations
 
 
+def select_stations(
+    conn: Connection, station_crs: Optional[str] = None
+) -> list[StationData]:
+    (statement, params) = get_select_stations_statement(station_crs)
+    rows = conn.execute(statement, params).fetchall()
+    return station_rows_to_station_data(rows)
+
+
+async def select_stations_async(
+    conn: AsyncConnection, station_crs: Optional[str] = None
+) -> list[StationData]:
+    (statement, params) = get_select_stations_statement(station_crs)
+    cur = await conn.execute(statement, params)
+    rows = await cur.fetchall()
+    return station_rows_to_station_data(rows)
+
+
 def select_station(conn: Connection, station_crs: str) -> Optional[StationData]:
     result = select_stations(conn, station_crs)
     if result is None or len(result) != 1:
         return None
     return result[0]
+
+
+async def select_station_async(
+    conn: AsyncConnection, station_crs: str
+) -> Optional[StationData]:
+    result = await select_stations_async(conn, station_crs)
+    if len(result) != 1:
+        return None
+    return result[0]
@@ -4,7 +4,7 @@ from decimal import Decimal
 from typing import Optional
 
 from api.utils.database import register_type
-from psycopg import Connection
+from psycopg import AsyncConnection, Connection
 
 
 @dataclass
@@ -186,12 +186,7 @@ def register_stats(
     )
 
 
-def get_train_stats(
-    conn: Connection,
-    user_id: int,
-    search_start: Optional[datetime] = None,
-    search_end: Optional[datetime] = None,
-) -> Stats:
+def register_stats_types(conn: Connection | AsyncConnection):
     register_type(conn, "OutLegStat", register_leg_stat)
     register_type(conn, "OutStationStat", register_station_stat)
     register_type(conn, "OutOperatorStat", register_operator_stat)
@@ -199,9 +194,35 @@ def get_train_stats(
     register_type(conn, "OutUnitStat", register_unit_stat)
     register_type(conn, "OutStats", register_stats)
 
+
+def get_train_stats(
+    conn: Connection,
+    user_id: int,
+    search_start: Optional[datetime] = None,
+    search_end: Optional[datetime] = None,
+) -> Stats:
+    register_stats_types(conn)
+
     row = conn.execute(
         "SELECT GetStats(%s, %s, %s)", [user_id, search_start, search_end]
     ).fetchone()
     if row is None:
         raise RuntimeError("Could not get stats")
     return row[0]
+
+
+async def get_train_stats_async(
+    conn: AsyncConnection,
+    user_id: int,
+    search_start: Optional[datetime] = None,
+    search_end: Optional[datetime] = None,
+) -> Stats:
+    register_stats_types(conn)
+
+    cur = await conn.execute(
+        "SELECT GetStats(%s, %s, %s)", [user_id, search_start, search_end]
+    )
+    row = await cur.fetchone()
+    if row is None:
+        raise RuntimeError("Could not get stats")
+    return row[0]
@@ -0,0 +1,280 @@
+import random
+import sys
+import time
+import tracemalloc
+import networkx as nx
+
+from typing import Callable
+from networkx import MultiDiGraph
+
+from api.data.points import get_station_points_from_crses
+from api.network.network import (
+    add_travel_costs,
+    get_node_id_from_station_point,
+    get_travel_cost,
+    read_network_from_file,
+)
+from api.network.pathfinding import Network, search_path_between_network_nodes
+from api.network.routing import (
+    RoutingGraph,
+    find_routing_graph_paths,
+    get_routing_graph_from_network,
+    get_routing_graph_node_index,
+)
+from api.utils.database import connect_with_env
+from api.utils.interactive import information, message
+
+representative_station_pairs = [
+    ("short", "BHM", "FWY"),
+    ("medium", "BHM", "EUS"),
+    ("cross-country", "PNZ", "ABD"),
+]
+
+# Each route is found this many times when comparing edge weights, as a short
+# route takes too little time to measure once
+default_weight_repeats = 5
+
+
+def get_routing_graph_size(graph: RoutingGraph) -> int:
+    return sum(
+        array.nbytes
+        for array in [
+            graph.node_ids,
+            graph.node_x,
+            graph.node_y,
+            graph.edge_offsets,
+            graph.edge_targets,
+            graph.edge_costs,
+            graph.geometry_offsets,
+            graph.geometry_coords,
+        ]
+    )
+
+
+def time_routes(
+    network: Network, pairs: list[tuple[int, int]], astar: bool = False
+) -> float:
+    start = time.perf_counter()
+    for source_id, target_id in pairs:
+        search_path_between_network_nodes(network, source_id, target_id, astar)
+    return (time.perf_counter() - start) / len(pairs)
+
+
+def measure_memory[T](fn: Callable[[], T]) -> tuple[T, int]:
+    tracemalloc.start()
+    result = fn()
+    (current, _) = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return (result, current)
+
+
+def compare_routing_engines(network_path: str, pair_count: int, seed: int):
+    """
+    Compare the memory used by the networkx and array routing engines and the
+    mean time each takes to route between random pairs of nodes
+    """
+    information(f"Loading network from {network_path}")
+    (network, network_size) = measure_memory(
+        lambda: read_network_from_file(network_path)
+    )
+    add_travel_costs(network)
+    routing_graph = get_routing_graph_from_network(network)
+
+    nodes = sorted(network.nodes)
+    generator = random.Random(seed)
+    pairs = [tuple(generator.sample(nodes, 2)) for _ in range(pair_count)]
+
+    networkx_time = time_routes(network, pairs)
+    routing_graph_time = time_routes(routing_graph, pairs)
+
+    message(f"{len(nodes)} nodes, {network.number_of_edges()} edges")
+    message(f"networkx: {network_size / 1024 / 1024:.1f} MiB")
+    message(
+        f"arrays: {get_routing_graph_size(routing_graph) / 1024 / 1024:.1f} MiB"
+    )
+    message(f"networkx: {networkx_time * 1000:.1f} ms per route")
+    message(f"arrays: {routing_graph_time * 1000:.1f} ms per route")
+
+
+def get_station_pair_node_ids(
+    station_pairs: list[tuple[str, str, str]],
+) -> list[tuple[str, str, str, int, int]]:
+    """
+    Get the network node of the first platform of each station in each pair,
+    leaving out pairs with a station that has no points
+    """
+    with connect_with_env() as conn:
+        station_points = get_station_points_from_crses(
+            conn,
+            [
+                (crs, None)
+                for (_, origin_crs, destination_crs) in station_pairs
+                for crs in [origin_crs, destination_crs]
+            ],
+        )
+    node_pairs = []
+    for name, origin_crs, destination_crs in station_pairs:
+        origin_points = station_points.get(origin_crs)
+        destination_points = station_points.get(destination_crs)
+        if origin_points is None or destination_points is None:
+            message(
+                f"{name}: no station points for "
+                f"{origin_crs} or {destination_crs}"
+            )
+            continue
+        source_id = get_node_id_from_station_point(
+            next(iter(origin_points.values()))
+        )
+        target_id = get_node_id_from_station_point(
+            next(iter(destination_points.values()))
+        )
+        node_pairs.append(
+            (name, origin_crs, destination_crs, source_id, target_id)
+        )
+    return node_pairs
+
+
+def get_edge_weight_from_maxspeed(
+    source: int, target: int, edges: dict[int, dict]
+) -> float:
+    # How edges were weighted before travel costs were stored on them, parsing
+    # the maxspeed tag every time an edge is relaxed
+    return min(
+        get_travel_cost(float(tags["length"]), tags.get("maxspeed"))
+        for tags in edges.values()
+    )
+
+
+def time_networkx_dijkstra(
+    network: MultiDiGraph,
+    source_id: int,
+    target_id: int,
+    weight: str | Callable[[int, int, dict[int, dict]], float],
+    repeats: int,
+) -> tuple[float, float]:
+    start = time.perf_counter()
+    for _ in range(repeats):
+        (cost, _) = nx.single_source_dijkstra(
+            network, source_id, target_id, weight=weight
+        )
+    return (cost, (time.perf_counter() - start) / repeats)
+
+
+def compare_edge_weights(
+    network_path: str,
+    station_pairs: list[tuple[str, str, str]],
+    repeats: int,
+):
+    """
+    Compare the time networkx takes to route between pairs of stations with
+    Dijkstra's algorithm when the speed of each edge is parsed from its
+    maxspeed tag as it is relaxed and when the stored travel cost is used
+    """
+    information(f"Loading network from {network_path}")
+    network = read_network_from_file(network_path)
+    add_travel_costs(network)
+
+    node_pairs = get_station_pair_node_ids(station_pairs)
+    for name, origin_crs, destination_crs, source_id, target_id in node_pairs:
+        if not network.has_node(source_id) or not network.has_node(target_id):
+            message(
+                f"{name}: {origin_crs} or {destination_crs} not in network"
+            )
+            continue
+        (parsed_cost, parsed_time) = time_networkx_dijkstra(
+            network,
+            source_id,
+            target_id,
+            get_edge_weight_from_maxspeed,
+            repeats,
+        )
+        (stored_cost, stored_time) = time_networkx_dijkstra(
+            network, source_id, target_id, "travel_cost", repeats
+        )
+        if parsed_cost != stored_cost:
+            information(
+                f"{name}: costs differ, {parsed_cost} against {stored_cost}"
+            )
+        message(
+            f"{name} {origin_crs}-{destination_crs}: "
+            f"maxspeed parsed {parsed_time * 1000:.1f} ms, "
+            f"travel cost stored {stored_time * 1000:.1f} ms"
+        )
+
+
+def compare_search_modes(
+    network_path: str, station_pairs: list[tuple[str, str, str]]
+):
+    """
+    Compare the nodes expanded and the time taken by Dijkstra's algorithm and
+    A* when routing between pairs of stations, on both routing engines
+    """
+    information(f"Loading network from {network_path}")
+    network = read_network_from_file(network_path)
+    add_travel_costs(network)
+    routing_graph = get_routing_graph_from_network(network)
+
+    node_pairs = get_station_pair_node_ids(station_pairs)
+    for name, origin_crs, destination_crs, source_id, target_id in node_pairs:
+        source = get_routing_graph_node_index(routing_graph, source_id)
+        target = get_routing_graph_node_index(routing_graph, target_id)
+        if source is None or target is None:
+            message(
+                f"{name}: {origin_crs} or {destination_crs} not in network"
+            )
+            continue
+        for astar in [False, True]:
+            mode = "A*" if astar else "Dijkstra"
+            expanded = find_routing_graph_paths(
+                routing_graph, {source: 0.0}, [target], astar
+            ).expanded
+            routing_graph_time = time_routes(
+                routing_graph, [(source_id, target_id)], astar
+            )
+            networkx_time = time_routes(
+                network, [(source_id, target_id)], astar
+            )
+            message(
+                f"{name} {origin_crs}-{destination_crs} {mode}: "
+                f"{expanded} nodes expanded, "
+                f"arrays {routing_graph_time * 1000:.1f} ms, "
+                f"networkx {networkx_time * 1000:.1f} ms"
+            )
+
+
+def get_station_pair_from_arg(arg: str) -> tuple[str, str, str]:
+    (origin_crs, destination_crs) = arg.upper().split(":")
+    return (arg, origin_crs, destination_crs)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        raise RuntimeError("No benchmark specified")
+    if len(sys.argv) < 3:
+        raise RuntimeError("No network path specified")
+
+    match sys.argv[1]:
+        case "engines":
+            pair_count = int(sys.argv[3]) if len(sys.argv) > 3 else 100
+            seed = int(sys.argv[4]) if len(sys.argv) > 4 else 0
+            compare_routing_engines(sys.argv[2], pair_count, seed)
+        case "searches":
+            if len(sys.argv) > 3:
+                station_pairs = [
+                    get_station_pair_from_arg(arg) for arg in sys.argv[3:]
+                ]
+            else:
+                station_pairs = representative_station_pairs
+            compare_search_modes(sys.argv[2], station_pairs)
+        case "costs":
+            if len(sys.argv) > 3:
+                station_pairs = [
+                    get_station_pair_from_arg(arg) for arg in sys.argv[3:]
+                ]
+            else:
+                station_pairs = representative_station_pairs
+            compare_edge_weights(
+                sys.argv[2], station_pairs, default_weight_repeats
+            )
+        case _:
+            raise RuntimeError(f"Unknown benchmark {sys.argv[1]}")
@@ -0,0 +1,224 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import shapely
+
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+from networkx import MultiDiGraph
+from shapely import LineString
+
+from api.network.routing import RoutingGraph
+
+
+@dataclass
+class CachedRoute:
+    nodes: list[int]
+    geometry: Optional[LineString]
+    cost: Optional[float]
+
+
+def get_network_file_hash(path: Path | str) -> str:
+    """
+    Hash a GraphML file, or every file in a saved routing graph directory
+    """
+    if os.path.isdir(path):
+        files = sorted(file for file in Path(path).iterdir() if file.is_file())
+    else:
+        files = [Path(path)]
+    digest = hashlib.sha256()
+    for file in files:
+        with open(file, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(chunk)
+    return digest.hexdigest()
+
+
+def get_network_file_stamp(path: Path | str) -> str:
+    """
+    Identify a network file or routing graph directory by the size and
+    modification time of its files, which is much cheaper than hashing them
+    """
+    if os.path.isdir(path):
+        files = sorted(file for file in Path(path).iterdir() if file.is_file())
+    else:
+        files = [Path(path)]
+    digest = hashlib.sha256()
+    for file in files:
+        stat = file.stat()
+        stamp = f"{file.name}:{stat.st_size}:{stat.st_mtime_ns};"
+        digest.update(stamp.encode())
+    return digest.hexdigest()
+
+
+def get_search_key(
+    sources: dict[int, float], target_ids: list[int]
+) -> tuple[str, str]:
+    """
+    Key a search by its sources with their starting costs and its targets, in
+    an order that does not depend on how they were given
+
+    Adding the same cost to every source does not change the route found into
+    any target, so the costs are keyed relative to the cheapest source
+    """
+    lowest_cost = min(sources.values(), default=0.0)
+    return (
+        json.dumps(
+            sorted(
+                (source_id, cost - lowest_cost)
+                for (source_id, cost) in sources.items()
+            )
+        ),
+        json.dumps(sorted(set(target_ids))),
+    )
+
+
+class RouteCache:
+    """
+    The routes found by searches between sets of network nodes, stored in a
+    sqlite database so they survive restarts and can be built ahead of time
+    with network/precompute.py
+
+    Each search is keyed by its sources and targets, and keeps the cheapest
+    route into every target it reached. Every search is also keyed by the hash
+    of the network file it was run on, so loading a different network never
+    returns stale routes
+    """
+
+    def __init__(self, path: Path | str, network_hash: str):
+        self.path = path
+        self.network_hash = network_hash
+        self.lock = threading.Lock()
+        self.conn: Optional[sqlite3.Connection] = None
+        self.pid: Optional[int] = None
+        with self.lock, self.get_connection() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS RouteSearch (
+                    sources TEXT NOT NULL,
+                    targets TEXT NOT NULL,
+                    network_hash TEXT NOT NULL,
+                    PRIMARY KEY (sources, targets, network_hash)
+                )
+                """
+            )
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS SearchRoute (
+                    sources TEXT NOT NULL,
+                    targets TEXT NOT NULL,
+                    network_hash TEXT NOT NULL,
+                    target_id INTEGER NOT NULL,
+                    nodes TEXT NOT NULL,
+                    geometry BLOB,
+                    cost REAL,
+                    PRIMARY KEY (sources, targets, network_hash, target_id)
+                )
+                """
+            )
+
+    def get_connection(self) -> sqlite3.Connection:
+        # A sqlite connection cannot be used by a process forked from the one
+        # that opened it, so each worker process opens its own
+        if self.conn is None or self.pid != os.getpid():
+            self.conn = sqlite3.connect(self.path, check_same_thread=False)
+            self.pid = os.getpid()
+        return self.conn
+
+    def get_routes(
+        self, sources: dict[int, float], target_ids: list[int]
+    ) -> Optional[dict[int, CachedRoute]]:
+        """
+        Get the route into each target reached by a search, or None if the
+        search has not been cached yet
+        """
+        (source_key, target_key) = get_search_key(sources, target_ids)
+        params = (source_key, target_key, self.network_hash)
+        with self.lock:
+            conn = self.get_connection()
+            search = conn.execute(
+                """
+                SELECT 1 FROM RouteSearch
+                WHERE sources = ? AND targets = ? AND network_hash = ?
+                """,
+                params,
+            ).fetchone()
+            if search is None:
+                return None
+            rows = conn.execute(
+                """
+                SELECT target_id, nodes, geometry, cost FROM SearchRoute
+                WHERE sources = ? AND targets = ? AND network_hash = ?
+                """,
+                params,
+            ).fetchall()
+        routes = {}
+        for (target_id, nodes, geometry, cost) in rows:
+            if geometry is None:
+                linestring = None
+            else:
+                linestring = shapely.from_wkb(geometry)
+            routes[target_id] = CachedRoute(json.loads(nodes), linestring, cost)
+        return routes
+
+    def put_routes(
+        self,
+        sources: dict[int, float],
+        target_ids: list[int],
+        routes: dict[int, CachedRoute],
+    ):
+        (source_key, target_key) = get_search_key(sources, target_ids)
+        with self.lock, self.get_connection() as conn:
+            conn.execute(
+                """
+                INSERT OR REPLACE INTO RouteSearch
+                (sources, targets, network_hash)
+                VALUES (?, ?, ?)
+                """,
+                (source_key, target_key, self.network_hash),
+            )
+            conn.executemany(
+                """
+                INSERT OR REPLACE INTO SearchRoute (
+                    sources, targets, network_hash,
+                    target_id, nodes, geometry, cost
+                )
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                """,
+                [
+                    (
+                        source_key,
+                        target_key,
+                        self.network_hash,
+                        target_id,
+                        json.dumps(route.nodes),
+                        None
+                        if route.geometry is None
+                        else shapely.to_wkb(route.geometry),
+                        route.cost,
+                    )
+                    for (target_id, route) in routes.items()
+                ],
+            )
+
+    def close(self):
+        with self.lock:
+            if self.conn is not None and self.pid == os.getpid():
+                self.conn.close()
+            self.conn = None
+
+
+def get_route_cache(
+    network: MultiDiGraph | RoutingGraph,
+) -> Optional[RouteCache]:
+    return network.graph.get("route_cache")
+
+
+def set_route_cache(
+    network: MultiDiGraph | RoutingGraph, route_cache: RouteCache
+):
+    network.graph["route_cache"] = route_cache
@@ -6,14 +6,12 @@ from bs4 import BeautifulSoup
 from dataclasses import dataclass
 from datetime import datetime, timedelta
 from decimal import Decimal
-from networkx import MultiDiGraph
 from psycopg import Connection
 from pathlib import Path
 from typing import Optional
 from pydantic import Field
 from shapely import LineString, Point
 
-from api.utils.database import connect_with_env
 from api.data.leg import (
     ShortLeg,
     ShortLegCall,
@@ -32,8 +30,10 @@ from api.network.network import (
     merge_linestrings,
 )
 from api.network.pathfinding import (
+    Network,
     find_shortest_path_between_stations,
     get_linestring_for_leg,
+    get_network_node_coordinates,
 )
 
 
@@ -313,7 +313,7 @@ def get_leg_map_from_gml_file(leg_file: str | Path) -> str:
 
 
 def get_leg_line_for_leg(
-    network: MultiDiGraph,
+    network: Network,
     leg: ShortLeg,
     station_points: dict[str, dict[Optional[str], StationPoint]],
 ) -> Optional[LegLine]:
@@ -333,7 +333,7 @@ def get_leg_line_for_leg(
 
 
 def get_leg_line_for_leg_calls(
-    network: MultiDiGraph,
+    network: Network,
     leg_data: list[ShortLegCall],
     station_points: dict[str, dict[Optional[str], StationPoint]],
 ) -> Optional[LegLine]:
@@ -368,7 +368,7 @@ def get_leg_line_for_leg_calls(
 
 
 def get_leg_lines_for_leg_data(
-    network: MultiDiGraph,
+    network: Network,
     legs: list[list[ShortLegCall]],
     station_points: dict[str, dict[Optional[str], StationPoint]],
 ) -> list[LegLine]:
@@ -381,7 +381,7 @@ def get_leg_lines_for_leg_data(
 
 
 def get_leg_lines_for_legs(
-    network: MultiDiGraph,
+    network: Network,
     legs: list[ShortLeg],
     station_points: dict[str, dict[Optional[str], StationPoint]],
 ) -> list[LegLine]:
@@ -394,7 +394,7 @@ def get_leg_lines_for_legs(
 
 
 def get_leg_map_page(
-    network: MultiDiGraph,
+    network: Network,
     conn: Connection,
     user_id: int,
     text_type: MarkerTextType,
@@ -403,11 +403,28 @@ def get_leg_map_page(
     search_leg_id: Optional[int] = None,
 ) -> str:
     legs = select_legs(conn, user_id, search_start, search_end, search_leg_id)
-    stations = []
+    station_points = get_station_points_from_crses(
+        conn, get_stations_for_legs(legs)
+    )
+    return get_leg_map_page_from_legs(network, legs, station_points, text_type)
+
+
+def get_stations_for_legs(
+    legs: list[ShortLeg],
+) -> list[tuple[str, Optional[str]]]:
+    stations: set[tuple[str, Optional[str]]] = set()
     for leg in legs:
         for call in leg.calls:
-            stations.append((call.station.crs, call.platform))
-    station_points = get_station_points_from_crses(conn, stations)
+            stations.add((call.station.crs, call.platform))
+    return list(stations)
+
+
+def get_leg_map_page_from_legs(
+    network: Network,
+    legs: list[ShortLeg],
+    station_points: dict[str, dict[Optional[str], StationPoint]],
+    text_type: MarkerTextType,
+) -> str:
     leg_lines = get_leg_lines_for_legs(network, legs, station_points)
     html = get_leg_map([], leg_lines, text_type)
     return html
@@ -421,7 +438,7 @@ class LegData:
 
 
 def get_leg_map_page_from_leg_data(
-    network: MultiDiGraph, legs: list[LegData]
+    network: Network, conn: Connection, legs: list[LegData]
 ) -> str:
     stations = set()
     for leg in legs:
@@ -430,10 +447,9 @@ def get_leg_map_page_from_leg_data(
         if leg.via is not None:
             for via_station in leg.via:
                 stations.add((via_station, None))
-    with connect_with_env() as conn:
-        (name_to_station_dict, station_points) = get_station_points_from_names(
-            conn, list(stations)
-        )
+    (name_to_station_dict, station_points) = get_station_points_from_names(
+        conn, list(stations)
+    )
     base_leg_data: list[list[ShortLegCall]] = []
     for leg in legs:
         board_station = name_to_station_dict[leg.board_station]
@@ -541,7 +557,7 @@ def short_legs_to_short_legs_with_geometries(
 
 
 def get_short_leg_with_geometry(
-    network: MultiDiGraph,
+    network: Network,
     leg: ShortLeg,
     station_points: dict[str, dict[str | None, StationPoint]],
 ) -> ShortLegWithGeometry:
@@ -562,7 +578,9 @@ def get_short_leg_with_geometry(
         for i, leg_call in enumerate(leg.calls):
             station_point = points[i]
             station_point_id = get_node_id_from_station_point(station_point)
-            station_node = network.nodes[station_point_id]
+            (station_x, station_y) = get_network_node_coordinates(
+                network, station_point_id
+            )
             calls_with_geometry.append(
                 ShortLegCallWithGeometry(
                     leg_call.station,
@@ -574,10 +592,7 @@ def get_short_leg_with_geometry(
                     leg_call.associated_service,
                     leg_call.leg_stock,
                     leg_call.mileage,
-                    (
-                        Decimal(station_node["x"]),
-                        Decimal(station_node["y"]),
-                    ),
+                    (Decimal(station_x), Decimal(station_y)),
                 )
             )
     return ShortLegWithGeometry(
@@ -594,13 +609,21 @@ def get_short_leg_with_geometry(
 
 
 def get_short_legs_with_geometries(
-    conn: Connection, network: MultiDiGraph, legs: list[ShortLeg]
+    conn: Connection, network: Network, legs: list[ShortLeg]
+) -> list[ShortLegWithGeometry]:
+    station_points = get_station_points_from_crses(
+        conn, get_stations_for_legs(legs)
+    )
+    return get_short_legs_with_geometries_from_station_points(
+        network, legs, station_points
+    )
+
+
+def get_short_legs_with_geometries_from_station_points(
+    network: Network,
+    legs: list[ShortLeg],
+    station_points: dict[str, dict[Optional[str], StationPoint]],
 ) -> list[ShortLegWithGeometry]:
-    stations: set[tuple[str, Optional[str]]] = set()
-    for leg in legs:
-        for call in leg.calls:
-            stations.add((call.station.crs, call.platform))
-    station_points = get_station_points_from_crses(conn, list(stations))
     legs_with_geometries: list[ShortLegWithGeometry] = []
     for leg in legs:
         legs_with_geometries.append(
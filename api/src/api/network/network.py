@@ -1,23 +1,40 @@
 from api.data.points import StationPoint, string_of_station_point
+import math
+import re
 import shapely
 import networkx as nx
+import numpy as np
 import osmnx as ox
 
 from dataclasses import dataclass
 from pathlib import Path
 from typing import Optional, TypedDict
 from osmnx import settings as oxsettings
+from pyproj import Transformer
 from networkx import MultiDiGraph
 from shapely import LineString, Point
 from shapely import geometry, ops
 from geopandas import GeoDataFrame
 
 from api.data.leg import ShortLeg
+from api.utils.interactive import information
 
 coordinate_precision = 0.000001
 wgs84 = "EPSG:4326"
 osgb36 = "EPSG:27700"
 
+# Speed assumed for edges without a usable maxspeed tag, in the units of the
+# tag (mph on the GB network)
+default_max_speed = 100
+
+# The radius osmnx uses when it computes edge lengths, in metres
+earth_radius = 6371009
+
+# Built once, as creating a transformer is much slower than using one
+osgb36_to_wgs84_transformer = Transformer.from_crs(
+    osgb36, wgs84, always_xy=True
+)
+
 oxsettings.useful_tags_node.append("name")
 oxsettings.useful_tags_way.append("electrified")
 
@@ -75,6 +92,20 @@ def wgs84_to_osgb36_point(point: Point) -> Point:
     return projection
 
 
+def wgs84_to_osgb36_points(points: list[Point]) -> list[Point]:
+    """
+    Project many points in one go, rather than one projection for each
+    """
+    if len(points) == 0:
+        return []
+    projection = ox.projection.project_geometry(
+        geometry.MultiPoint(points), crs=wgs84, to_crs=osgb36
+    )[0]
+    if not isinstance(projection, geometry.MultiPoint):
+        raise RuntimeError("Projected points to not points")
+    return list(projection.geoms)
+
+
 def osgb36_to_wgs84_point(point: Point) -> Point:
     projection = ox.projection.project_geometry(
         point, crs=osgb36, to_crs=wgs84
@@ -84,6 +115,19 @@ def osgb36_to_wgs84_point(point: Point) -> Point:
     return projection
 
 
+def osgb36_to_wgs84_coords(
+    eastings: np.ndarray, northings: np.ndarray
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Project many points in one call, giving the same coordinates as projecting
+    each of them with osgb36_to_wgs84_point
+    """
+    (longitudes, latitudes) = osgb36_to_wgs84_transformer.transform(
+        eastings, northings
+    )
+    return (longitudes, latitudes)
+
+
 def merge_linestrings(line_strings: list[LineString]) -> LineString:
     multi_line = geometry.MultiLineString(line_strings)
     line = ops.linemerge(multi_line)
@@ -92,6 +136,58 @@ def merge_linestrings(line_strings: list[LineString]) -> LineString:
     return line
 
 
+def get_max_speed(max_speed_value: Optional[str | list[str]]) -> int:
+    """
+    Edges on more than one way can have a list of speeds, which may also have
+    been flattened into a single string when the network was saved
+    """
+    if max_speed_value is None:
+        return default_max_speed
+    if isinstance(max_speed_value, str):
+        max_speed_value = [max_speed_value]
+    speeds = [
+        int(speed)
+        for value in max_speed_value
+        for speed in re.findall(r"\d+", value)
+        if int(speed) > 0
+    ]
+    return max(speeds, default=default_max_speed)
+
+
+def get_travel_cost(
+    length: float, max_speed_value: Optional[str | list[str]]
+) -> float:
+    return length / get_max_speed(max_speed_value)
+
+
+def add_travel_costs(network: MultiDiGraph):
+    """
+    Store the cost of traversing each edge as a float so that routing can use
+    a plain attribute lookup, and the highest speed on the network so that
+    routing can bound the cost of reaching a node
+    """
+    network_max_speed = 0
+    for _, _, tags in network.edges(data=True):
+        max_speed = get_max_speed(tags.get("maxspeed"))
+        tags["travel_cost"] = float(tags["length"]) / max_speed
+        network_max_speed = max(network_max_speed, max_speed)
+    network.graph["max_speed"] = network_max_speed or default_max_speed
+
+
+def get_great_circle_distance(
+    source_x: float, source_y: float, target_x: float, target_y: float
+) -> float:
+    source_lat = math.radians(source_y)
+    target_lat = math.radians(target_y)
+    half_lat = (target_lat - source_lat) / 2
+    half_lon = math.radians(target_x - source_x) / 2
+    h = (
+        math.sin(half_lat) ** 2
+        + math.cos(source_lat) * math.cos(target_lat) * math.sin(half_lon) ** 2
+    )
+    return 2 * earth_radius * math.asin(math.sqrt(min(1, h)))
+
+
 class EdgeTags(TypedDict):
     osmid: list[int]
     maxspeed: list[str]
@@ -104,6 +200,7 @@ class EdgeTags(TypedDict):
     bridge: list[str]
     geometry: LineString
     electrified: str
+    travel_cost: float
 
 
 @dataclass
@@ -192,6 +289,104 @@ def remove_edge(network: MultiDiGraph, source: int | str, target: int | str):
         network.remove_edge(source, target)
 
 
+def get_edge_geometry(network: MultiDiGraph, edge: EdgeDetails) -> LineString:
+    if edge.tags.get("geometry") is not None:
+        return edge.tags["geometry"]
+    source = network.nodes[edge.source]
+    target = network.nodes[edge.target]
+    return LineString(
+        [Point(source["x"], source["y"]), Point(target["x"], target["y"])]
+    )
+
+
+def snap_node_to_edge(
+    network: MultiDiGraph, edge: EdgeDetails, projected_point: Point, id: int
+) -> Optional[int]:
+    """
+    Split the edge at the point on it closest to the projected point, joining
+    both halves to a new node with the given id
+
+    If that point is on one of the endpoints of the edge, the edge is left
+    alone and the endpoint is returned so that it can be relabelled instead
+    """
+    source = network.nodes[edge.source]
+    target = network.nodes[edge.target]
+    source_point = Point(source["x"], source["y"])
+    target_point = Point(target["x"], target["y"])
+    edge_geometry = get_edge_geometry(network, edge)
+
+    point_on_edge = get_nearest_point_on_linestring(
+        projected_point, edge_geometry
+    )
+
+    source_distance = shapely.distance(point_on_edge, source_point)
+    target_distance = shapely.distance(point_on_edge, target_point)
+
+    if source_distance < 0.001:
+        return edge.source
+    if target_distance < 0.001:
+        return edge.target
+
+    (first_segment, second_segment) = split_linestring_at_point(
+        edge_geometry, point_on_edge
+    )
+    network.add_node(
+        id,
+        id=id,
+        x=round(point_on_edge.x, 16),
+        y=round(point_on_edge.y, 16),
+    )
+    remove_edge(network, edge.source, edge.target)
+    remove_edge(network, edge.target, edge.source)
+    if first_segment.coords[0] != source_point:
+        first_segment = append_to_linestring(first_segment, point_on_edge)
+    network.add_edge(
+        edge.source,
+        id,
+        geometry=first_segment,
+        length=first_segment.length,
+        electrified=edge.tags.get("electrified"),
+        maxspeed=edge.tags.get("maxspeed"),
+        travel_cost=get_travel_cost(
+            first_segment.length, edge.tags.get("maxspeed")
+        ),
+    )
+    network.add_edge(
+        id,
+        edge.source,
+        geometry=first_segment.reverse(),
+        length=first_segment.length,
+        electrified=edge.tags.get("electrified"),
+        maxspeed=edge.tags.get("maxspeed"),
+        travel_cost=get_travel_cost(
+            first_segment.length, edge.tags.get("maxspeed")
+        ),
+    )
+    network.add_edge(
+        id,
+        edge.target,
+        geometry=second_segment,
+        length=second_segment.length,
+        electrified=edge.tags.get("electrified"),
+        maxspeed=edge.tags.get("maxspeed"),
+        travel_cost=get_travel_cost(
+            second_segment.length, edge.tags.get("maxspeed")
+        ),
+    )
+    network.add_edge(
+        edge.target,
+        id,
+        geometry=second_segment.reverse(),
+        length=second_segment.length,
+        electrified=edge.tags.get("electrified"),
+        maxspeed=edge.tags.get("maxspeed"),
+        travel_cost=get_travel_cost(
+            second_segment.length, edge.tags.get("maxspeed")
+        ),
+    )
+    return None
+
+
 def insert_node_to_network(
     network: MultiDiGraph, point: Point, id: int, project_network: bool = True
 ) -> MultiDiGraph:
@@ -207,84 +402,112 @@ def insert_node_to_network(
     edge = get_closest_edge_on_network_to_point(
         projected_network, projected_point
     )
+    endpoint = snap_node_to_edge(projected_network, edge, projected_point, id)
+    if endpoint is not None:
+        projected_network = nx.relabel_nodes(projected_network, {endpoint: id})
 
-    source = projected_network.nodes[edge.source]
-    target = projected_network.nodes[edge.target]
-    source_point = Point(source["x"], source["y"])
-    target_point = Point(target["x"], target["y"])
+    if project_network:
+        return ox.project_graph(projected_network, to_crs=wgs84)
+    return projected_network
 
-    if edge.tags.get("geometry") is not None:
-        edge_geometry = edge.tags["geometry"]
-    else:
-        edge_geometry = LineString([source_point, target_point])
 
-    point_on_edge = get_nearest_point_on_linestring(
-        projected_point, edge_geometry
+def get_split_edge(
+    network: MultiDiGraph,
+    split_edges: dict[tuple[int, int], list[int]],
+    source: int,
+    target: int,
+    projected_point: Point,
+) -> EdgeDetails:
+    """
+    Find the part of an edge of the original network closest to a point, once
+    the edge may have been split by earlier stations
+    """
+    key = (min(source, target), max(source, target))
+    nodes = split_edges.get(key)
+    if nodes is None:
+        return get_edge_from_endpoints(network, source, target)
+    if source != key[0]:
+        nodes = list(reversed(nodes))
+    parts = [
+        get_edge_from_endpoints(network, nodes[i], nodes[i + 1])
+        for i in range(0, len(nodes) - 1)
+    ]
+    return min(
+        parts,
+        key=lambda part: shapely.distance(
+            projected_point, get_edge_geometry(network, part)
+        ),
     )
 
-    source_distance = shapely.distance(point_on_edge, source_point)
-    target_distance = shapely.distance(point_on_edge, target_point)
 
-    if source_distance < 0.001:
-        projected_network = nx.relabel_nodes(
-            projected_network, {edge.source: id}
-        )
-    elif target_distance < 0.001:
-        projected_network = nx.relabel_nodes(
-            projected_network, {edge.target: id}
-        )
-    else:
-        (first_segment, second_segment) = split_linestring_at_point(
-            edge_geometry, point_on_edge
-        )
-        projected_network.add_node(
-            id,
-            id=id,
-            x=round(point_on_edge.x, 16),
-            y=round(point_on_edge.y, 16),
-        )
-        remove_edge(projected_network, edge.source, edge.target)
-        remove_edge(projected_network, edge.target, edge.source)
-        if first_segment.coords[0] != source_point:
-            first_segment = append_to_linestring(first_segment, point_on_edge)
-        projected_network.add_edge(
-            edge.source,
-            id,
-            geometry=first_segment,
-            length=first_segment.length,
-            electrified=edge.tags.get("electrified"),
-            maxspeed=edge.tags.get("maxspeed"),
+def insert_station_points_to_network(
+    projected_network: MultiDiGraph, stations: list[StationPoint]
+) -> MultiDiGraph:
+    """
+    Insert every station into a network projected to osgb36 at once
+
+    The nearest edge to every station is found in a single query of a spatial
+    index built over the edges of the network, and an edge that more than one
+    station snaps to is split once for each of them in turn, so the stations
+    end up where inserting them one by one would put them
+    """
+    node_ids: list[int] = []
+    points_to_insert: list[StationPoint] = []
+    for station in stations:
+        node_id = get_node_id_from_station_point(station)
+        if not projected_network.has_node(node_id) and node_id not in node_ids:
+            node_ids.append(node_id)
+            points_to_insert.append(station)
+    if len(points_to_insert) == 0:
+        return projected_network
+
+    projected_points = wgs84_to_osgb36_points(
+        [station.point for station in points_to_insert]
+    )
+    edges = list(projected_network.edges(keys=True))
+    edge_geometries = [
+        get_edge_geometry(
+            projected_network,
+            EdgeDetails(source, target, projected_network[source][target][key]),
         )
-        projected_network.add_edge(
-            id,
-            edge.source,
-            geometry=first_segment.reverse(),
-            length=first_segment.length,
-            electrified=edge.tags.get("electrified"),
-            maxspeed=edge.tags.get("maxspeed"),
+        for (source, target, key) in edges
+    ]
+    (point_indices, edge_indices) = shapely.STRtree(
+        edge_geometries
+    ).query_nearest(projected_points, all_matches=False)
+    nearest_edges = dict(zip(point_indices.tolist(), edge_indices.tolist()))
+
+    # The nodes along each edge of the original network that has been split,
+    # keyed by its endpoints in ascending order
+    split_edges: dict[tuple[int, int], list[int]] = {}
+    relabelled_nodes: dict[int, int] = {}
+    for i, station in enumerate(points_to_insert):
+        information(
+            f"[{i + 1}/{len(points_to_insert)}] "
+            f"Inserting {string_of_station_point(station)}"
         )
-        if second_segment.coords[-1] != target_point:
-            first_segment = prepend_to_linestring(second_segment, point_on_edge)
-        projected_network.add_edge(
-            id,
-            edge.target,
-            geometry=second_segment,
-            length=second_segment.length,
-            electrified=edge.tags.get("electrified"),
-            maxspeed=edge.tags.get("maxspeed"),
+        (source, target, _) = edges[nearest_edges[i]]
+        edge = get_split_edge(
+            projected_network,
+            split_edges,
+            source,
+            target,
+            projected_points[i],
         )
-        projected_network.add_edge(
-            edge.target,
-            id,
-            geometry=second_segment.reverse(),
-            length=second_segment.length,
-            electrified=edge.tags.get("electrified"),
-            maxspeed=edge.tags.get("maxspeed"),
+        endpoint = snap_node_to_edge(
+            projected_network, edge, projected_points[i], node_ids[i]
         )
+        if endpoint is not None:
+            relabelled_nodes[endpoint] = node_ids[i]
+        else:
+            key = (min(source, target), max(source, target))
+            nodes = split_edges.setdefault(key, list(key))
+            position = max(nodes.index(edge.source), nodes.index(edge.target))
+            nodes.insert(position, node_ids[i])
 
-    if project_network:
-        return ox.project_graph(projected_network, to_crs=wgs84)
-    return projected_network
+    if len(relabelled_nodes) == 0:
+        return projected_network
+    return nx.relabel_nodes(projected_network, relabelled_nodes)
 
 
 def insert_nodes_to_network(
@@ -292,15 +515,16 @@ def insert_nodes_to_network(
     stations: list[StationPoint],
     project_network: bool = True,
 ) -> MultiDiGraph:
-    for station in stations:
-        print(f"Inserting {string_of_station_point(station)}")
-        network = insert_node_to_network(
-            network,
-            station.point,
-            get_node_id_from_station_point(station),
-            project_network=project_network,
-        )
-    return network
+    if project_network:
+        projected_network = ox.project_graph(network, to_crs=osgb36)
+    else:
+        projected_network = network
+    projected_network = insert_station_points_to_network(
+        projected_network, stations
+    )
+    if project_network:
+        return ox.project_graph(projected_network, to_crs=wgs84)
+    return projected_network
 
 
 def insert_node_dict_to_network(
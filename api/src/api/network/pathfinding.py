@@ -1,6 +1,6 @@
 from api.data.services import Call
+import functools
 import networkx as nx
-import shapely
 
 from decimal import Decimal
 from typing import Optional
@@ -9,44 +9,40 @@ from shapely import LineString, Point
 
 from api.data.leg import ShortLeg, ShortLegCall, short_leg_call_to_point_times
 from api.data.points import StationPoint, get_relevant_station_points
+from api.network.cache import CachedRoute, get_route_cache
 from api.network.network import (
     get_edge_from_endpoints,
     get_node_id_from_station_point,
-    insert_node_to_network,
     merge_linestrings,
 )
+from api.network.routing import (
+    RoutingGraph,
+    find_routing_graph_paths,
+    get_routing_graph_node_coordinates,
+    get_routing_graph_node_index,
+    get_routing_graph_path_edges,
+    get_routing_graph_path_linestring,
+    get_routing_graph_path_node_ids,
+)
+from api.network.search import get_straight_line_heuristic, search_network
 
+type Network = MultiDiGraph | RoutingGraph
 
-def get_shortest_linestring(
-    linestrings: list[tuple[StationPoint, StationPoint, LineString]]
-) -> Optional[tuple[StationPoint, StationPoint, LineString]]:
-    return min(
-        linestrings,
-        default=None,
-        key=lambda linestring: shapely.length(linestring[2]),
-    )
 
-
-def get_edge_weight(source, target, edge_dict) -> float:
-    if edge_dict[0].get("maxspeed") is None:
-        max_speed = 100
-    else:
-        max_speed_value = edge_dict[0]["maxspeed"]
-        if isinstance(max_speed_value, str):
-            max_speed = int(max_speed_value.split(" ")[0])
-        else:
-            max_speed = max(
-                [int(string.split(" ")[0]) for string in max_speed_value]
-            )
-    return edge_dict[0]["length"] / max_speed
+def get_network_node_coordinates(
+    network: Network, node_id: int
+) -> tuple[float, float]:
+    match network:
+        case RoutingGraph():
+            return get_routing_graph_node_coordinates(network, node_id)
+        case _:
+            node = network.nodes[node_id]
+            return (node["x"], node["y"])
 
 
-def find_path_betwen_network_nodes(
-    network: MultiDiGraph, source_id: int, target_id: int
+def get_linestring_for_path(
+    network: MultiDiGraph, path: list[int]
 ) -> Optional[LineString]:
-    path = nx.shortest_path(
-        network, source_id, target_id, weight=get_edge_weight
-    )
     line_strings = []
     for i in range(0, len(path) - 1):
         source_node = path[i]
@@ -78,64 +74,309 @@ def find_path_betwen_network_nodes(
         return None
 
 
+def get_network_neighbours(
+    network: MultiDiGraph, node_id: int
+) -> list[tuple[int, float]]:
+    return [
+        (neighbour, min(edge["travel_cost"] for edge in edges.values()))
+        for (neighbour, edges) in network.adj[node_id].items()
+    ]
+
+
+def search_path_with_networkx(
+    network: MultiDiGraph, source_ids: list[int], target_id: int, astar: bool
+) -> list[tuple[list[int], float]]:
+    try:
+        if astar and len(source_ids) == 1:
+            heuristic = get_straight_line_heuristic(
+                [target_id],
+                functools.partial(get_network_node_coordinates, network),
+                network.graph["max_speed"],
+            )
+            path = nx.astar_path(
+                network,
+                source_ids[0],
+                target_id,
+                heuristic=lambda node, _: heuristic(node),
+                weight="travel_cost",
+            )
+            return [(path, nx.path_weight(network, path, "travel_cost"))]
+        (cost, path) = nx.multi_source_dijkstra(
+            network, set(source_ids), target_id, weight="travel_cost"
+        )
+        return [(path, cost)]
+    except nx.NetworkXNoPath:
+        return []
+
+
+def search_paths_between_networkx_nodes(
+    network: MultiDiGraph,
+    sources: dict[int, float],
+    target_ids: list[int],
+    astar: bool = False,
+    all_targets: bool = False,
+) -> dict[int, CachedRoute]:
+    """
+    A route to a single target from sources that all start with the same cost
+    is found by networkx itself; networkx cannot give each source its own
+    starting cost or stop at the first of several targets, so other searches
+    go through the shared search
+    """
+    sources = {
+        source_id: cost
+        for (source_id, cost) in sources.items()
+        if network.has_node(source_id)
+    }
+    target_ids = [
+        target_id for target_id in target_ids if network.has_node(target_id)
+    ]
+    if len(sources) == 0 or len(target_ids) == 0:
+        return {}
+    if len(target_ids) == 1 and len(set(sources.values())) == 1:
+        paths = search_path_with_networkx(
+            network, list(sources.keys()), target_ids[0], astar
+        )
+    else:
+        if astar:
+            heuristic = get_straight_line_heuristic(
+                target_ids,
+                functools.partial(get_network_node_coordinates, network),
+                network.graph["max_speed"],
+            )
+        else:
+            heuristic = None
+        search = search_network(
+            sources,
+            target_ids,
+            functools.partial(get_network_neighbours, network),
+            heuristic,
+            all_targets,
+        )
+        paths = [
+            (path.nodes, path.cost - sources[path.nodes[0]])
+            for path in search.paths.values()
+        ]
+    return {
+        nodes[-1]: CachedRoute(
+            nodes, get_linestring_for_path(network, nodes), cost
+        )
+        for (nodes, cost) in paths
+    }
+
+
+def search_paths_between_routing_graph_nodes(
+    graph: RoutingGraph,
+    sources: dict[int, float],
+    target_ids: list[int],
+    astar: bool = False,
+    all_targets: bool = False,
+) -> dict[int, CachedRoute]:
+    source_indices = {}
+    for source_id, cost in sources.items():
+        source = get_routing_graph_node_index(graph, source_id)
+        if source is not None:
+            source_indices[source] = cost
+    target_indices = []
+    for target_id in target_ids:
+        target = get_routing_graph_node_index(graph, target_id)
+        if target is not None:
+            target_indices.append(target)
+    search = find_routing_graph_paths(
+        graph, source_indices, target_indices, astar, all_targets
+    )
+    routes = {}
+    for path in search.paths.values():
+        node_ids = get_routing_graph_path_node_ids(graph, path.nodes)
+        edges = get_routing_graph_path_edges(graph, path.nodes)
+        routes[node_ids[-1]] = CachedRoute(
+            node_ids,
+            get_routing_graph_path_linestring(graph, edges),
+            path.cost - source_indices[path.nodes[0]],
+        )
+    return routes
+
+
+def search_paths_between_network_nodes(
+    network: Network,
+    sources: dict[int, float],
+    target_ids: list[int],
+    astar: bool = False,
+    all_targets: bool = False,
+) -> dict[int, CachedRoute]:
+    """
+    Search once from all the sources, each starting with the given cost, and
+    return the route into each target that was reached, keyed by the target
+
+    Only the cheapest target is reached unless all_targets is set, and the
+    search is guided towards the targets by A* if astar is set. The cost of a
+    route does not include the starting cost of its source
+    """
+    match network:
+        case RoutingGraph():
+            return search_paths_between_routing_graph_nodes(
+                network, sources, target_ids, astar, all_targets
+            )
+        case _:
+            return search_paths_between_networkx_nodes(
+                network, sources, target_ids, astar, all_targets
+            )
+
+
+def search_path_between_network_nodes(
+    network: Network, source_id: int, target_id: int, astar: bool = False
+) -> CachedRoute:
+    routes = search_paths_between_network_nodes(
+        network, {source_id: 0.0}, [target_id], astar
+    )
+    return routes.get(target_id, CachedRoute([], None, None))
+
+
+def get_cheapest_route(
+    sources: dict[int, float], routes: dict[int, CachedRoute]
+) -> dict[int, CachedRoute]:
+    """
+    Keep only the route into the target that is cheapest to reach, counting
+    the starting cost of the source each route leaves from
+    """
+    reached = [
+        (sources[route.nodes[0]] + route.cost, target_id)
+        for (target_id, route) in routes.items()
+        if route.cost is not None and len(route.nodes) > 0
+    ]
+    if len(reached) == 0:
+        return {}
+    (_, best_target) = min(reached)
+    return {best_target: routes[best_target]}
+
+
+def find_paths_between_network_nodes(
+    network: Network,
+    sources: dict[int, float],
+    target_ids: list[int],
+    astar: bool = False,
+    all_targets: bool = False,
+) -> dict[int, CachedRoute]:
+    """
+    Like search_paths_between_network_nodes, but looking the routes up in the
+    route cache first
+
+    A search missing from the cache is run once from all the sources to every
+    target, and the cheapest route into each target is cached under the
+    sources and targets, so the same search for one target or all of them is
+    answered from the cache next time
+    """
+    route_cache = get_route_cache(network)
+    if route_cache is None:
+        return search_paths_between_network_nodes(
+            network, sources, target_ids, astar, all_targets
+        )
+    routes = route_cache.get_routes(sources, target_ids)
+    if routes is None:
+        routes = search_paths_between_network_nodes(
+            network, sources, target_ids, astar, True
+        )
+        route_cache.put_routes(sources, target_ids, routes)
+    if all_targets:
+        return routes
+    return get_cheapest_route(sources, routes)
+
+
+def find_path_betwen_network_nodes(
+    network: Network, source_id: int, target_id: int, astar: bool = False
+) -> Optional[LineString]:
+    routes = find_paths_between_network_nodes(
+        network, {source_id: 0.0}, [target_id], astar
+    )
+    route = routes.get(target_id)
+    if route is None:
+        return None
+    return route.geometry
+
+
 def find_path_between_station_points(
-    network: MultiDiGraph, source: StationPoint, target: StationPoint
+    network: Network,
+    source: StationPoint,
+    target: StationPoint,
+    astar: bool = False,
 ) -> Optional[LineString]:
+    """
+    Station points are inserted into the network by network/setup.py, so the
+    network is never changed while routing and a station missing from it has
+    no route
+    """
     source_id = get_node_id_from_station_point(source)
     target_id = get_node_id_from_station_point(target)
-    if not network.has_node(source_id):
-        insert_node_to_network(
-            network, source.point, source_id, project_network=False
-        )
-    if not network.has_node(target_id):
-        insert_node_to_network(
-            network, target.point, target_id, project_network=False
-        )
-    return find_path_betwen_network_nodes(network, source_id, target_id)
+    return find_path_betwen_network_nodes(network, source_id, target_id, astar)
 
 
 def find_paths_between_nodes(
-    network: MultiDiGraph,
+    network: Network,
     sources: list[StationPoint],
     targets: list[StationPoint],
+    astar: bool = False,
 ) -> list[tuple[StationPoint, StationPoint, LineString]]:
     paths = []
     for source in sources:
         for target in targets:
-            path = find_path_between_station_points(network, source, target)
+            path = find_path_between_station_points(
+                network, source, target, astar
+            )
             if path is not None:
                 paths.append((source, target, path))
     return paths
 
 
 def find_shortest_path_between_multiple_nodes(
-    network: MultiDiGraph,
+    network: Network,
     sources: list[StationPoint],
     targets: list[StationPoint],
+    astar: bool = False,
 ) -> Optional[tuple[StationPoint, StationPoint, LineString]]:
-    paths = find_paths_between_nodes(network, sources, targets)
-    if len(paths) == 0:
-        return None
-    return get_shortest_linestring(paths)
+    """
+    Find the cheapest route from any of the sources to any of the targets with
+    a single search
+    """
+    source_points = {
+        get_node_id_from_station_point(source): source for source in sources
+    }
+    target_points = {
+        get_node_id_from_station_point(target): target for target in targets
+    }
+    routes = find_paths_between_network_nodes(
+        network,
+        {source_id: 0.0 for source_id in source_points.keys()},
+        list(target_points.keys()),
+        astar,
+    )
+    for target_id, route in routes.items():
+        if route.geometry is not None:
+            return (
+                source_points[route.nodes[0]],
+                target_points[target_id],
+                route.geometry,
+            )
+    return None
 
 
 def find_shortest_path_between_nodes(
-    network: MultiDiGraph,
+    network: Network,
     sources: StationPoint,
     targets: StationPoint,
+    astar: bool = False,
 ) -> Optional[tuple[StationPoint, StationPoint, LineString]]:
     return find_shortest_path_between_multiple_nodes(
-        network, [sources], [targets]
+        network, [sources], [targets], astar
     )
 
 
 def find_paths_between_stations(
-    network: MultiDiGraph,
+    network: Network,
     origin_crs: str,
     origin_platform: Optional[str],
     destination_crs: str,
     destination_platform: Optional[str],
     station_points: dict[str, dict[Optional[str], StationPoint]],
+    astar: bool = False,
 ) -> list[tuple[StationPoint, StationPoint, LineString]]:
     origin_points = get_relevant_station_points(
         origin_crs, origin_platform, station_points
@@ -143,87 +384,89 @@ def find_paths_between_stations(
     destination_points = get_relevant_station_points(
         destination_crs, destination_platform, station_points
     )
-    paths = find_paths_between_nodes(network, origin_points, destination_points)
+    paths = find_paths_between_nodes(
+        network, origin_points, destination_points, astar
+    )
     return paths
 
 
 def find_shortest_path_between_stations(
-    network: MultiDiGraph,
+    network: Network,
     origin_crs: str,
     origin_platform: Optional[str],
     destination_crs: str,
     destination_platform: Optional[str],
     station_points: dict[str, dict[Optional[str], StationPoint]],
+    astar: bool = False,
 ) -> Optional[tuple[StationPoint, StationPoint, LineString]]:
-    paths = find_paths_between_stations(
-        network,
-        origin_crs,
-        origin_platform,
-        destination_crs,
-        destination_platform,
-        station_points,
+    origin_points = get_relevant_station_points(
+        origin_crs, origin_platform, station_points
+    )
+    destination_points = get_relevant_station_points(
+        destination_crs, destination_platform, station_points
+    )
+    return find_shortest_path_between_multiple_nodes(
+        network, origin_points, destination_points, astar
     )
-    shortest_path = get_shortest_linestring(paths)
-    return shortest_path
 
 
 def get_linestring_for_leg(
-    network: MultiDiGraph,
+    network: Network,
     leg_calls: list[ShortLegCall],
     station_points: dict[str, dict[Optional[str], StationPoint]],
+    astar: bool = True,
 ) -> Optional[tuple[list[StationPoint], LineString]]:
-    complete_paths: list[tuple[list[StationPoint], Optional[LineString]]] = []
-    for platform_key in station_points[leg_calls[0].station.crs].keys():
-        first_point = station_points[leg_calls[0].station.crs][platform_key]
-        complete_paths.append(
-            (
-                [
-                    StationPoint(
-                        first_point.crs,
-                        first_point.name,
-                        first_point.platform,
-                        first_point.point,
-                        short_leg_call_to_point_times(leg_calls[0]),
-                    )
-                ],
-                None,
+    """
+    Find the cheapest route through one platform of each call in turn
+
+    Only the cheapest route into each platform of a call is kept, along with
+    the platform of the previous call it came from, so the work done grows
+    linearly with the number of calls. The route is rebuilt from these back
+    pointers once the last call has been reached
+    """
+    call_points = [
+        {
+            get_node_id_from_station_point(point): StationPoint(
+                point.crs,
+                point.name,
+                point.platform,
+                point.point,
+                short_leg_call_to_point_times(call),
             )
+            for point in station_points[call.station.crs].values()
+        }
+        for call in leg_calls
+    ]
+    costs = {node_id: 0.0 for node_id in call_points[0].keys()}
+    back_pointers: list[dict[int, tuple[int, LineString]]] = []
+    for points in call_points[1:]:
+        routes = find_paths_between_network_nodes(
+            network, costs, list(points.keys()), astar, all_targets=True
         )
-    for call in leg_calls[1:]:
-        call_paths = []
-        points_to_test = station_points[call.station.crs]
-        for platform_key in points_to_test.keys():
-            platform_paths = []
-            point_to_test = points_to_test[platform_key]
-            for stations, complete_path in complete_paths:
-                path = find_path_between_station_points(
-                    network, stations[-1], point_to_test
-                )
-                if path is not None:
-                    if complete_path is None:
-                        new_path = path
-                    else:
-                        new_path = merge_linestrings([complete_path, path])
-                    new_stations = stations + [
-                        StationPoint(
-                            point_to_test.crs,
-                            point_to_test.name,
-                            point_to_test.platform,
-                            point_to_test.point,
-                            short_leg_call_to_point_times(call),
-                        )
-                    ]
-                    platform_paths.append((new_stations, new_path))
-            call_paths = call_paths + platform_paths
-        complete_paths = call_paths
-    complete_path = min(
-        complete_paths,
-        default=None,
-        key=lambda result: shapely.length(result[1]),
-    )
-    if complete_path is None:
+        call_costs = {}
+        call_back_pointers = {}
+        for target_id, route in routes.items():
+            if route.geometry is None or route.cost is None:
+                continue
+            source_id = route.nodes[0]
+            call_costs[target_id] = costs[source_id] + route.cost
+            call_back_pointers[target_id] = (source_id, route.geometry)
+        if len(call_costs) == 0:
+            return None
+        costs = call_costs
+        back_pointers.append(call_back_pointers)
+    if len(back_pointers) == 0:
         return None
-    (station_path, line_path) = complete_path
-    if line_path is None:
+    node_id = min(costs.keys(), key=lambda node_id: costs[node_id])
+    station_path = [call_points[-1][node_id]]
+    line_strings = []
+    for i in range(len(back_pointers) - 1, -1, -1):
+        (node_id, line_string) = back_pointers[i][node_id]
+        station_path.append(call_points[i][node_id])
+        line_strings.append(line_string)
+    station_path.reverse()
+    line_strings.reverse()
+    try:
+        return (station_path, merge_linestrings(line_strings))
+    except RuntimeError:
         return None
-    return (station_path, line_path)
@@ -0,0 +1,47 @@
+import sys
+
+from api.data.points import get_adjacent_station_crses, get_station_points
+from api.network.cache import RouteCache, get_network_file_hash, set_route_cache
+from api.network.pathfinding import find_shortest_path_between_multiple_nodes
+from api.network.routing import load_network
+from api.utils.database import connect_with_env
+from api.utils.interactive import information
+
+
+def precompute_routes(network_path: str, route_cache_path: str):
+    """
+    Search from every platform of each station in the call data to every
+    platform of the station after it, as the api does when routing between two
+    stations, so that it only needs to search for routes it has never seen
+    """
+    network = load_network(network_path)
+    route_cache = RouteCache(
+        route_cache_path, get_network_file_hash(network_path)
+    )
+    set_route_cache(network, route_cache)
+    with connect_with_env() as conn:
+        station_points = get_station_points(conn)
+        station_pairs = get_adjacent_station_crses(conn)
+    for i, (origin_crs, destination_crs) in enumerate(station_pairs):
+        origin_points = station_points.get(origin_crs)
+        destination_points = station_points.get(destination_crs)
+        if origin_points is None or destination_points is None:
+            continue
+        information(
+            f"[{i + 1}/{len(station_pairs)}] {origin_crs} to {destination_crs}"
+        )
+        find_shortest_path_between_multiple_nodes(
+            network,
+            list(origin_points.values()),
+            list(destination_points.values()),
+        )
+    route_cache.close()
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        raise RuntimeError("No network path specified")
+    if len(sys.argv) < 3:
+        raise RuntimeError("No route cache path specified")
+
+    precompute_routes(sys.argv[1], sys.argv[2])
@@ -0,0 +1,309 @@
+import functools
+import json
+import os
+import networkx as nx
+import numpy as np
+import osmnx as ox
+
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Optional
+from networkx import MultiDiGraph
+from shapely import LineString
+
+from api.network.network import (
+    add_travel_costs,
+    merge_linestrings,
+)
+from api.network.search import (
+    NetworkSearch,
+    get_straight_line_heuristic,
+    search_network,
+)
+
+
+@dataclass
+class RoutingGraph:
+    """
+    A read-only copy of a network laid out in flat arrays, which can be saved
+    to disk by network/setup.py and memory mapped by every api worker
+
+    The outgoing edges of the node at index i are the edges at indices
+    edge_offsets[i] to edge_offsets[i + 1], and the coordinates of the edge at
+    index e are geometry_coords[geometry_offsets[e]:geometry_offsets[e + 1]]
+    (empty when the edge is a straight line between its endpoints)
+
+    max_speed is the highest speed on any edge, and graph holds graph level
+    attributes, like the graph attribute of a networkx graph
+    """
+
+    node_ids: np.ndarray
+    node_x: np.ndarray
+    node_y: np.ndarray
+    edge_offsets: np.ndarray
+    edge_targets: np.ndarray
+    edge_costs: np.ndarray
+    geometry_offsets: np.ndarray
+    geometry_coords: np.ndarray
+    max_speed: float
+    graph: dict[str, Any] = field(default_factory=dict)
+
+
+routing_graph_arrays = [
+    "node_ids",
+    "node_x",
+    "node_y",
+    "edge_offsets",
+    "edge_targets",
+    "edge_costs",
+    "geometry_offsets",
+    "geometry_coords",
+]
+
+
+def get_routing_graph_from_network(network: MultiDiGraph) -> RoutingGraph:
+    if network.graph.get("max_speed") is None:
+        add_travel_costs(network)
+    node_ids = np.array(sorted(network.nodes), dtype=np.int64)
+    node_indices = {node_id: i for i, node_id in enumerate(node_ids.tolist())}
+    node_x = np.array(
+        [network.nodes[node_id]["x"] for node_id in node_ids.tolist()],
+        dtype=np.float64,
+    )
+    node_y = np.array(
+        [network.nodes[node_id]["y"] for node_id in node_ids.tolist()],
+        dtype=np.float64,
+    )
+
+    # Only the cheapest of any parallel edges can ever be on a shortest path
+    edges: dict[tuple[int, int], tuple[float, Optional[LineString]]] = {}
+    for source, target, tags in network.edges(data=True):
+        travel_cost = tags["travel_cost"]
+        key = (node_indices[source], node_indices[target])
+        if key not in edges or travel_cost < edges[key][0]:
+            edges[key] = (travel_cost, tags.get("geometry"))
+
+    edge_keys = sorted(edges.keys())
+    edge_sources = np.array([source for (source, _) in edge_keys], np.int64)
+    edge_offsets = np.zeros(len(node_ids) + 1, dtype=np.int64)
+    np.cumsum(
+        np.bincount(edge_sources, minlength=len(node_ids)),
+        out=edge_offsets[1:],
+    )
+    edge_targets = np.array(
+        [target for (_, target) in edge_keys], dtype=np.int64
+    )
+    edge_costs = np.array([edges[key][0] for key in edge_keys], np.float64)
+
+    geometry_offsets = np.zeros(len(edge_keys) + 1, dtype=np.int64)
+    geometry_coords = []
+    for i, key in enumerate(edge_keys):
+        geometry = edges[key][1]
+        if geometry is not None:
+            geometry_coords.extend(geometry.coords)
+        geometry_offsets[i + 1] = len(geometry_coords)
+
+    graph = RoutingGraph(
+        node_ids=node_ids,
+        node_x=node_x,
+        node_y=node_y,
+        edge_offsets=edge_offsets,
+        edge_targets=edge_targets,
+        edge_costs=edge_costs,
+        geometry_offsets=geometry_offsets,
+        geometry_coords=np.array(geometry_coords, dtype=np.float64).reshape(
+            -1, 2
+        ),
+        max_speed=network.graph["max_speed"],
+    )
+    for name in routing_graph_arrays:
+        getattr(graph, name).flags.writeable = False
+    return graph
+
+
+def save_routing_graph(graph: RoutingGraph, path: Path | str):
+    """
+    Save each array to its own file in the directory at path, so that they can
+    be memory mapped when loaded
+    """
+    directory = Path(path)
+    directory.mkdir(parents=True, exist_ok=True)
+    for name in routing_graph_arrays:
+        np.save(directory / f"{name}.npy", getattr(graph, name))
+    with open(directory / "graph.json", "w") as f:
+        json.dump({"max_speed": graph.max_speed}, f)
+
+
+def load_routing_graph(path: Path | str) -> RoutingGraph:
+    """
+    The arrays are memory mapped read-only, so processes that load the same
+    routing graph share a single copy of it in memory
+    """
+    directory = Path(path)
+
+    def load_array(name: str) -> np.ndarray:
+        return np.load(directory / f"{name}.npy", mmap_mode="r")
+
+    with open(directory / "graph.json", "r") as f:
+        metadata = json.load(f)
+    return RoutingGraph(
+        node_ids=load_array("node_ids"),
+        node_x=load_array("node_x"),
+        node_y=load_array("node_y"),
+        edge_offsets=load_array("edge_offsets"),
+        edge_targets=load_array("edge_targets"),
+        edge_costs=load_array("edge_costs"),
+        geometry_offsets=load_array("geometry_offsets"),
+        geometry_coords=load_array("geometry_coords"),
+        max_speed=metadata["max_speed"],
+    )
+
+
+def load_network(
+    path: Path | str, routing_engine: str = "arrays"
+) -> MultiDiGraph | RoutingGraph:
+    """
+    Load a network for routing from either a routing graph directory saved by
+    network/setup.py or a GraphML file
+
+    The network returned cannot be modified, so it can be shared between
+    threads
+    """
+    if os.path.isdir(path):
+        if routing_engine != "arrays":
+            raise RuntimeError(
+                f"Routing graph at {path} can only be used by the arrays engine"
+            )
+        return load_routing_graph(path)
+    network = ox.load_graphml(path)
+    add_travel_costs(network)
+    match routing_engine:
+        case "arrays":
+            return get_routing_graph_from_network(network)
+        case "networkx":
+            return nx.freeze(network)
+        case _:
+            raise RuntimeError(f"Unknown routing engine {routing_engine}")
+
+
+def get_routing_graph_node_index(
+    graph: RoutingGraph, node_id: int
+) -> Optional[int]:
+    index = int(np.searchsorted(graph.node_ids, node_id))
+    if index < len(graph.node_ids) and graph.node_ids[index] == node_id:
+        return index
+    return None
+
+
+def get_routing_graph_node_coordinates(
+    graph: RoutingGraph, node_id: int
+) -> tuple[float, float]:
+    index = get_routing_graph_node_index(graph, node_id)
+    if index is None:
+        raise RuntimeError(f"Node {node_id} is not in the routing graph")
+    return get_routing_graph_node_index_coordinates(graph, index)
+
+
+def get_routing_graph_node_index_coordinates(
+    graph: RoutingGraph, index: int
+) -> tuple[float, float]:
+    return (float(graph.node_x[index]), float(graph.node_y[index]))
+
+
+def get_routing_graph_neighbours(
+    graph: RoutingGraph, node: int
+) -> list[tuple[int, float]]:
+    first_edge = int(graph.edge_offsets[node])
+    last_edge = int(graph.edge_offsets[node + 1])
+    return list(
+        zip(
+            graph.edge_targets[first_edge:last_edge].tolist(),
+            graph.edge_costs[first_edge:last_edge].tolist(),
+        )
+    )
+
+
+def find_routing_graph_paths(
+    graph: RoutingGraph,
+    sources: dict[int, float],
+    targets: list[int],
+    astar: bool = False,
+    all_targets: bool = False,
+) -> NetworkSearch:
+    """
+    Search between node indices, using A* instead of Dijkstra's algorithm if
+    astar is set
+    """
+    if astar:
+        heuristic = get_straight_line_heuristic(
+            targets,
+            functools.partial(get_routing_graph_node_index_coordinates, graph),
+            graph.max_speed,
+        )
+    else:
+        heuristic = None
+    return search_network(
+        sources,
+        targets,
+        functools.partial(get_routing_graph_neighbours, graph),
+        heuristic,
+        all_targets,
+    )
+
+
+def get_routing_graph_edge_source(graph: RoutingGraph, edge: int) -> int:
+    return int(np.searchsorted(graph.edge_offsets, edge, side="right")) - 1
+
+
+def get_routing_graph_edge(
+    graph: RoutingGraph, source: int, target: int
+) -> int:
+    first_edge = int(graph.edge_offsets[source])
+    last_edge = int(graph.edge_offsets[source + 1])
+    targets = graph.edge_targets[first_edge:last_edge]
+    return first_edge + int(np.flatnonzero(targets == target)[0])
+
+
+def get_routing_graph_path_edges(
+    graph: RoutingGraph, nodes: list[int]
+) -> list[int]:
+    return [
+        get_routing_graph_edge(graph, nodes[i], nodes[i + 1])
+        for i in range(0, len(nodes) - 1)
+    ]
+
+
+def get_routing_graph_path_node_ids(
+    graph: RoutingGraph, nodes: list[int]
+) -> list[int]:
+    return graph.node_ids[nodes].tolist()
+
+
+def get_routing_graph_edge_linestring(
+    graph: RoutingGraph, edge: int
+) -> LineString:
+    first_coord = int(graph.geometry_offsets[edge])
+    last_coord = int(graph.geometry_offsets[edge + 1])
+    if first_coord < last_coord:
+        return LineString(graph.geometry_coords[first_coord:last_coord])
+    source = get_routing_graph_edge_source(graph, edge)
+    target = int(graph.edge_targets[edge])
+    return LineString(
+        [
+            (graph.node_x[source], graph.node_y[source]),
+            (graph.node_x[target], graph.node_y[target]),
+        ]
+    )
+
+
+def get_routing_graph_path_linestring(
+    graph: RoutingGraph, edges: list[int]
+) -> Optional[LineString]:
+    if len(edges) == 0:
+        return None
+    try:
+        return merge_linestrings(
+            [get_routing_graph_edge_linestring(graph, edge) for edge in edges]
+        )
+    except:
+        return None
@@ -0,0 +1,99 @@
+import heapq
+
+from dataclasses import dataclass
+from typing import Callable, Iterable, Optional
+
+from api.network.network import get_great_circle_distance
+
+
+@dataclass
+class SearchPath:
+    nodes: list[int]
+    cost: float
+
+
+@dataclass
+class NetworkSearch:
+    paths: dict[int, SearchPath]
+    expanded: int
+
+
+def get_straight_line_heuristic(
+    targets: Iterable[int],
+    get_coordinates: Callable[[int], tuple[float, float]],
+    max_speed: float,
+) -> Callable[[int], float]:
+    """
+    No route can be cheaper than travelling in a straight line to the nearest
+    target at the highest speed on the network
+    """
+    target_coordinates = [get_coordinates(target) for target in targets]
+
+    def heuristic(node: int) -> float:
+        (x, y) = get_coordinates(node)
+        distance = min(
+            get_great_circle_distance(x, y, target_x, target_y)
+            for (target_x, target_y) in target_coordinates
+        )
+        return distance / max_speed
+
+    return heuristic
+
+
+def get_search_path_nodes(previous: dict[int, int], target: int) -> list[int]:
+    nodes = [target]
+    while nodes[-1] in previous:
+        nodes.append(previous[nodes[-1]])
+    nodes.reverse()
+    return nodes
+
+
+def search_network(
+    sources: dict[int, float],
+    targets: Iterable[int],
+    get_neighbours: Callable[[int], Iterable[tuple[int, float]]],
+    heuristic: Optional[Callable[[int], float]] = None,
+    all_targets: bool = False,
+) -> NetworkSearch:
+    """
+    Search outwards from all the sources at once, each starting with the given
+    cost, until the cheapest target has been reached or until every target has
+    been reached if all_targets is set
+
+    This is Dijkstra's algorithm, or A* if a heuristic is given
+    """
+    remaining = set(targets)
+    if len(sources) == 0 or len(remaining) == 0:
+        return NetworkSearch({}, 0)
+    distances = dict(sources)
+    previous: dict[int, int] = {}
+    visited = set()
+    paths = {}
+    queue = [
+        (cost + (heuristic(node) if heuristic else 0), cost, node)
+        for (node, cost) in sources.items()
+    ]
+    heapq.heapify(queue)
+    while len(queue) > 0 and len(remaining) > 0:
+        (_, distance, node) = heapq.heappop(queue)
+        if node in visited:
+            continue
+        visited.add(node)
+        if node in remaining:
+            remaining.remove(node)
+            paths[node] = SearchPath(
+                get_search_path_nodes(previous, node), distance
+            )
+            if not all_targets:
+                break
+        for neighbour, cost in get_neighbours(node):
+            new_distance = distance + cost
+            if new_distance < distances.get(neighbour, float("inf")):
+                distances[neighbour] = new_distance
+                previous[neighbour] = node
+                if heuristic:
+                    priority = new_distance + heuristic(neighbour)
+                else:
+                    priority = new_distance
+                heapq.heappush(queue, (priority, new_distance, neighbour))
+    return NetworkSearch(paths, len(visited))
@@ -9,6 +9,10 @@ from api.network.network import (
     osgb36,
     wgs84,
 )
+from api.network.routing import (
+    get_routing_graph_from_network,
+    save_routing_graph,
+)
 from api.utils.interactive import input_confirm
 
 input = input_confirm("Download network?", default=False)
@@ -29,8 +33,13 @@ projected_network = insert_node_dict_to_network(
 
 new_network = ox.project_graph(projected_network, to_crs=wgs84)
 
-for node in network.nodes():
+for _, node in new_network.nodes(data=True):
     node["x"] = round(node["x"], 16)
     node["y"] = round(node["y"], 16)
 
 ox.save_graphml(new_network, sys.argv[2])
+
+# The api can load this instead of the GraphML, with every station already
+# inserted so that it never needs to change the network
+if len(sys.argv) > 3:
+    save_routing_graph(get_routing_graph_from_network(new_network), sys.argv[3])
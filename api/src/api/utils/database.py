@@ -1,13 +1,21 @@
 import sys
-from dataclasses import dataclass
+import weakref
+
+from dataclasses import dataclass, field
 from datetime import datetime
 from decimal import Decimal, DecimalException
 from typing import Any, Optional
 
-from api.utils.environment import get_env_variable, get_secret
+from api.utils.environment import (
+    get_env_number_variable,
+    get_env_variable,
+    get_secret,
+)
 from dotenv import load_dotenv
-from psycopg import Connection
+from psycopg import AsyncConnection, Connection
+from psycopg.conninfo import make_conninfo
 from psycopg.types.composite import CompositeInfo, register_composite
+from psycopg_pool import AsyncConnectionPool, ConnectionPool
 
 load_dotenv()
 
@@ -45,13 +53,17 @@ class DbConnection:
         self.db_password = data.db_password or get_secret("DB_PASSWORD")
         self.db_host = data.db_host or get_env_variable("DB_HOST")
 
-    def __enter__(self):
-        self.conn = Connection.connect(
+    def get_conninfo(self) -> str:
+        return make_conninfo(
             dbname=self.db_name,
             user=self.db_user,
             password=self.db_password,
             host=self.db_host,
         )
+
+    def __enter__(self):
+        self.conn = Connection.connect(self.get_conninfo())
+        load_composite_types(self.conn)
         return self.conn
 
     def __exit__(
@@ -68,6 +80,95 @@ def connect_with_env() -> DbConnection:
     return DbConnection(DbConnectionData(None, None, None, None))
 
 
+@dataclass
+class DbPoolConfig:
+    min_size: int
+    max_size: int
+    max_idle: float
+    max_lifetime: float
+    timeout: float
+
+
+def get_db_pool_config_from_env() -> DbPoolConfig:
+    """
+    Pool sizing is read from the following variables, all optional
+
+    DB_POOL_MIN_SIZE: connections kept open at all times (default 2)
+    DB_POOL_MAX_SIZE: maximum connections the pool will open (default 10)
+    DB_POOL_MAX_IDLE: seconds an unused connection above the minimum is kept
+    before being closed (default 600)
+    DB_POOL_MAX_LIFETIME: seconds after which a connection is recycled
+    (default 3600)
+    DB_POOL_TIMEOUT: seconds a request waits for a connection before failing
+    (default 30)
+    """
+    return DbPoolConfig(
+        int(get_env_number_variable("DB_POOL_MIN_SIZE", 2)),
+        int(get_env_number_variable("DB_POOL_MAX_SIZE", 10)),
+        get_env_number_variable("DB_POOL_MAX_IDLE", 600),
+        get_env_number_variable("DB_POOL_MAX_LIFETIME", 3600),
+        get_env_number_variable("DB_POOL_TIMEOUT", 30),
+    )
+
+
+def create_connection_pool(
+    data: DbConnectionData, config: Optional[DbPoolConfig] = None
+) -> ConnectionPool:
+    if config is None:
+        config = get_db_pool_config_from_env()
+    return ConnectionPool(
+        DbConnection(data).get_conninfo(),
+        min_size=config.min_size,
+        max_size=config.max_size,
+        max_idle=config.max_idle,
+        max_lifetime=config.max_lifetime,
+        timeout=config.timeout,
+        check=ConnectionPool.check_connection,
+        configure=load_composite_types,
+        name="api",
+        open=False,
+    )
+
+
+def create_connection_pool_with_env() -> ConnectionPool:
+    return create_connection_pool(DbConnectionData(None, None, None, None))
+
+
+def create_async_connection_pool(
+    data: DbConnectionData, config: Optional[DbPoolConfig] = None
+) -> AsyncConnectionPool:
+    if config is None:
+        config = get_db_pool_config_from_env()
+    return AsyncConnectionPool(
+        DbConnection(data).get_conninfo(),
+        min_size=config.min_size,
+        max_size=config.max_size,
+        max_idle=config.max_idle,
+        max_lifetime=config.max_lifetime,
+        timeout=config.timeout,
+        check=AsyncConnectionPool.check_connection,
+        configure=load_composite_types_async,
+        name="api-async",
+        open=False,
+    )
+
+
+def create_async_connection_pool_with_env() -> AsyncConnectionPool:
+    return create_async_connection_pool(
+        DbConnectionData(None, None, None, None)
+    )
+
+
+def get_connection_pool_stats(
+    pool: ConnectionPool | AsyncConnectionPool,
+) -> dict[str, int | float]:
+    stats: dict[str, int | float] = dict(pool.get_stats())
+    requests = stats.get("requests_num", 0)
+    wait_ms = stats.get("requests_wait_ms", 0)
+    stats["requests_wait_ms_mean"] = wait_ms / requests if requests else 0
+    return stats
+
+
 @dataclass
 class NoEscape:
     string: str
@@ -167,9 +268,103 @@ def insert(
         conn.execute(statement.encode())
 
 
-def register_type(conn: Connection, name: str, factory: Any = None):
-    info = CompositeInfo.fetch(conn, name)
-    if info is not None:
-        register_composite(info, conn, factory)
-    else:
-        raise RuntimeError(f"Could not find composite type {name}")
+composite_types_query = """
+    SELECT
+        t.typname::text, t.oid, t.typarray, t.oid::regtype::text,
+        COALESCE(
+            ARRAY_AGG(a.attname::text ORDER BY a.attnum)
+            FILTER (WHERE a.attname IS NOT NULL),
+            '{}'
+        ),
+        COALESCE(
+            ARRAY_AGG(a.atttypid ORDER BY a.attnum)
+            FILTER (WHERE a.attname IS NOT NULL),
+            '{}'
+        )
+    FROM pg_type t
+    INNER JOIN pg_class c
+    ON c.oid = t.typrelid
+    INNER JOIN pg_namespace n
+    ON n.oid = t.typnamespace
+    LEFT JOIN pg_attribute a
+    ON a.attrelid = t.typrelid
+    AND a.attnum > 0
+    AND NOT a.attisdropped
+    WHERE c.relkind = 'c'
+    AND n.nspname = ANY(current_schemas(false))
+    GROUP BY t.oid, t.typname, t.typarray
+"""
+
+
+@dataclass
+class CompositeTypeRegistry:
+    infos: dict[str, CompositeInfo] = field(default_factory=dict)
+    factories: dict[str, Any] = field(default_factory=dict)
+
+
+composite_type_registries: weakref.WeakKeyDictionary[
+    Connection | AsyncConnection, CompositeTypeRegistry
+] = weakref.WeakKeyDictionary()
+
+
+def get_composite_type_registry(
+    conn: Connection | AsyncConnection,
+) -> CompositeTypeRegistry:
+    registry = composite_type_registries.get(conn)
+    if registry is None:
+        registry = CompositeTypeRegistry()
+        composite_type_registries[conn] = registry
+    return registry
+
+
+def load_composite_types(conn: Connection):
+    """
+    Fetch the catalog information for every composite type in the schema in a
+    single query, so that registering a type later needs no round trip
+    """
+    with conn.transaction():
+        rows = conn.execute(composite_types_query).fetchall()
+    add_composite_types_to_registry(conn, rows)
+
+
+async def load_composite_types_async(conn: AsyncConnection):
+    async with conn.transaction():
+        cur = await conn.execute(composite_types_query)
+        rows = await cur.fetchall()
+    add_composite_types_to_registry(conn, rows)
+
+
+def add_composite_types_to_registry(
+    conn: Connection | AsyncConnection, rows: list[tuple[Any, ...]]
+):
+    registry = get_composite_type_registry(conn)
+    for row in rows:
+        (name, oid, array_oid, regtype, field_names, field_types) = row
+        registry.infos[name] = CompositeInfo(
+            name,
+            oid,
+            array_oid,
+            regtype=regtype,
+            field_names=field_names,
+            field_types=field_types,
+        )
+
+
+def register_type(
+    conn: Connection | AsyncConnection, name: str, factory: Any = None
+):
+    registry = get_composite_type_registry(conn)
+    # Unquoted type names are folded to lower case by postgres
+    key = name.lower()
+    if key in registry.factories and registry.factories[key] is factory:
+        return
+    info = registry.infos.get(key)
+    if info is None:
+        if isinstance(conn, AsyncConnection):
+            raise RuntimeError(f"Composite type {name} has not been loaded")
+        info = CompositeInfo.fetch(conn, name)
+        if info is None:
+            raise RuntimeError(f"Could not find composite type {name}")
+        registry.infos[key] = info
+    register_composite(info, conn, factory)
+    registry.factories[key] = factory
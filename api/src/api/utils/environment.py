@@ -20,3 +20,13 @@ def get_secret(key: str) -> Optional[str]:
     if file is not None and os.path.exists(file):
         return get_secret_file_contents(file)
     return None
+
+
+def get_env_number_variable(key: str, default: float) -> float:
+    val = get_env_variable(key)
+    if val is None:
+        return default
+    try:
+        return float(val)
+    except ValueError:
+        raise RuntimeError(f"{key} must be a number but it is {val}")
@@ -2,16 +2,23 @@ from json import JSONDecodeError
 import xml.etree.ElementTree as ET
 import gzip
 import os
+import random
 import shutil
+import threading
+import time
 import zipfile
 from bs4 import BeautifulSoup
 import requests
 
+from contextlib import AbstractContextManager, contextmanager, nullcontext
 from pathlib import Path
-from typing import Any, Optional
+from typing import Any, Iterator, Optional
+from urllib.parse import urlparse
 from dotenv import dotenv_values
 from requests import Response
+from requests.adapters import HTTPAdapter
 from requests.auth import HTTPBasicAuth
+from urllib3.util.request import ACCEPT_ENCODING
 
 from api.utils.credentials import Credentials
 from api.utils.debug import debug_msg
@@ -53,14 +60,20 @@ def extract_gz(
         os.remove(gz_path)
 
 
+# Downloads are written to disk in chunks of this many bytes
+download_chunk_size = 1024 * 1024
+
+
 def download_binary(
     url: str, path: str, credentials: Optional[Credentials] = None
 ):
     response = make_get_request(url, credentials=credentials, stream=True)
-    if response.status_code != 200:
-        raise RuntimeError(f"Could not get {url}")
-    with open(path, "wb+") as f:
-        f.write(response.raw.read())
+    with response:
+        if response.status_code != 200:
+            raise RuntimeError(f"Could not get {url}")
+        with open(path, "wb+") as f:
+            for chunk in response.iter_content(download_chunk_size):
+                f.write(chunk)
 
 
 def prefix_namespace(namespace: str, tag: str) -> str:
@@ -84,18 +97,217 @@ def soupify(doc: str) -> Optional[BeautifulSoup]:
     return soup
 
 
+# Responses with these statuses are worth trying again after a while
+retry_statuses = {429, 500, 502, 503, 504}
+
+# Idempotent requests are tried this many more times after a connection error
+# or a response with a retry status, waiting backoff * 2^n seconds or longer
+request_retries = 2
+request_backoff = 0.5
+
+# A server asking to be retried later is waited for no longer than this many
+# seconds, so one slow host cannot hold a worker indefinitely
+max_retry_delay = 60.0
+
+# Seconds to wait to connect to a host and then between bytes read from it
+default_timeout = (10, 60)
+host_timeouts = {
+    "api.rtt.io": (5, 30),
+    "www.realtimetrains.co.uk": (5, 30),
+    "bustimes.org": (5, 30),
+}
+
+# How many hosts to keep connections open to, and how many to keep open to each
+pool_hosts = 16
+pool_connections_per_host = 16
+
+session: Optional[requests.Session] = None
+session_lock = threading.Lock()
+
+
+def make_session() -> requests.Session:
+    new_session = requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=pool_hosts, pool_maxsize=pool_connections_per_host
+    )
+    new_session.mount("https://", adapter)
+    new_session.mount("http://", adapter)
+    # urllib3 adds br and zstd when brotli and zstandard are installed
+    new_session.headers["Accept-Encoding"] = ACCEPT_ENCODING
+    return new_session
+
+
+def get_session() -> requests.Session:
+    """
+    Every request shares one session, so connections to each host are kept
+    alive and reused across calls and threads
+    """
+    global session
+    with session_lock:
+        if session is None:
+            session = make_session()
+        return session
+
+
+def get_timeout(url: str) -> tuple[float, float]:
+    return host_timeouts.get(urlparse(url).netloc, default_timeout)
+
+
+class TokenBucket:
+    """
+    Allows rate requests a second on average, and bursts of up to capacity
+    requests at once
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def take(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(
+                    self.capacity,
+                    self.tokens + (now - self.updated) * self.rate,
+                )
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens = self.tokens - 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class RequestLimiter:
+    """
+    Limits the rate of requests to each host, and how many requests can be
+    made to each host at once, across every thread that shares it
+    """
+
+    def __init__(
+        self, requests_per_second: float, burst: int, host_concurrency: int
+    ):
+        self.requests_per_second = requests_per_second
+        self.burst = burst
+        self.host_concurrency = host_concurrency
+        self.hosts: dict[str, tuple[TokenBucket, threading.Semaphore]] = {}
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def limit(self, url: str) -> Iterator[None]:
+        host = urlparse(url).netloc
+        with self.lock:
+            if host not in self.hosts:
+                self.hosts[host] = (
+                    TokenBucket(self.requests_per_second, self.burst),
+                    threading.BoundedSemaphore(self.host_concurrency),
+                )
+            (bucket, semaphore) = self.hosts[host]
+        with semaphore:
+            bucket.take()
+            yield
+
+
+def get_retry_delay(
+    response: Optional[Response], attempt: int, backoff: float
+) -> float:
+    if response is not None:
+        retry_after = response.headers.get("Retry-After")
+        if retry_after is not None and retry_after.isnumeric():
+            return min(float(retry_after), max_retry_delay)
+    return backoff * 2**attempt * (1 + random.random())
+
+
+def send_request(
+    method: str,
+    url: str,
+    limiter: Optional[RequestLimiter] = None,
+    **kwargs: Any,
+) -> Response:
+    limit: AbstractContextManager[None]
+    if limiter is None:
+        limit = nullcontext()
+    else:
+        limit = limiter.limit(url)
+    debug_msg(f"Making {method} request to {url}")
+    start = time.perf_counter()
+    with limit:
+        response = get_session().request(
+            method, url, timeout=get_timeout(url), **kwargs
+        )
+    debug_msg(
+        f"{method} {url} returned {response.status_code} "
+        f"in {time.perf_counter() - start:.2f}s"
+    )
+    return response
+
+
+def send_request_with_retries(
+    method: str,
+    url: str,
+    limiter: Optional[RequestLimiter] = None,
+    retries: int = request_retries,
+    backoff: float = request_backoff,
+    **kwargs: Any,
+) -> Response:
+    """
+    Try again with exponential backoff after connection errors and responses
+    that might succeed later, returning the last response or raising the last
+    connection error once out of retries
+    """
+    for attempt in range(0, retries + 1):
+        try:
+            response = send_request(method, url, limiter, **kwargs)
+        except requests.RequestException as e:
+            if attempt == retries:
+                raise
+            debug_msg(f"Could not connect to {url}: {e}")
+            time.sleep(get_retry_delay(None, attempt, backoff))
+            continue
+        if response.status_code not in retry_statuses or attempt == retries:
+            return response
+        debug_msg(f"Error {response.status_code} received from {url}")
+        response.close()
+        time.sleep(get_retry_delay(response, attempt, backoff))
+    raise RuntimeError(f"Could not get {url}")
+
+
 def make_get_request(
     url: str,
     credentials: Optional[Credentials] = None,
     stream: bool = False,
     headers: Optional[dict] = None,
+    limiter: Optional[RequestLimiter] = None,
+    retries: int = request_retries,
+    backoff: float = request_backoff,
 ) -> Response:
     if credentials is not None:
         auth = HTTPBasicAuth(credentials.user, credentials.password)
     else:
         auth = None
-    debug_msg(f"Making request to {url}")
-    return requests.get(url, auth=auth, stream=stream, headers=headers)
+    return send_request_with_retries(
+        "GET",
+        url,
+        limiter,
+        retries,
+        backoff,
+        auth=auth,
+        stream=stream,
+        headers=headers,
+    )
+
+
+def make_post_request(
+    url: str, headers: Optional[dict] = None, data: Optional[dict] = None
+) -> Response:
+    """
+    Posts are not retried, as they may not be safe to send twice
+    """
+    return send_request("POST", url, headers=headers, data=data)
 
 
 def get_json(
@@ -103,7 +315,7 @@ def get_json(
     credentials: Optional[Credentials] = None,
     headers: Optional[dict] = None,
 ) -> Optional[dict]:
-    response = make_get_request(url, credentials=credentials)
+    response = make_get_request(url, credentials=credentials, headers=headers)
     try:
         json = response.json()
     except JSONDecodeError:
@@ -111,17 +323,37 @@ def get_json(
     return json
 
 
-def get_soup(url: str) -> Optional[BeautifulSoup]:
-    response = make_get_request(url)
+def get_soup(
+    url: str, limiter: Optional[RequestLimiter] = None
+) -> Optional[BeautifulSoup]:
+    response = make_get_request(url, limiter=limiter)
     html = response.text
     return soupify(html)
 
 
-def make_post_request(
-    url: str, headers: Optional[dict] = None, data: Optional[dict] = None
-) -> Response:
-    print(f"Making post request to {url}")
-    return requests.post(url, headers=headers, data=data)
+def get_soup_with_retries(
+    url: str,
+    limiter: Optional[RequestLimiter] = None,
+    retries: int = 3,
+    backoff: float = 1,
+) -> Optional[BeautifulSoup]:
+    """
+    Like get_soup, but raising a RuntimeError if the page still could not be
+    got once out of retries, or the server answered with anything but the page
+    """
+    try:
+        response = make_get_request(
+            url, limiter=limiter, retries=retries, backoff=backoff
+        )
+    except requests.RequestException as e:
+        raise RuntimeError(
+            f"Could not get {url} after {retries + 1} attempts: {e}"
+        )
+    if response.status_code in retry_statuses:
+        raise RuntimeError(f"Could not get {url} after {retries + 1} attempts")
+    if response.status_code != 200:
+        raise RuntimeError(f"Error {response.status_code} from {url}")
+    return soupify(response.text)
 
 
 def get_post_json(
@@ -0,0 +1,4 @@
+-- Databases made before the leg version was added get the column here, as
+-- this is run again with the rest of the code whenever it changes
+ALTER TABLE Traveller
+ADD COLUMN IF NOT EXISTS leg_version INT NOT NULL DEFAULT 0;
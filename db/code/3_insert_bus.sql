@@ -41,8 +41,74 @@ BEGIN
 END;
 $$;
 
+-- Expects the stops to have been copied into a temporary BusStopStaging
+-- table of BusStopInData, and keeps the last of any repeated atco codes
+CREATE OR REPLACE FUNCTION InsertStagedBusStops ()
+RETURNS VOID
+LANGUAGE plpgsql
+AS
+$$
+BEGIN
+    INSERT INTO BusStop (
+        atco_code,
+        naptan_code,
+        stop_name,
+        landmark_name,
+        street_name,
+        crossing_name,
+        indicator,
+        bearing,
+        locality_name,
+        parent_locality_name,
+        grandparent_locality_name,
+        town_name,
+        suburb_name,
+        latitude,
+        longitude
+    ) SELECT DISTINCT ON (v_stop.atco_code)
+        v_stop.atco_code,
+        v_stop.naptan_code,
+        v_stop.stop_name,
+        v_stop.landmark_name,
+        v_stop.street_name,
+        v_stop.crossing_name,
+        v_stop.indicator,
+        v_stop.bearing,
+        v_stop.locality_name,
+        v_stop.parent_locality_name,
+        v_stop.grandparent_locality_name,
+        v_stop.town_name,
+        v_stop.suburb_name,
+        v_stop.latitude,
+        v_stop.longitude
+    FROM (
+        SELECT
+            ROW_NUMBER() OVER () AS row_number,
+            *
+        FROM BusStopStaging
+    ) AS v_stop
+    ORDER BY v_stop.atco_code, v_stop.row_number DESC
+    ON CONFLICT (atco_code) DO UPDATE SET
+        naptan_code = EXCLUDED.naptan_code,
+        stop_name = EXCLUDED.stop_name,
+        landmark_name = EXCLUDED.landmark_name,
+        street_name = EXCLUDED.street_name,
+        crossing_name = EXCLUDED.crossing_name,
+        indicator = EXCLUDED.indicator,
+        bearing = EXCLUDED.bearing,
+        locality_name = EXCLUDED.locality_name,
+        parent_locality_name = EXCLUDED.parent_locality_name,
+        grandparent_locality_name = EXCLUDED.grandparent_locality_name,
+        town_name = EXCLUDED.town_name,
+        suburb_name = EXCLUDED.suburb_name,
+        latitude = EXCLUDED.latitude,
+        longitude = EXCLUDED.longitude;
+END;
+$$;
+
 CREATE OR REPLACE FUNCTION InsertBusOperators (
-    p_operators BusOperatorInData[]
+    p_operators BusOperatorInData[],
+    p_replace BOOLEAN
 ) RETURNS VOID
 LANGUAGE plpgsql
 AS
@@ -55,12 +121,17 @@ BEGIN
         v_operator.operator_name,
         v_operator.national_operator_code
     FROM UNNEST(p_operators) AS v_operator
-    ON CONFLICT DO NOTHING;
+    -- A full import keeps the operator that is already there, but a refresh
+    -- renames it if its name has changed
+    ON CONFLICT (national_operator_code) DO UPDATE SET
+        operator_name = EXCLUDED.operator_name
+    WHERE p_replace;
 END;
 $$;
 
 CREATE OR REPLACE FUNCTION InsertBusServices (
-    p_services BusServiceInData[]
+    p_services BusServiceInData[],
+    p_replace BOOLEAN
 ) RETURNS VOID
 LANGUAGE plpgsql
 AS
@@ -72,7 +143,7 @@ BEGIN
         service_line,
         description_outbound,
         description_inbound
-    ) SELECT
+    ) SELECT DISTINCT ON (v_service.bods_line_id)
         (
             SELECT bus_operator_id
             FROM BusOperator
@@ -83,8 +154,16 @@ BEGIN
         v_service.service_line,
         v_service.service_outbound_description,
         v_service.service_inbound_description
-    FROM UNNEST(p_services) AS v_service
-    ON CONFLICT DO NOTHING;
+    FROM UNNEST(p_services) WITH ORDINALITY AS v_service
+    ORDER BY v_service.bods_line_id, v_service.ordinality
+    -- A full import keeps the service that is already there, but a refresh
+    -- replaces it with the one that has changed
+    ON CONFLICT (bods_line_id) DO UPDATE SET
+        bus_operator_id = EXCLUDED.bus_operator_id,
+        service_line = EXCLUDED.service_line,
+        description_outbound = EXCLUDED.description_outbound,
+        description_inbound = EXCLUDED.description_inbound
+    WHERE p_replace;
 END;
 $$;
 
@@ -114,13 +193,26 @@ $$;
 
 CREATE OR REPLACE FUNCTION InsertTransXChangeBusData (
     p_services BusServiceInData[],
-    p_vias BusServiceViaInData[]
+    p_vias BusServiceViaInData[],
+    p_replace BOOLEAN
 ) RETURNS VOID
 LANGUAGE plpgsql
 AS
 $$
 BEGIN
-    PERFORM InsertBusServices(p_services);
+    PERFORM InsertBusServices(p_services, p_replace);
+    IF p_replace THEN
+        -- Replace the vias of any services that were already there
+        DELETE FROM BusServiceVia
+        WHERE bus_service_id IN (
+            SELECT bus_service_id
+            FROM BusService
+            WHERE bods_line_id IN (
+                SELECT v_service.bods_line_id
+                FROM UNNEST(p_services) AS v_service
+            )
+        );
+    END IF;
     PERFORM InsertBusServiceVias(p_vias);
 END;
 $$;
@@ -147,17 +239,17 @@ AS
 $$
 BEGIN
     INSERT INTO BusVehicle (
-        operator_id,
-        vehicle_number,
+        bus_operator_id,
+        vehicle_identifier,
         bustimes_id,
         numberplate,
         bus_model_id,
         livery_style,
-        operator_name
+        vehicle_name
     )
     SELECT
         v_vehicle.operator_id,
-        v_vehicle.vehicle_number,
+        v_vehicle.vehicle_identifier,
         v_vehicle.bustimes_id,
         v_vehicle.vehicle_numberplate,
         (SELECT bus_model_id
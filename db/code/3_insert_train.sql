@@ -101,6 +101,10 @@ BEGIN
     VALUES (p_user_id, p_leg_distance)
     RETURNING leg_id INTO v_leg_id;
 
+    UPDATE Traveller
+    SET leg_version = leg_version + 1
+    WHERE user_id = p_user_id;
+
     INSERT INTO LegCall(leg_id, arr_call_id, dep_call_id, mileage, assoc_type)
         SELECT
             v_leg_id,
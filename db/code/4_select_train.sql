@@ -408,6 +408,22 @@ BEGIN
 END;
 $$;
 
+CREATE OR REPLACE FUNCTION SelectLegVersion(
+    p_user_id INTEGER
+)
+RETURNS INTEGER
+LANGUAGE plpgsql
+AS
+$$
+BEGIN
+    RETURN (
+        SELECT leg_version
+        FROM Traveller
+        WHERE user_id = p_user_id
+    );
+END;
+$$;
+
 CREATE OR REPLACE FUNCTION SelectLegs(
     p_user_id INTEGER,
     p_start_date TIMESTAMP WITH TIME ZONE DEFAULT NULL,
@@ -57,6 +57,7 @@ AS
 $$
 BEGIN
     DROP FUNCTION InsertBusStops;
+    DROP FUNCTION InsertStagedBusStops;
     DROP FUNCTION InsertBusOperators;
     DROP FUNCTION InsertBusServices;
     DROP FUNCTION InsertBusServiceVias;
@@ -2,5 +2,6 @@ CREATE TABLE Traveller (
     user_id SERIAL PRIMARY KEY,
     user_name TEXT NOT NULL,
     display_name TEXT NOT NULL,
-    hashed_password TEXT NOT NULL
+    hashed_password TEXT NOT NULL,
+    leg_version INT NOT NULL DEFAULT 0
 );
\ No newline at end of file